@@ -0,0 +1,170 @@
+"""Compare the two-call agent path with the combined decide-and-draft agent.
+
+Runs both paths against real threads from the database and the real model,
+and reports latency and token usage per email:
+
+    python -m benchmarks.bench_agent_modes --threads 20 --output modes.json
+
+The two-call path only runs the reply agent when the decision is auto_reply,
+exactly like the orchestrator does.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from agents import Runner
+
+from db.db import get_conn, init_db
+from orchestrator import build_thread_messages
+from subagents.combined import combined_agent
+from subagents.main_agent import main_agent
+from subagents.reply import reply_agent
+from subagents.schemas import AgentDecision, DecisionWithDraft
+
+
+def load_threads(limit: int):
+    # Every thread up to and including its latest incoming message, which is
+    # what the orchestrator would have sent to the agents.
+    with get_conn(readonly=True) as conn:
+        thread_ids = [
+            row[0]
+            for row in conn.execute(
+                """
+                SELECT thread_id
+                FROM email_events
+                WHERE direction = 'incoming'
+                GROUP BY thread_id
+                ORDER BY MAX(received_at) DESC
+                LIMIT ?
+                """,
+                (limit,),
+            )
+        ]
+        threads = []
+        for thread_id in thread_ids:
+            rows = conn.execute(
+                """
+                SELECT *
+                FROM email_events
+                WHERE thread_id = ?
+                  AND received_at <= (
+                      SELECT MAX(received_at)
+                      FROM email_events
+                      WHERE thread_id = ? AND direction = 'incoming'
+                  )
+                ORDER BY received_at
+                """,
+                (thread_id, thread_id),
+            ).fetchall()
+            threads.append(build_thread_messages(rows))
+    return threads
+
+
+def _usage(result):
+    usage = result.context_wrapper.usage
+    return usage.requests, usage.input_tokens, usage.output_tokens
+
+
+async def run_two_call(content: str):
+    start = time.perf_counter()
+    decision_result = await Runner.run(main_agent, input=content)
+    requests, input_tokens, output_tokens = _usage(decision_result)
+    decision = decision_result.final_output_as(AgentDecision)
+    if decision.action == "auto_reply":
+        draft_result = await Runner.run(reply_agent, input=content)
+        more = _usage(draft_result)
+        requests += more[0]
+        input_tokens += more[1]
+        output_tokens += more[2]
+    return {
+        "action": decision.action,
+        "latency": time.perf_counter() - start,
+        "requests": requests,
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+    }
+
+
+async def run_combined(content: str):
+    start = time.perf_counter()
+    result = await Runner.run(combined_agent, input=content)
+    requests, input_tokens, output_tokens = _usage(result)
+    return {
+        "action": result.final_output_as(DecisionWithDraft).decision.action,
+        "latency": time.perf_counter() - start,
+        "requests": requests,
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+    }
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))
+    return ordered[index]
+
+
+def summarize(samples):
+    latencies = [s["latency"] for s in samples]
+    return {
+        "emails": len(samples),
+        "auto_reply_rate": (
+            sum(s["action"] == "auto_reply" for s in samples) / len(samples)
+            if samples else 0.0
+        ),
+        "latency_mean": statistics.fmean(latencies) if latencies else 0.0,
+        "latency_p50": percentile(latencies, 50),
+        "latency_p95": percentile(latencies, 95),
+        "requests_per_email": statistics.fmean(s["requests"] for s in samples) if samples else 0.0,
+        "input_tokens_per_email": statistics.fmean(s["input_tokens"] for s in samples) if samples else 0.0,
+        "output_tokens_per_email": statistics.fmean(s["output_tokens"] for s in samples) if samples else 0.0,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--output", help="write the summary as JSON to this file")
+    args = parser.parse_args()
+
+    init_db()
+    threads = load_threads(args.threads)
+    print(f"📚 Benchmarking {len(threads)} threads x {args.repeat}")
+
+    samples = {"two_call": [], "combined": []}
+    for _ in range(args.repeat):
+        for i, thread_messages in enumerate(threads):
+            content = json.dumps({"thread_messages": thread_messages}, ensure_ascii=False)
+            # Alternate the order so neither path benefits from a warm connection.
+            if i % 2:
+                samples["combined"].append(await run_combined(content))
+                samples["two_call"].append(await run_two_call(content))
+            else:
+                samples["two_call"].append(await run_two_call(content))
+                samples["combined"].append(await run_combined(content))
+
+    summary = {}
+    for mode, mode_samples in samples.items():
+        summary[mode] = summarize(mode_samples)
+        # Only auto-replies can save a call; show them separately.
+        summary[f"{mode}:auto_reply"] = summarize(
+            [s for s in mode_samples if s["action"] == "auto_reply"]
+        )
+
+    for name, stats in summary.items():
+        print(f"\n{name}")
+        for key, value in stats.items():
+            print(f"  {key:<24} {value:.3f}" if isinstance(value, float) else f"  {key:<24} {value}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,134 @@
+"""Token reduction from cleaning email bodies at ingest.
+
+    python -m benchmarks.bench_body_clean --db db/email.db
+
+For every thread in the database (opened read-only), plus synthetic threads
+in which each email quotes the whole conversation below it, this rebuilds
+the agent input the orchestrator sends for each incoming email (the thread
+up to that email, as build_thread_messages renders it) once with the raw
+bodies and once with the bodies body_clean.clean_body stores. Tokens are
+counted with tiktoken when it is installed, else estimated at 4 characters
+per token. Also reports the cleaning cost per email.
+"""
+import argparse
+import json
+import sqlite3
+import time
+from collections import defaultdict
+
+from body_clean import clean_body
+from db.db import DB_PATH
+
+try:
+    import tiktoken
+
+    _encoding = tiktoken.get_encoding("o200k_base")
+
+    def count_tokens(text: str) -> int:
+        return len(_encoding.encode(text))
+
+    TOKENIZER = "tiktoken o200k_base"
+except ImportError:
+    def count_tokens(text: str) -> int:
+        return len(text) // 4
+
+    TOKENIZER = "estimate (4 chars/token)"
+
+
+def load_threads(db_path) -> dict[str, list[dict]]:
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro&immutable=1", uri=True)
+    conn.row_factory = sqlite3.Row
+    threads = defaultdict(list)
+    try:
+        for row in conn.execute(
+            "SELECT thread_id, direction, from_email, body FROM email_events ORDER BY received_at, id"
+        ):
+            threads[row["thread_id"]].append(dict(row))
+    finally:
+        conn.close()
+    return threads
+
+
+def synthetic_thread(depth: int) -> list[dict]:
+    """A thread in which every email quotes the one before it, history and all.
+
+    Customer emails are stored as received. Our replies are stored as
+    sender_loop stores them, without the quotes.
+    """
+    messages = []
+    previous = None  # (sender, full text as the other side received it)
+    for i in range(depth):
+        incoming = i % 2 == 0
+        sender = "customer@example.com" if incoming else "support@aiguru360.in"
+        text = f"Message {i}: " + (
+            "Where is my order? It was due last week.\n\nBest regards,\nJane" if incoming
+            else "We are checking with the courier and will update you.\n\nBest regards,\nSupport"
+        )
+        full = text
+        if previous is not None:
+            quoted = "\n".join("> " + line for line in previous[1].split("\n"))
+            full += f"\n\nOn Mon, 6 Jan 2025 at 10:{i:02d}, <{previous[0]}> wrote:\n{quoted}"
+        messages.append({
+            "direction": "incoming" if incoming else "outgoing",
+            "from_email": sender,
+            "body": full if incoming else text,
+        })
+        previous = (sender, full)
+    return messages
+
+
+def agent_inputs(thread: list[dict], clean: bool) -> list[str]:
+    """The input sent for each incoming email of the thread, as the orchestrator builds it."""
+    rendered = []
+    inputs = []
+    for msg in thread:
+        incoming = msg["direction"] == "incoming"
+        # Only ingested (incoming) emails are cleaned; our own replies are stored as sent.
+        body = clean_body(msg["body"]) if clean and incoming else msg["body"]
+        rendered.append({"role": "user" if incoming else "assistant", "from": msg["from_email"], "body": body})
+        if incoming:
+            inputs.append(json.dumps({"thread_messages": rendered}, ensure_ascii=False))
+    return inputs
+
+
+def tokens(thread: list[dict], clean: bool) -> int:
+    return sum(count_tokens(content) for content in agent_inputs(thread, clean))
+
+
+def report(name: str, threads: list[list[dict]]):
+    raw = sum(tokens(thread, clean=False) for thread in threads)
+    clean = sum(tokens(thread, clean=True) for thread in threads)
+    emails = sum(1 for thread in threads for msg in thread if msg["direction"] == "incoming")
+    if not emails:
+        print(f"{name}: no incoming emails")
+        return
+    print(f"{name}: {len(threads)} threads, {emails} incoming emails")
+    print(f"  raw     : {raw:10d} tokens ({raw / emails:8.1f}/email)")
+    print(f"  cleaned : {clean:10d} tokens ({clean / emails:8.1f}/email, {1 - clean / raw:.1%} fewer)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default=str(DB_PATH))
+    parser.add_argument("--depths", default="5,10,20,40", help="synthetic thread depths")
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"Tokens: {TOKENIZER}")
+    threads = list(load_threads(args.db).values())
+    report("Database", threads)
+    for depth in (int(d) for d in args.depths.split(",") if d):
+        report(f"Synthetic, depth {depth}", [synthetic_thread(depth)])
+
+    bodies = [msg["body"] for thread in threads for msg in thread if msg["body"]]
+    if bodies:
+        start = time.perf_counter()
+        for _ in range(args.rounds):
+            for body in bodies:
+                clean_body(body)
+        elapsed = time.perf_counter() - start
+        print(f"Cleaning: {elapsed / (len(bodies) * args.rounds) * 1e6:.1f} µs/email")
+
+
+if __name__ == "__main__":
+    main()
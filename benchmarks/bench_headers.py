@@ -0,0 +1,136 @@
+"""Compare the header scanner with the previous ingestion parsing path.
+
+    python -m benchmarks.bench_headers --db db/email.db --rounds 200
+
+The corpus is every raw_headers block in the given database (opened
+read-only), plus synthetic long-thread blocks with folded References lines.
+The legacy path is the one the worker used before: email.parser.Parser over
+the whole block, a print per header key, and the regex fallbacks. Both paths
+must agree on In-Reply-To and References for every block. Also reports how
+much each HEADER_STORAGE mode stores.
+"""
+import argparse
+import contextlib
+import io
+import re
+import sqlite3
+import time
+import zlib
+from email.parser import Parser
+
+from db.db import DB_PATH
+from header_scan import STORED_HEADERS, minimal_headers, threading_headers
+
+
+def legacy_parse(raw_headers):
+    msg = Parser().parsestr(raw_headers)
+
+    print("HEADERS FOUND:")
+    for key in msg.keys():
+        print(f" - {key}")
+
+    print("References value:", msg.get("References"))
+    print("In-Reply-To value:", msg.get("In-Reply-To"))
+
+    in_reply_to = msg.get("In-Reply-To")
+    references = []
+    for header_value in msg.get_all("References", []):
+        references.extend(header_value.strip().split())
+
+    if not in_reply_to:
+        match = re.search(r"In-Reply-To:\s*(<[^>]+>)", raw_headers, re.IGNORECASE)
+        in_reply_to = match.group(1) if match else None
+    if not references:
+        match = re.search(r"References:\s*(.+)", raw_headers, re.IGNORECASE)
+        if match:
+            references = re.findall(r"<[^>]+>", match.group(1))
+    return in_reply_to, references
+
+
+def synthetic_block(depth: int) -> str:
+    ids = [f"<msg-{i}.{depth}@mail.example.com>" for i in range(depth)]
+    references = "\r\n\t".join(" ".join(ids[i:i + 3]) for i in range(0, len(ids), 3))
+    return (
+        "Received: from mail.example.com (mail.example.com [192.0.2.1])\r\n"
+        "\tby mx.example.net with ESMTPS id abc123\r\n"
+        "\tfor <support@aiguru360.in>; Mon, 6 Jan 2025 10:00:00 +0000\r\n"
+        f"DKIM-Signature: v=1; a=rsa-sha256; d=example.com; s=sel;\r\n\tb={'A' * 300}\r\n"
+        "From: Customer <customer@example.com>\r\n"
+        "To: support@aiguru360.in\r\n"
+        f"Subject: Re: Order {depth}\r\n"
+        f"Message-ID: <msg-{depth}.{depth}@mail.example.com>\r\n"
+        f"In-Reply-To: {ids[-1]}\r\n"
+        f"References: {references}\r\n"
+        "Content-Type: text/plain; charset=utf-8\r\n"
+    )
+
+
+def load_corpus(db_path, synthetic: int) -> list[str]:
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro&immutable=1", uri=True)
+    try:
+        corpus = [
+            raw for (raw,) in conn.execute(
+                "SELECT raw_headers FROM email_events WHERE raw_headers IS NOT NULL"
+            )
+            if isinstance(raw, str)
+        ]
+    finally:
+        conn.close()
+    corpus += [synthetic_block(depth) for depth in range(1, synthetic + 1)]
+    return corpus
+
+
+def timed(parse, corpus, rounds) -> float:
+    sink = io.StringIO()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(sink):
+        for _ in range(rounds):
+            for raw in corpus:
+                parse(raw)
+            sink.seek(0)
+            sink.truncate()
+    return time.perf_counter() - start
+
+
+def normalized(result):
+    in_reply_to, references = result
+    return (in_reply_to or "").strip() or None, references
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default=str(DB_PATH))
+    parser.add_argument("--synthetic", type=int, default=40, help="synthetic thread depths to add")
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.db, args.synthetic)
+    if not corpus:
+        raise SystemExit("No header blocks to benchmark")
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        mismatches = [
+            raw for raw in corpus
+            if normalized(legacy_parse(raw)) != normalized(threading_headers(raw))
+        ]
+
+    legacy = timed(legacy_parse, corpus, args.rounds)
+    scanner = timed(threading_headers, corpus, args.rounds)
+    parses = len(corpus) * args.rounds
+
+    print(f"Corpus: {len(corpus)} header blocks, {args.rounds} rounds")
+    print(f"  legacy  : {legacy / parses * 1e6:8.1f} µs/block")
+    print(f"  scanner : {scanner / parses * 1e6:8.1f} µs/block ({legacy / scanner:.1f}x)")
+    print(f"  mismatches: {len(mismatches)}")
+
+    full = sum(len(raw.encode("utf-8")) for raw in corpus)
+    minimal = sum(len((minimal_headers(raw, STORED_HEADERS) or "").encode("utf-8")) for raw in corpus)
+    compressed = sum(len(zlib.compress(raw.encode("utf-8"))) for raw in corpus)
+    print("Stored header bytes per HEADER_STORAGE mode:")
+    print(f"  full       : {full:10d}")
+    print(f"  minimal    : {minimal:10d} ({minimal / full:.1%})")
+    print(f"  compressed : {compressed:10d} ({compressed / full:.1%})")
+
+
+if __name__ == "__main__":
+    main()
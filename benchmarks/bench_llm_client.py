@@ -0,0 +1,93 @@
+"""Per-call overhead of the shared LLM client vs. a new client per call.
+
+    python -m benchmarks.bench_llm_client                 # against the OpenAI API
+    python -m benchmarks.bench_llm_client --local --calls 500 --concurrency 16
+
+Each call is a models.list() request, which costs no tokens, so what is
+measured is the HTTP overhead an agent call pays on top of the model's own
+latency: DNS, TCP and TLS setup for a fresh client, a pooled keep-alive
+connection for the shared one (subagents/llm_client.py, warmed first as the
+orchestrator does). --local runs against a plain-HTTP stub instead, which
+shows the connection counts but not the TLS cost.
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks.bench_pipeline import percentiles, use_env
+
+
+async def timed_calls(call, calls: int, concurrency: int) -> list[float]:
+    semaphore = asyncio.Semaphore(concurrency)
+    samples = []
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            await call()
+            samples.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one() for _ in range(calls)))
+    return samples
+
+
+async def run(args, stub=None) -> dict:
+    from openai import AsyncOpenAI
+
+    from subagents import llm_client
+
+    async def fresh():
+        client = AsyncOpenAI(max_retries=0)
+        try:
+            await client.models.list()
+        finally:
+            await client.close()
+
+    shared = llm_client.build_client()
+
+    async def pooled():
+        await shared.models.list()
+
+    # Warm the shared pool the way the orchestrator does at startup.
+    await asyncio.gather(*(shared.models.list() for _ in range(args.concurrency)))
+
+    results = {}
+    for name, call in (("fresh", fresh), ("shared", pooled)):
+        opened = stub.connections if stub else 0
+        samples = await timed_calls(call, args.calls, args.concurrency)
+        results[name] = {k: v if k == "n" else round(v * 1000, 2) for k, v in percentiles(samples).items()}
+        if stub:
+            results[name]["connections"] = stub.connections - opened
+    await shared.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--local", action="store_true", help="use a local stub instead of the API")
+    parser.add_argument("--latency", type=float, default=0.0, help="stub response time (s)")
+    args = parser.parse_args()
+
+    stub = None
+    if args.local:
+        from benchmarks.stubs import StubServer
+
+        stub = StubServer(latency=args.latency, body={"object": "list", "data": []}).start()
+        use_env({"OPENAI_BASE_URL": stub.url + "/v1", "OPENAI_API_KEY": "bench"})
+
+    results = asyncio.run(run(args, stub))
+
+    print(f"calls: {args.calls}  concurrency: {args.concurrency}  ({'local stub' if stub else 'OpenAI API'})")
+    for name, stats in results.items():
+        line = f"{name:<8} p50 {stats['p50']:>8} ms   p95 {stats['p95']:>8} ms   p99 {stats['p99']:>8} ms"
+        if "connections" in stats:
+            line += f"   connections {stats['connections']}"
+        print(line)
+    if stub is not None:
+        stub.stop()
+
+
+if __name__ == "__main__":
+    main()
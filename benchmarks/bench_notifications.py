@@ -0,0 +1,53 @@
+"""Exercise the notification dispatcher against a local Pushover stand-in.
+
+    python -m benchmarks.bench_notifications --emails 500
+
+Simulates a backlog where every email produces several notification lines,
+and reports how many HTTP requests and connections that turned into, plus
+the notifier's own counters.
+"""
+import argparse
+import time
+
+from benchmarks.stubs import StubServer
+from notifications import Notifier
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--emails", type=int, default=500)
+    parser.add_argument("--lines", type=int, default=4, help="notification lines per email")
+    parser.add_argument("--latency", type=float, default=0.02, help="stand-in response time (s)")
+    parser.add_argument("--queue-size", type=int, default=200)
+    parser.add_argument("--digest-interval", type=float, default=0.5)
+    args = parser.parse_args()
+
+    with StubServer(latency=args.latency) as stub:
+        notifier = Notifier(
+            url=stub.url + "/1/messages.json",
+            token="token",
+            user="user",
+            queue_size=args.queue_size,
+            digest_interval=args.digest_interval,
+        )
+
+        start = time.perf_counter()
+        for i in range(args.emails):
+            key = f"<{i}@bench>"
+            for line in range(args.lines):
+                notifier.add(key, f"email {i}: line {line}")
+            notifier.flush(key)
+        notifier.wait_idle(timeout=60)
+        elapsed = time.perf_counter() - start
+
+        print(f"emails:          {args.emails}")
+        print(f"lines:           {args.emails * args.lines}")
+        print(f"http requests:   {len(stub.requests)}")
+        print(f"tcp connections: {stub.connections}")
+        print(f"elapsed:         {elapsed:.2f}s")
+        for name, value in notifier.stats().items():
+            print(f"{name + ':':<17}{value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,430 @@
+"""End-to-end throughput of ingestion -> orchestrator -> sender.
+
+    python -m benchmarks.bench_pipeline                      # all scenarios
+    python -m benchmarks.bench_pipeline --scenario burst_ingest --scale 0.2
+    python -m benchmarks.bench_pipeline --save-baseline      # record a new baseline
+
+Every scenario runs in a fresh process against its own scratch database
+(EMAIL_DB_PATH). The ingestion worker runs in that process and is fed by a
+fake Pub/Sub publisher; orchestrator and sender replicas run as separate
+processes, exactly as deployed, with agents.Runner replaced by a stand-in
+(benchmarks/fakes.py) and SendGrid/Pushover by local stubs.
+
+Reported per scenario: emails/sec, p50/p95/p99 of each stage (ingest =
+received -> stored, process = stored -> processed, send = processed -> sent,
+end_to_end = received -> sent) and SQLite write-lock contention scraped from
+every process's metrics. Results are compared with the stored baseline;
+a throughput drop or p95 increase beyond --tolerance is reported as a
+regression and makes the run exit non-zero.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import datetime
+from pathlib import Path
+
+BASELINE_PATH = Path(__file__).parent / "baselines" / "pipeline.json"
+
+SCENARIOS = {
+    # Many new conversations arriving at once.
+    "burst_ingest": dict(threads=500, depth=1, orchestrators=1, senders=1,
+                         auto_reply_rate=0.5, approve_rate=0.5),
+    # Few conversations with many replies each (thread resolution, coalescing).
+    "long_threads": dict(threads=20, depth=25, orchestrators=1, senders=1,
+                         auto_reply_rate=0.5, approve_rate=0.5),
+    # Nearly everything is answered automatically, so the sender is loaded.
+    "high_auto_approve": dict(threads=300, depth=1, orchestrators=1, senders=1,
+                              auto_reply_rate=0.95, approve_rate=0.95),
+    # Several orchestrator and sender replicas sharing one database.
+    "multi_replica": dict(threads=500, depth=1, orchestrators=3, senders=2,
+                          auto_reply_rate=0.8, approve_rate=0.8),
+}
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentiles(values: list[float]) -> dict:
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "n": 0}
+    values = sorted(values)
+
+    def rank(q):
+        return values[min(len(values) - 1, max(0, int(round(q * len(values))) - 1))]
+
+    return {"p50": rank(0.50), "p95": rank(0.95), "p99": rank(0.99), "n": len(values)}
+
+
+def parse_metrics(text: str) -> dict:
+    """`name{labels}` -> value for every sample in a Prometheus text page."""
+    samples = {}
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        name, _, value = line.rpartition(" ")
+        samples[name] = float(value)
+    return samples
+
+
+def lock_contention(pages: list[str]) -> dict:
+    waits = 0
+    total = 0.0
+    busy = 0
+    buckets = {}
+    for page in pages:
+        samples = parse_metrics(page)
+        waits += samples.get("db_write_lock_wait_seconds_count", 0)
+        total += samples.get("db_write_lock_wait_seconds_sum", 0)
+        busy += samples.get("db_busy_errors_total", 0)
+        for name, value in samples.items():
+            if name.startswith("db_write_lock_wait_seconds_bucket"):
+                le = name.split('le="')[1].rstrip('"}')
+                buckets[le] = buckets.get(le, 0) + value
+
+    p99 = None
+    if waits:
+        for le, count in sorted(buckets.items(), key=lambda item: float(item[0])):
+            if count >= 0.99 * waits:
+                p99 = float(le)
+                break
+    return {
+        "write_transactions": int(waits),
+        "wait_seconds_total": round(total, 4),
+        "wait_p99_bucket": p99,
+        "busy_errors": int(busy),
+    }
+
+
+def use_env(env: dict):
+    """Point this process at the benchmark's settings.
+
+    The services call load_dotenv(override=True) on import, which would let
+    a developer's .env (real API hosts and keys) win over the stand-ins.
+    """
+    import dotenv
+
+    dotenv.load_dotenv = lambda *args, **kwargs: False
+    os.environ.update(env)
+
+
+# -- replica processes ---------------------------------------------------
+
+def run_orchestrator(env: dict, runner_options: dict):
+    use_env(env)
+    import asyncio
+
+    from benchmarks.fakes import StubRunner
+    from subagents import runner
+
+    runner.set_runner(StubRunner(**runner_options))
+    import orchestrator
+
+    asyncio.run(orchestrator.main())
+
+
+def run_sender(env: dict):
+    use_env(env)
+    import sender_loop
+
+    sender_loop.sender_loop()
+
+
+# -- scenario ------------------------------------------------------------
+
+def emails_for(spec: dict):
+    """Payloads in publishing rounds: round i holds the i-th email of every thread."""
+    for depth in range(spec["depth"]):
+        round_ = []
+        for thread in range(spec["threads"]):
+            ids = [f"<t{thread}.m{i}@bench.example.com>" for i in range(depth + 1)]
+            headers = [
+                f"Message-ID: {ids[-1]}",
+                f"From: customer{thread}@example.com",
+                "To: support@aiguru360.in",
+                f"Subject: {'Re: ' if depth else ''}Order {thread}",
+            ]
+            if depth:
+                headers.append(f"In-Reply-To: {ids[-2]}")
+                headers.append("References: " + "\r\n ".join(ids[:-1]))
+            round_.append({
+                "message_id": ids[-1],
+                "from": f"customer{thread}@example.com",
+                "to": "support@aiguru360.in",
+                "subject": f"{'Re: ' if depth else ''}Order {thread}",
+                "text": f"Message {depth} about order {thread}. Where is my package?",
+                "raw_headers": "\r\n".join(headers) + "\r\n",
+            })
+        yield round_
+
+
+def stage_latencies(conn) -> dict:
+    def seconds(start, end):
+        if not start or not end:
+            return None
+        return (datetime.fromisoformat(end) - datetime.fromisoformat(start)).total_seconds()
+
+    events = conn.execute(
+        """
+        SELECT received_at, created_at, processed_at
+        FROM email_events
+        WHERE direction = 'incoming'
+        """
+    ).fetchall()
+    sends = conn.execute(
+        """
+        SELECT e.received_at, e.processed_at, o.sent_at
+        FROM outgoing_emails AS o
+        JOIN email_drafts AS d ON d.id = o.draft_id
+        JOIN email_events AS e ON e.message_id = d.message_id
+        """
+    ).fetchall()
+
+    def collect(rows, start, end):
+        return [v for v in (seconds(row[start], row[end]) for row in rows) if v is not None]
+
+    return {
+        "ingest": percentiles(collect(events, 0, 1)),
+        "process": percentiles(collect(events, 1, 2)),
+        "send": percentiles(collect(sends, 1, 2)),
+        "end_to_end": percentiles(collect(sends, 0, 2)),
+    }
+
+
+def run_scenario(name: str, spec: dict, options: dict, results):
+    workdir = Path(tempfile.mkdtemp(prefix=f"bench-{name}-"))
+    env = {
+        "EMAIL_DB_PATH": str(workdir / "email.db"),
+        "LLM_CACHE_ENABLED": "0",
+        "LOG_LEVEL": "WARNING",
+        "LLM_WARM_CONNECTIONS": "0",
+        "ORCHESTRATOR_WORKERS": str(options["workers"]),
+        "SENDGRID_API_KEY": "bench",
+        "SENDGRID_RATE_PER_SECOND": "1000",
+        "PUSHOVER_TOKEN": "bench",
+        "PUSHOVER_USER": "bench",
+    }
+    use_env(env)
+
+    from benchmarks.stubs import StubServer
+
+    sendgrid = StubServer(status=202, latency=options["sendgrid_latency"], body=b"").start()
+    pushover = StubServer().start()
+    env["SENDGRID_API_HOST"] = sendgrid.url
+    env["PUSHOVER_URL"] = pushover.url + "/1/messages.json"
+    os.environ.update(env)
+
+    # Imported only now: the services read their configuration at import.
+    import metrics
+    import worker
+    from benchmarks.fakes import FakePublisher, now_iso, wait_until
+    from db.db import get_conn
+
+    worker.start()
+
+    ctx = multiprocessing.get_context("spawn")
+    runner_options = {
+        "latency": options["agent_latency"],
+        "auto_reply_rate": spec["auto_reply_rate"],
+        "approve_rate": spec["approve_rate"],
+    }
+    ports = []
+    processes = []
+    for i in range(spec["orchestrators"]):
+        port = free_port()
+        ports.append(port)
+        processes.append(ctx.Process(
+            target=run_orchestrator,
+            args=({**env, "METRICS_PORT": str(port), "ORCHESTRATOR_ID": f"bench-orchestrator-{i}"}, runner_options),
+            daemon=True,
+        ))
+    for i in range(spec["senders"]):
+        port = free_port()
+        ports.append(port)
+        processes.append(ctx.Process(
+            target=run_sender,
+            args=({**env, "METRICS_PORT": str(port), "SENDER_ID": f"bench-sender-{i}"},),
+            daemon=True,
+        ))
+    for process in processes:
+        process.start()
+
+    def scrape(port):
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as response:
+                return response.read().decode("utf-8")
+        except OSError:
+            return None
+
+    wait_until(lambda: all(scrape(port) is not None for port in ports), timeout=60)
+
+    publisher = FakePublisher(worker.callback)
+    total = spec["threads"] * spec["depth"]
+
+    def counts():
+        with get_conn(readonly=True) as conn:
+            return conn.execute(
+                """
+                SELECT
+                    (SELECT COUNT(*) FROM email_events WHERE direction = 'incoming'),
+                    (SELECT COUNT(*) FROM email_events WHERE processed = 0),
+                    (SELECT COUNT(*) FROM email_drafts
+                     WHERE status IN ('approved', 'sending', 'retry_scheduled'))
+                """
+            ).fetchone()
+
+    start = time.perf_counter()
+    published = 0
+    for round_ in emails_for(spec):
+        for payload in round_:
+            payload["received_at"] = now_iso()
+            publisher.publish(payload)
+        published += len(round_)
+        if spec["depth"] > 1:
+            # Replies must find their parent: let the round be stored first.
+            wait_until(lambda: counts()[0] >= published, timeout=options["timeout"])
+
+    def done():
+        stored, unprocessed, outbox = counts()
+        return stored >= total and unprocessed == 0 and outbox == 0
+
+    finished = wait_until(done, timeout=options["timeout"], interval=0.05)
+    elapsed = time.perf_counter() - start
+
+    pages = [page for page in (scrape(port) for port in ports) if page] + [metrics.render()]
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.join(timeout=10)
+    publisher.close()
+    sendgrid.stop()
+    pushover.stop()
+
+    with get_conn(readonly=True) as conn:
+        latencies = stage_latencies(conn)
+        decisions = conn.execute("SELECT COUNT(*) FROM email_decisions").fetchone()[0]
+        sent = conn.execute("SELECT COUNT(*) FROM outgoing_emails").fetchone()[0]
+        pending = conn.execute(
+            "SELECT COUNT(*) FROM email_drafts WHERE status = 'pending'"
+        ).fetchone()[0]
+
+    results.put({
+        "scenario": name,
+        "finished": finished,
+        "emails": total,
+        "elapsed_seconds": round(elapsed, 3),
+        "emails_per_second": round(total / elapsed, 2),
+        "decisions": decisions,
+        "sent": sent,
+        "pending_review": pending,
+        "stages": latencies,
+        "sqlite": lock_contention(pages),
+    })
+
+
+# -- reporting -----------------------------------------------------------
+
+def fmt(value) -> str:
+    return "    -   " if value is None else f"{value * 1000:8.1f}"
+
+
+def report(result: dict):
+    print(f"\n== {result['scenario']} ==" + ("" if result["finished"] else "  (TIMED OUT)"))
+    print(f"  {result['emails']} emails in {result['elapsed_seconds']:.2f}s "
+          f"= {result['emails_per_second']:.1f} emails/s")
+    print(f"  decisions {result['decisions']}, sent {result['sent']}, "
+          f"pending review {result['pending_review']}")
+    print("  stage (ms)        p50      p95      p99")
+    for stage, values in result["stages"].items():
+        print(f"  {stage:<12} {fmt(values['p50'])} {fmt(values['p95'])} {fmt(values['p99'])}")
+    sqlite = result["sqlite"]
+    print(f"  sqlite: {sqlite['write_transactions']} write transactions, "
+          f"{sqlite['wait_seconds_total']:.3f}s waiting for the lock, "
+          f"p99 wait <= {sqlite['wait_p99_bucket']}s, {sqlite['busy_errors']} busy errors")
+
+
+def regressions(result: dict, baseline: dict, tolerance: float) -> list[str]:
+    problems = []
+    if result["emails_per_second"] < baseline["emails_per_second"] * (1 - tolerance):
+        problems.append(
+            f"throughput {result['emails_per_second']:.1f}/s vs baseline {baseline['emails_per_second']:.1f}/s"
+        )
+    for stage, values in result["stages"].items():
+        before = baseline.get("stages", {}).get(stage, {}).get("p95")
+        if values["p95"] is not None and before and values["p95"] > before * (1 + tolerance):
+            problems.append(f"{stage} p95 {values['p95'] * 1000:.1f}ms vs baseline {before * 1000:.1f}ms")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="run only this scenario (repeatable)")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply the number of threads")
+    parser.add_argument("--workers", type=int, default=4, help="ORCHESTRATOR_WORKERS per replica")
+    parser.add_argument("--agent-latency", type=float, default=0.2, help="stand-in LLM latency (s)")
+    parser.add_argument("--sendgrid-latency", type=float, default=0.05, help="mock SendGrid latency (s)")
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression (fraction)")
+    args = parser.parse_args()
+
+    options = {
+        "workers": args.workers,
+        "agent_latency": args.agent_latency,
+        "sendgrid_latency": args.sendgrid_latency,
+        "timeout": args.timeout,
+    }
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+    for name in args.scenario or list(SCENARIOS):
+        spec = dict(SCENARIOS[name])
+        spec["threads"] = max(1, int(spec["threads"] * args.scale))
+        queue = ctx.Queue()
+        process = ctx.Process(target=run_scenario, args=(name, spec, options, queue))
+        process.start()
+        result = queue.get()
+        process.join()
+        result["config"] = {**spec, **options}
+        report(result)
+        results.append(result)
+
+    if args.save_baseline:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+        baseline.update({result["scenario"]: result for result in results})
+        args.baseline.write_text(json.dumps(baseline, indent=2) + "\n")
+        print(f"\nBaseline written to {args.baseline}")
+        return
+
+    if not args.baseline.exists():
+        print(f"\nNo baseline at {args.baseline}; run with --save-baseline to create one.")
+        return
+
+    baseline = json.loads(args.baseline.read_text())
+    failed = False
+    for result in results:
+        before = baseline.get(result["scenario"])
+        if before is None:
+            continue
+        if before.get("config") != result["config"]:
+            print(f"\n{result['scenario']}: configuration differs from the baseline, not compared")
+            continue
+        problems = regressions(result, before, args.tolerance)
+        for problem in problems:
+            print(f"\nREGRESSION {result['scenario']}: {problem}")
+        failed = failed or bool(problems) or not result["finished"]
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
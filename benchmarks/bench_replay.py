@@ -0,0 +1,194 @@
+"""Load-test the orchestrator offline from recorded agent calls.
+
+    python -m benchmarks.bench_replay --mode record --emails 200    # once, real model
+    python -m benchmarks.bench_replay --emails 200                  # replay at recorded latency
+    python -m benchmarks.bench_replay --emails 200 --latency-scale 0 --workers 16
+
+The workload is the newest --emails incoming emails of a copy of the
+database (--source), reset to unprocessed with their decisions and drafts
+removed. The orchestrator then works through them with agents.Runner behind
+a cassette (subagents/cassette.py): in record mode the real model answers
+and every call is written to --cassette; in replay mode the recording is
+served back, sleeping for the recorded latency times --latency-scale.
+
+Calls only replay if their input is byte-identical to the recording, so
+record and replay with the same --source, --emails and orchestrator
+settings (AGENT_MODE, COALESCE_THREADS, ...). A change to a prompt or the
+way threads are rendered shows up as misses, which are counted.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+from benchmarks.bench_pipeline import percentiles, use_env
+
+
+def copy_database(source: Path, target: Path):
+    src = sqlite3.connect(f"file:{source}?mode=ro", uri=True)
+    dst = sqlite3.connect(target)
+    src.backup(dst)
+    src.close()
+    dst.close()
+
+
+def reset_workload(conn, emails: int) -> list[str]:
+    """Make the newest `emails` incoming emails unprocessed again."""
+    ids = [row[0] for row in conn.execute(
+        """
+        SELECT message_id
+        FROM email_events
+        WHERE direction = 'incoming'
+        ORDER BY received_at DESC, id DESC
+        LIMIT ?
+        """,
+        (emails,),
+    )]
+    marks = ",".join("?" * len(ids))
+    conn.execute(
+        f"""
+        DELETE FROM outgoing_emails
+        WHERE draft_id IN (SELECT id FROM email_drafts WHERE message_id IN ({marks}))
+        """,
+        ids,
+    )
+    conn.execute(f"DELETE FROM email_drafts WHERE message_id IN ({marks})", ids)
+    conn.execute(f"DELETE FROM email_decisions WHERE message_id IN ({marks})", ids)
+    conn.execute(
+        f"""
+        UPDATE email_events
+        SET processed = 0, processed_at = NULL, claimed_by = NULL,
+            lease_expires_at = NULL, superseded_by = NULL, process_attempts = 0
+        WHERE message_id IN ({marks})
+        """,
+        ids,
+    )
+    return ids
+
+
+async def run_until_drained(orchestrator, timeout: float) -> bool:
+    from db.db import get_conn
+    from db.events import count_unprocessed
+    from subagents import runner
+
+    stats = getattr(runner._runner, "stats", {})
+
+    task = asyncio.create_task(orchestrator.main())
+    deadline = time.monotonic() + timeout
+    try:
+        while time.monotonic() < deadline:
+            await asyncio.sleep(0.2)
+            if task.done():
+                task.result()
+            with get_conn(readonly=True) as conn:
+                if count_unprocessed(conn) == 0:
+                    return True
+            if stats.get("misses"):
+                # A missed email only fails again on retry; the run can't finish.
+                return False
+        return False
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mode", choices=["record", "replay"], default="replay")
+    parser.add_argument("--source", type=Path, default=Path(__file__).parent.parent / "db" / "email.db")
+    parser.add_argument("--cassette", type=Path, default=Path(__file__).parent.parent / "cassettes" / "agents.jsonl")
+    parser.add_argument("--emails", type=int, default=100)
+    parser.add_argument("--latency-scale", type=float, default=1.0)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--output", help="write the summary as JSON to this file")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="bench-replay-"))
+    db_path = workdir / "email.db"
+    copy_database(args.source, db_path)
+
+    env = {
+        "EMAIL_DB_PATH": str(db_path),
+        "CASSETTE_MODE": args.mode,
+        "CASSETTE_PATH": str(args.cassette),
+        "CASSETTE_LATENCY_SCALE": str(args.latency_scale),
+        "LLM_CACHE_ENABLED": "0",
+        "LOG_LEVEL": "WARNING",
+        "METRICS_PORT": "0",
+        "ORCHESTRATOR_WORKERS": str(args.workers),
+        "PUSHOVER_TOKEN": "bench",
+        "PUSHOVER_USER": "bench",
+    }
+    if args.mode == "record":
+        # Recording needs the real API key from .env.
+        import dotenv
+
+        dotenv.load_dotenv(override=True)
+        os.environ.update(env)
+    else:
+        # Offline: don't reach out to the API, even to warm up.
+        use_env({**env, "LLM_WARM_CONNECTIONS": "0"})
+
+    from benchmarks.stubs import StubServer
+
+    pushover = StubServer().start()
+    os.environ["PUSHOVER_URL"] = pushover.url + "/1/messages.json"
+
+    # Imported only now: the services read their configuration at import.
+    import orchestrator
+    from db.db import get_conn, init_db
+    from subagents import runner
+
+    # Migrate the copy first; older databases lack the lease columns.
+    init_db()
+    with get_conn() as conn:
+        ids = reset_workload(conn, args.emails)
+    marks = ",".join("?" * len(ids))
+
+    print(f"📼 {args.mode.capitalize()}ing {len(ids)} emails ({args.cassette})")
+    started_at = time.time()
+    start = time.perf_counter()
+    drained = asyncio.run(run_until_drained(orchestrator, args.timeout))
+    elapsed = time.perf_counter() - start
+
+    with get_conn(readonly=True) as conn:
+        processed = conn.execute(
+            f"SELECT processed_at FROM email_events WHERE message_id IN ({marks})", ids
+        ).fetchall()
+        actions = dict(conn.execute(
+            f"SELECT action, COUNT(*) FROM email_decisions WHERE message_id IN ({marks}) GROUP BY action",
+            ids,
+        ).fetchall())
+
+    # The whole workload is claimable from the start, so an email's latency
+    # is the time from the start of the run until it was processed.
+    summary = {
+        "mode": args.mode,
+        "emails": len(ids),
+        "drained": drained,
+        "seconds": round(elapsed, 3),
+        "emails_per_second": round(len(ids) / elapsed, 2) if elapsed else None,
+        "completed_after": percentiles([
+            datetime.fromisoformat(row["processed_at"]).timestamp() - started_at
+            for row in processed if row["processed_at"]
+        ]),
+        "decisions": actions,
+        "cassette": getattr(runner._runner, "stats", None),
+    }
+    pushover.stop()
+
+    print(json.dumps(summary, indent=2))
+    if not drained:
+        print("⚠️ Backlog not drained (timeout or cassette misses)")
+    if args.output:
+        Path(args.output).write_text(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
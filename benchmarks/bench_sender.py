@@ -0,0 +1,72 @@
+"""Measure outbound send throughput against a local SendGrid mock.
+
+    python -m benchmarks.bench_sender --messages 500 --concurrency 8 --latency 0.05
+
+Sends through send_email_tool.send_email exactly as sender_loop does, with
+the mock standing in for api.sendgrid.com. --throttle-every N makes every
+Nth request return 429 to exercise the rate limiter's back-off.
+"""
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.05, help="mock response time (s)")
+    parser.add_argument("--rate", type=float, default=1000, help="rate limit (sends/s)")
+    parser.add_argument("--throttle-every", type=int, default=0)
+    args = parser.parse_args()
+
+    from benchmarks.stubs import StubServer
+
+    counter = {"n": 0}
+    lock = threading.Lock()
+
+    def responder(record):
+        with lock:
+            counter["n"] += 1
+            n = counter["n"]
+        if args.throttle_every and n % args.throttle_every == 0:
+            return 429, {"Retry-After": "1"}, b'{"errors": [{"message": "rate limited"}]}'
+        return 202, {}, b""
+
+    with StubServer(responder=responder, latency=args.latency) as stub:
+        # send_email_tool reads its configuration at import time.
+        os.environ["SENDGRID_API_HOST"] = stub.url
+        os.environ["SENDGRID_API_KEY"] = "bench"
+        os.environ["SENDER_CONCURRENCY"] = str(args.concurrency)
+        os.environ["SENDGRID_RATE_PER_SECOND"] = str(args.rate)
+        import send_email_tool
+
+        def send(i):
+            send_email_tool.send_email(
+                to_email=f"customer{i}@example.com",
+                subject="Re: bench",
+                body="Thanks for your message.",
+                in_reply_to=f"<{i}@example.com>",
+                references=[f"<{i}@example.com>"],
+            )
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            list(executor.map(send, range(args.messages)))
+        elapsed = time.perf_counter() - start
+
+        throttled = len(stub.requests) // args.throttle_every if args.throttle_every else 0
+
+    print(f"messages:        {args.messages}")
+    print(f"concurrency:     {args.concurrency}")
+    print(f"elapsed:         {elapsed:.2f}s")
+    print(f"throughput:      {args.messages / elapsed:.1f} msg/s")
+    print(f"http requests:   {len(stub.requests)}")
+    print(f"tcp connections: {stub.connections}")
+    print(f"429 responses:   {throttled}")
+
+
+if __name__ == "__main__":
+    main()
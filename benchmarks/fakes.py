@@ -0,0 +1,161 @@
+"""In-process stand-ins for Pub/Sub and the agents SDK.
+
+    publisher = FakePublisher(worker.callback, threads=10)
+    publisher.publish({"message_id": "<1@bench>", ...})
+
+    runner.set_runner(StubRunner(latency=0.2, auto_reply_rate=0.8))
+
+FakePublisher delivers payloads to a subscriber callback from a thread
+pool, like the Pub/Sub client does, and redelivers nacked messages.
+StubRunner answers every agent with a canned, schema-valid output after a
+configurable delay; answers are derived from a hash of the input, so a
+given email always gets the same decision.
+"""
+import asyncio
+import hashlib
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from subagents.schemas import AgentDecision, ClassificationResult, DecisionWithDraft, DraftReply
+
+
+class FakeMessage:
+    def __init__(self, publisher: "FakePublisher", payload: dict):
+        self.publisher = publisher
+        self.payload = payload
+        self.data = json.dumps(payload).encode("utf-8")
+        self.size = len(self.data)
+
+    def ack(self):
+        self.publisher._settled(self, acked=True)
+
+    def nack(self):
+        self.publisher._settled(self, acked=False)
+
+
+class FakePublisher:
+    def __init__(self, callback, threads: int = 10, redeliver_after: float = 0.1):
+        self.callback = callback
+        self.redeliver_after = redeliver_after
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="pubsub")
+        self.published = 0
+        self.acked = 0
+        self.nacked = 0
+        self._lock = threading.Lock()
+
+    def publish(self, payload: dict):
+        with self._lock:
+            self.published += 1
+        self.executor.submit(self.callback, FakeMessage(self, payload))
+
+    def _settled(self, message: FakeMessage, acked: bool):
+        with self._lock:
+            if acked:
+                self.acked += 1
+            else:
+                self.nacked += 1
+        if not acked:
+            timer = threading.Timer(
+                self.redeliver_after,
+                lambda: self.executor.submit(self.callback, FakeMessage(self, message.payload)),
+            )
+            timer.daemon = True
+            timer.start()
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class StubResult:
+    def __init__(self, output, input_tokens: int, output_tokens: int):
+        self.final_output = output
+        self.context_wrapper = SimpleNamespace(
+            usage=SimpleNamespace(input_tokens=input_tokens, output_tokens=output_tokens)
+        )
+
+    def final_output_as(self, cls):
+        return self.final_output
+
+
+class StubRunner:
+    """Drop-in for agents.Runner with a fixed latency and canned outputs.
+
+    `auto_reply_rate` of the emails get an auto_reply decision (the rest are
+    escalated), and `approve_rate` of the drafts are confident enough to be
+    auto-approved.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.2,
+        jitter: float = 0.5,
+        auto_reply_rate: float = 0.8,
+        approve_rate: float = 0.8,
+        output_tokens: int = 150,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.auto_reply_rate = auto_reply_rate
+        self.approve_rate = approve_rate
+        self.output_tokens = output_tokens
+        self.calls = 0
+
+    def _rng(self, content: str) -> random.Random:
+        seed = hashlib.sha256(content.encode("utf-8")).digest()[:8]
+        return random.Random(int.from_bytes(seed, "big"))
+
+    def _decision(self, rng):
+        auto_reply = rng.random() < self.auto_reply_rate
+        return AgentDecision(
+            action="auto_reply" if auto_reply else "escalate",
+            intent="support",
+            confidence=0.9,
+            reason="Benchmark stand-in decision.",
+        )
+
+    def _draft(self, rng):
+        return DraftReply(
+            subject=None,
+            body="Thanks for reaching out, we are looking into it.",
+            confidence=0.9 if rng.random() < self.approve_rate else 0.1,
+        )
+
+    def _output(self, agent, content: str):
+        # Separate streams, so the decision and the draft are independent.
+        decision_rng = self._rng("decision:" + content)
+        draft_rng = self._rng("draft:" + content)
+        if agent.name == "MainEmailAgent":
+            return self._decision(decision_rng)
+        if agent.name == "ReplyAgent":
+            return self._draft(draft_rng)
+        if agent.name == "DecideAndDraftAgent":
+            decision = self._decision(decision_rng)
+            draft = self._draft(draft_rng) if decision.action == "auto_reply" else None
+            return DecisionWithDraft(decision=decision, draft=draft)
+        if agent.name == "ClassifierAgent":
+            return ClassificationResult(intent="support", confidence=0.9)
+        raise ValueError(f"No stand-in output for agent {agent.name}")
+
+    async def run(self, agent, input: str, **kwargs):
+        self.calls += 1
+        delay = self.latency * random.uniform(1 - self.jitter, 1 + self.jitter)
+        await asyncio.sleep(max(0.0, delay))
+        return StubResult(self._output(agent, input), len(input) // 4, self.output_tokens)
+
+
+def now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def wait_until(predicate, timeout: float, interval: float = 0.1) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(interval)
+    return predicate()
@@ -0,0 +1,110 @@
+"""Local HTTP stand-ins for the outside services (Pushover, SendGrid).
+
+    with StubServer(status=202, latency=0.05) as stub:
+        requests.post(stub.url + "/v3/mail/send", json={...})
+        stub.requests      # every request received
+        stub.connections   # TCP connections opened, to check pooling
+
+`responder`, if given, decides each response: it receives the request record
+and returns (status, headers, body) or None for the defaults.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubServer:
+    def __init__(
+        self,
+        status: int = 200,
+        latency: float = 0.0,
+        body: bytes = b'{"status": 1}',
+        headers: dict | None = None,
+        responder=None,
+    ):
+        self.status = status
+        self.latency = latency
+        self.body = body
+        self.headers = headers or {"Content-Type": "application/json"}
+        self.responder = responder
+
+        self.requests = []
+        self.connections = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive, so clients can reuse connections.
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                with stub._lock:
+                    stub.connections += 1
+
+            def log_message(self, format, *args):
+                pass
+
+            def _handle(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                record = {
+                    "method": self.command,
+                    "path": self.path,
+                    "headers": dict(self.headers),
+                    "body": self.rfile.read(length),
+                    "at": time.monotonic(),
+                }
+                with stub._lock:
+                    stub.requests.append(record)
+
+                if stub.latency:
+                    time.sleep(stub.latency)
+
+                status, headers, body = stub.status, stub.headers, stub.body
+                if stub.responder is not None:
+                    response = stub.responder(record)
+                    if response is not None:
+                        status, headers, body = response
+                if isinstance(body, (dict, list)):
+                    body = json.dumps(body).encode()
+
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_GET = _handle
+            do_POST = _handle
+
+        return Handler
+
+    def start(self) -> "StubServer":
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
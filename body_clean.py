@@ -0,0 +1,140 @@
+"""Strip quoted history, signatures and disclaimers from email bodies.
+
+Replies usually carry the whole earlier conversation below the new text,
+and the orchestrator sends every message of the thread to the model, so the
+input grows with the square of the thread length. The earlier messages are
+in the thread already; only the new text is kept:
+
+    clean_body("Thanks!\n\nOn Tue, 24 Feb 2026, <a@b.c> wrote:\n> Hi ...")
+    -> "Thanks!"
+
+Cut at the first reply or forward header ("On ... wrote:", "-----Original
+Message-----", an Outlook From:/Sent: block), drop remaining "> " lines,
+then cut the signature ("-- ", "Sent from my ...", a closing "Best regards"
+followed only by signature-like lines) and trailing legal disclaimers. If nothing is left (a bare
+forward, say) the original text is returned instead.
+"""
+import re
+
+# A line that starts the quoted or forwarded part; everything from it on goes.
+_QUOTE_HEADERS = [
+    re.compile(r"^-{2,}\s*(original message|forwarded message)\s*-{2,}\s*$", re.IGNORECASE),
+    re.compile(r"^begin forwarded message:\s*$", re.IGNORECASE),
+    re.compile(r"^_{10,}\s*$"),
+]
+# "On <date>, <someone> wrote:" and its translations; clients wrap it, so it
+# is matched over up to three joined lines (see _wrote_header).
+_WROTE_START = re.compile(r"^(on|le|am|el|il|op)\s", re.IGNORECASE)
+_WROTE = re.compile(
+    _WROTE_START.pattern + r".{0,300}(wrote|a écrit|schrieb|escribió|ha scritto|schreef)\s?:\s*$",
+    re.IGNORECASE,
+)
+# A line ending like a sentence: a wrapped header line never does.
+_SENTENCE_END = re.compile(r"[.!?]$")
+# Outlook: a From: line followed closely by Sent:/Date: and To:/Subject:.
+_OUTLOOK_FROM = re.compile(r"^\*?from:\*?\s", re.IGNORECASE)
+_OUTLOOK_FIELDS = re.compile(r"^\*?(sent|date|to|subject|cc):\*?\s", re.IGNORECASE)
+
+_SIGNATURE_DELIMITER = re.compile(r"^--\s?$")
+_MOBILE_SIGNATURE = re.compile(r"^(sent from my|sent from|get outlook for)\s.{0,40}$", re.IGNORECASE)
+_SIGN_OFF = re.compile(
+    r"^((best|kind|warm|many)\s+)?(regards|wishes|thanks)[,!.]?$|^(thanks|thank you|cheers|sincerely|best)[,!.]?$",
+    re.IGNORECASE,
+)
+# Lines a sign-off may be followed by: name, title, company, phone.
+SIGN_OFF_TAIL_LINES = 5
+# Each of them short and not a sentence (a word ending in ".", "!" or "?";
+# "Inc." and "Ltd." are fine). Only contact details may start lowercase.
+SIGNATURE_LINE_WORDS = 6
+_SENTENCE = re.compile(r"[a-z]{4,}[.!?](\s|$)|[!?]")
+_CONTACT = re.compile(r"@|^(https?://|www\.)", re.IGNORECASE)
+
+_DISCLAIMER = re.compile(
+    r"(this (e-?mail|message|communication).{0,80}(confidential|privileged)|^\s*disclaimer\s*:"
+    r"|intended (solely )?for the (use of the )?(addressee|named recipient|intended recipient)"
+    r"|if you (are not|have received this).{0,60}(intended recipient|in error))",
+    re.IGNORECASE,
+)
+
+
+def _wrote_header(lines: list[str], i: int) -> bool:
+    """Whether an "On ... wrote:" header starts at line i and ends within three lines."""
+    for size in (1, 2, 3):
+        window = [l.strip() for l in lines[i:i + size]]
+        if len(window) < size or not window[-1]:
+            return False
+        if size > 1 and (
+            # Wrapped header lines are never sentences, and a later line
+            # starting a header of its own means this one is the customer's.
+            _SENTENCE_END.search(window[-2])
+            or _WROTE_START.match(window[-1])
+        ):
+            return False
+        if _WROTE.match(" ".join(window)):
+            return True
+    return False
+
+
+def _quote_start(lines: list[str]) -> int | None:
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        if any(pattern.match(stripped) for pattern in _QUOTE_HEADERS):
+            return i
+        if _WROTE_START.match(stripped) and _wrote_header(lines, i):
+            return i
+        if _OUTLOOK_FROM.match(stripped):
+            following = [l.strip() for l in lines[i + 1:i + 5]]
+            if sum(1 for l in following if _OUTLOOK_FIELDS.match(l)) >= 2:
+                return i
+    return None
+
+
+def _signature_start(lines: list[str]) -> int | None:
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        if _SIGNATURE_DELIMITER.match(line.rstrip("\n")) or _MOBILE_SIGNATURE.match(stripped):
+            return i
+    # A closing formula, only when nothing but a name and contact details follow.
+    for i in range(max(0, len(lines) - SIGN_OFF_TAIL_LINES - 1), len(lines)):
+        if _SIGN_OFF.match(lines[i].strip()) and i > 0 and all(map(_signature_line, lines[i + 1:])):
+            return i
+    return None
+
+
+def _signature_line(line: str) -> bool:
+    line = line.strip()
+    if not line:
+        return True
+    if len(line.split()) > SIGNATURE_LINE_WORDS or _SENTENCE.search(line):
+        return False
+    return not line[0].islower() or bool(_CONTACT.search(line))
+
+
+def _disclaimer_start(lines: list[str]) -> int | None:
+    # Only in the second half, and from the start of its paragraph.
+    for i in range(len(lines) // 2, len(lines)):
+        if _DISCLAIMER.search(lines[i]):
+            while i > 0 and lines[i - 1].strip():
+                i -= 1
+            return i
+    return None
+
+
+def clean_body(text: str | None) -> str | None:
+    """The new text of an email body, without quotes, signature or disclaimer."""
+    if not text:
+        return text
+    lines = text.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+
+    cut = _quote_start(lines)
+    if cut is not None:
+        lines = lines[:cut]
+    lines = [line for line in lines if not line.lstrip().startswith(">")]
+
+    for find in (_disclaimer_start, _signature_start):
+        cut = find(lines)
+        if cut is not None:
+            lines = lines[:cut]
+
+    cleaned = re.sub(r"\n{3,}", "\n\n", "\n".join(line.rstrip() for line in lines)).strip()
+    return cleaned or text.strip()
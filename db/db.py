@@ -1,16 +1,186 @@
+import atexit
+import os
+import queue
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager
 from pathlib import Path
 from datetime import datetime, timezone
 
+import metrics
+
 # Define the path to the SQLite database file.
-# It's located in the same directory as this script and named "email.db".
-DB_PATH = Path(__file__).parent / "email.db"
+# It's located in the same directory as this script and named "email.db";
+# EMAIL_DB_PATH points the services at another file (benchmarks, scratch runs).
+DB_PATH = Path(os.environ.get("EMAIL_DB_PATH", Path(__file__).parent / "email.db"))
+
+# Maximum number of open connections per process.
+POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "8"))
+
+# How long a writer waits for another container's write lock before failing.
+BUSY_TIMEOUT_MS = int(os.environ.get("DB_BUSY_TIMEOUT_MS", "5000"))
+
+# Applied to every new connection. WAL lets the ingestion worker, the
+# orchestrator and the sender read while one of them writes, and
+# synchronous=NORMAL is durable in WAL mode apart from the last commits
+# before a power loss.
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -65536",      # 64 MiB page cache
+    "PRAGMA mmap_size = 268435456",    # 256 MiB memory-mapped I/O
+    "PRAGMA temp_store = MEMORY",
+    f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}",
+)
+
+
+# Time spent in BEGIN IMMEDIATE, i.e. waiting for another writer to finish.
+WRITE_LOCK_WAIT = metrics.Histogram(
+    "db_write_lock_wait_seconds", "Time write transactions waited for the SQLite write lock."
+)
+BUSY_ERRORS = metrics.Counter(
+    "db_busy_errors_total", "Write transactions that gave up after busy_timeout."
+)
+
+
+class ConnectionPool:
+    """A small, thread-safe pool of long-lived SQLite connections.
+
+    Connections are opened lazily, up to `size`, and reused afterwards.
+    Callers block while all of them are borrowed.
+    """
+
+    def __init__(self, path: Path, size: int):
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._all = []
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        self.path.parent.mkdir(exist_ok=True)
+        # Transactions are opened explicitly by get_conn(), so the sqlite3
+        # module must not start any on its own.
+        conn = sqlite3.connect(
+            self.path,
+            timeout=BUSY_TIMEOUT_MS / 1000,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        # Rows behave like tuples but can also be read by column name.
+        conn.row_factory = sqlite3.Row
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        with self._lock:
+            self._all.append(conn)
+        return conn
+
+    def acquire(self):
+        self._slots.acquire()
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            try:
+                return self._connect()
+            except BaseException:
+                self._slots.release()
+                raise
+
+    def release(self, conn):
+        self._idle.put(conn)
+        self._slots.release()
+
+    def discard(self, conn):
+        """Close a connection that is not fit for reuse instead of releasing it."""
+        with self._lock:
+            if conn in self._all:
+                self._all.remove(conn)
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        self._slots.release()
+
+    def close(self):
+        with self._lock:
+            conns, self._all = self._all, []
+        for conn in conns:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+
+_pool = None
+_pool_key = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    global _pool, _pool_key
+    # Rebuilt after a fork (connections must not cross processes) or when
+    # DB_PATH is pointed somewhere else.
+    key = (os.getpid(), DB_PATH)
+    with _pool_lock:
+        if _pool_key != key:
+            _pool = ConnectionPool(DB_PATH, POOL_SIZE)
+            _pool_key = key
+        return _pool
 
 
-def get_conn():
- # Ensure the parent directory for the database exists.
-    DB_PATH.parent.mkdir(exist_ok=True)
-    return sqlite3.connect(DB_PATH)
+@atexit.register
+def close_pool():
+    with _pool_lock:
+        if _pool is not None and _pool_key[0] == os.getpid():
+            _pool.close()
+
+
+@contextmanager
+def get_conn(readonly: bool = False):
+    """Borrow a pooled connection and run the block as one transaction.
+
+    Write transactions start with BEGIN IMMEDIATE so they queue on the write
+    lock (up to busy_timeout) instead of failing when a read is upgraded.
+    The transaction commits when the block exits and rolls back on error,
+    including a failed COMMIT. A connection whose transaction could not be
+    ended is closed rather than returned to the pool, where every later
+    BEGIN on it would fail.
+    """
+    pool = get_pool()
+    conn = pool.acquire()
+    try:
+        if readonly:
+            conn.execute("BEGIN")
+        else:
+            start = time.perf_counter()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+            except sqlite3.OperationalError:
+                BUSY_ERRORS.inc()
+                raise
+            WRITE_LOCK_WAIT.observe(time.perf_counter() - start)
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            try:
+                conn.rollback()
+            except sqlite3.Error:
+                pass
+            raise
+    finally:
+        if conn.in_transaction:
+            pool.discard(conn)
+        else:
+            pool.release(conn)
+
+
+def ensure_column(conn, table: str, column: str, definition: str):
+    columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    if column not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
 
 
 def init_db():
@@ -34,15 +204,34 @@ def init_db():
             to_email TEXT,
             subject TEXT,
             body TEXT,
+            body_clean TEXT,              -- body without quotes/signature (body_clean.py)
             raw_headers TEXT,
 
             received_at TEXT NOT NULL,
             created_at TEXT NOT NULL,
             processed INTEGER DEFAULT 0,
-            processed_at TEXT
+            processed_at TEXT,
+
+            -- Orchestrator lease (see db.events.claim_emails)
+            claimed_by TEXT,
+            lease_expires_at TEXT,
+
+            -- Set when a newer email of the thread was processed in its place
+            superseded_by TEXT,
+
+            -- Failed processing runs (see db.events.release_claim)
+            process_attempts INTEGER NOT NULL DEFAULT 0
         );
         """)
 
+        # Columns added after the first release; older databases need them
+        # added in place.
+        ensure_column(conn, "email_events", "claimed_by", "TEXT")
+        ensure_column(conn, "email_events", "lease_expires_at", "TEXT")
+        ensure_column(conn, "email_events", "superseded_by", "TEXT")
+        ensure_column(conn, "email_events", "body_clean", "TEXT")
+        ensure_column(conn, "email_events", "process_attempts", "INTEGER NOT NULL DEFAULT 0")
+
  # Create the email_decisions table if it doesn't already exist.
         conn.execute("""
         CREATE TABLE IF NOT EXISTS email_decisions (
@@ -80,9 +269,24 @@ def init_db():
                 reviewed_at TEXT,
                 reviewer_note TEXT,
 
-                created_at TEXT NOT NULL
+                created_at TEXT NOT NULL,
+
+                -- Outbox (see db.drafts.claim_sendable_drafts):
+                -- approved -> sending -> sent | retry_scheduled | dead
+                send_attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at TEXT,
+                send_lease_owner TEXT,
+                send_lease_expires_at TEXT,
+                outgoing_message_id TEXT,
+                last_error TEXT
             );
         """)
+        ensure_column(conn, "email_drafts", "send_attempts", "INTEGER NOT NULL DEFAULT 0")
+        ensure_column(conn, "email_drafts", "next_attempt_at", "TEXT")
+        ensure_column(conn, "email_drafts", "send_lease_owner", "TEXT")
+        ensure_column(conn, "email_drafts", "send_lease_expires_at", "TEXT")
+        ensure_column(conn, "email_drafts", "outgoing_message_id", "TEXT")
+        ensure_column(conn, "email_drafts", "last_error", "TEXT")
 
  # Create the outgoing_emails table if it doesn't already exist.
         conn.execute("""
@@ -105,7 +309,73 @@ def init_db():
             );
         """)
 
-        
-        
+        # Agent outputs keyed on a hash of their full input (subagents/cache.py).
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                agent_name TEXT NOT NULL,
+                output TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                last_used_at TEXT NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            );
+        """)
+
+        create_indexes(conn)
+
+
+# Secondary indexes for the queries every service runs on each poll. Without
+# them each of these is a full table scan that grows with email_events.
+# db/query_plans.py checks that each hot query uses the index meant for it.
+INDEXES = (
+    # Orchestrator claim: oldest unprocessed email overall.
+    """
+    CREATE INDEX IF NOT EXISTS idx_email_events_unprocessed
+    ON email_events (received_at, id)
+    WHERE processed = 0
+    """,
+    # Orchestrator mark_processed: the unprocessed emails of a thread up to
+    # the one just handled.
+    """
+    CREATE INDEX IF NOT EXISTS idx_email_events_unprocessed_thread
+    ON email_events (thread_id, received_at, id)
+    WHERE processed = 0
+    """,
+    # Everything of one thread: fetch_thread, the claim's "is another email
+    # of this thread waiting or leased?" and the sender's latest incoming
+    # message. Threads are short, so filtering their rows is cheap.
+    """
+    CREATE INDEX IF NOT EXISTS idx_email_events_thread
+    ON email_events (thread_id, received_at)
+    """,
+    # Orchestrator speculation policy: past decisions of a thread.
+    """
+    CREATE INDEX IF NOT EXISTS idx_email_decisions_thread
+    ON email_decisions (thread_id, action)
+    """,
+    # LLM cache LRU eviction.
+    """
+    CREATE INDEX IF NOT EXISTS idx_llm_cache_last_used
+    ON llm_cache (last_used_at)
+    """,
+    # Review API: drafts by status.
+    """
+    CREATE INDEX IF NOT EXISTS idx_email_drafts_status
+    ON email_drafts (status, created_at)
+    """,
+)
+
+# Indexes of earlier releases that the planner never chose over the ones
+# above (without ANALYZE statistics it prefers the plain thread and status
+# indexes) but that every write still had to maintain.
+OBSOLETE_INDEXES = (
+    "idx_email_events_thread_incoming",
+    "idx_email_drafts_outbox",
+)
+
 
-        
+def create_indexes(conn):
+    for statement in INDEXES:
+        conn.execute(statement)
+    for name in OBSOLETE_INDEXES:
+        conn.execute(f"DROP INDEX IF EXISTS {name}")
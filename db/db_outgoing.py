@@ -1,3 +1,5 @@
+import json
+from dataclasses import dataclass
 from datetime import datetime, timezone
 from db.db import get_conn
 
@@ -12,33 +14,107 @@ def persist_outgoing_email(
     provider: str,
     provider_message_id: str | None,
     status: str,
+    conn=None,
 ):
-    with get_conn() as conn:
+    # Join the caller's transaction when given one.
+    if conn is None:
+        with get_conn() as conn:
+            return persist_outgoing_email(
+                draft_id=draft_id,
+                thread_id=thread_id,
+                to_email=to_email,
+                subject=subject,
+                body=body,
+                provider=provider,
+                provider_message_id=provider_message_id,
+                status=status,
+                conn=conn,
+            )
+
  # Insert the outgoing email details. 'INSERT OR IGNORE' prevents duplicates based on UNIQUE constraints.
-        conn.execute(
+    conn.execute(
+        """
+        INSERT OR IGNORE INTO outgoing_emails (
+            draft_id,
+            thread_id,
+            to_email,
+            subject,
+            body,
+            sent_at,
+            provider,
+            provider_message_id,
+            status
+        )
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        (
+            draft_id,
+            thread_id,
+            to_email,
+            subject,
+            body,
+            datetime.now(timezone.utc).isoformat(),
+            provider,
+            provider_message_id,
+            status,
+        ),
+    )
+
+
+@dataclass
+class ReplyContext:
+    to_email: str | None
+    in_reply_to: str | None
+    references: list[str]
+    subject: str
+
+
+# Resolve, for every thread in `thread_ids`, who to reply to and which headers
+# to thread the reply with, based on the thread's latest incoming message.
+# One set-based query covers all threads of a sender poll cycle.
+def fetch_reply_contexts(thread_ids) -> dict[str, ReplyContext]:
+    thread_ids = list(dict.fromkeys(thread_ids))
+    if not thread_ids:
+        return {}
+
+    with get_conn(readonly=True) as conn:
+        rows = conn.execute(
             """
-            INSERT OR IGNORE INTO outgoing_emails (
-                draft_id,
-                thread_id,
-                to_email,
-                subject,
-                body,
-                sent_at,
-                provider,
-                provider_message_id,
-                status
-            )
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            SELECT
+                e.thread_id,
+                e.message_id,
+                e.references_ids,
+                e.from_email,
+                e.subject
+            FROM json_each(?) AS t
+            JOIN email_events AS e
+              ON e.id = (
+                  SELECT latest.id
+                  FROM email_events AS latest
+                  WHERE latest.thread_id = t.value
+                    AND latest.direction = 'incoming'
+                  ORDER BY latest.received_at DESC
+                  LIMIT 1
+              )
             """,
-            (
-                draft_id,
-                thread_id,
-                to_email,
-                subject,
-                body,
-                datetime.now(timezone.utc).isoformat(),
-                provider,
-                provider_message_id,
-                status,
-            ),
+            (json.dumps(thread_ids),),
+        ).fetchall()
+
+    contexts = {}
+    for thread_id, message_id, refs, from_email, subject in rows:
+        references = json.loads(refs or "[]")
+        # The reply references the whole chain, ending with the message it
+        # answers.
+        if message_id:
+            references.append(message_id)
+        if not subject:
+            subject = "Re: Your message"
+        elif not subject.lower().startswith("re:"):
+            subject = f"Re: {subject}"
+        contexts[thread_id] = ReplyContext(
+            to_email=from_email,
+            in_reply_to=message_id,
+            references=references,
+            subject=subject,
         )
+    return contexts
@@ -30,3 +30,16 @@ def persist_decision(
             decision.reason,
             datetime.now(timezone.utc).isoformat()
         ))
+
+
+# Function to count past decisions for a thread: (total, auto_replies).
+def fetch_thread_decision_counts(thread_id: str) -> tuple[int, int]:
+    with get_conn(readonly=True) as conn:
+        row = conn.execute("""
+            SELECT
+                COUNT(*),
+                COALESCE(SUM(action = 'auto_reply'), 0)
+            FROM email_decisions
+            WHERE thread_id = ?
+        """, (thread_id,)).fetchone()
+    return row[0], row[1]
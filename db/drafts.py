@@ -1,5 +1,7 @@
-from datetime import datetime, timezone
+import random
+from datetime import datetime, timedelta, timezone
 from db.db import get_conn
+import wakeup
 
 # Function to persist a new email draft into the database.
 def persist_draft(
@@ -13,10 +15,10 @@ def persist_draft(
     model: str,
 ):
     with get_conn() as conn:
- # Insert the draft details. 'INSERT OR IGNORE' prevents duplicates based on UNIQUE constraints.
-        cursor = conn.execute(
+ # Insert the draft details. A retried email already has its draft (message_id is UNIQUE); keep that one.
+        row = conn.execute(
             """
-            INSERT OR IGNORE INTO email_drafts (
+            INSERT INTO email_drafts (
                 message_id,
                 thread_id,
                 subject,
@@ -27,6 +29,8 @@ def persist_draft(
                 created_at
             )
             VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(message_id) DO NOTHING
+            RETURNING id
             """,
             (
                 message_id,
@@ -38,13 +42,20 @@ def persist_draft(
                 model,
                 datetime.now(timezone.utc).isoformat(),
             ),
-        )
- # Return the ID of the newly inserted row.
-        return cursor.lastrowid
+        ).fetchone()
+        if row is None:
+            # Not cursor.lastrowid: on a pooled connection that is whatever
+            # this connection inserted last, not the existing draft.
+            row = conn.execute(
+                "SELECT id FROM email_drafts WHERE message_id = ?",
+                (message_id,),
+            ).fetchone()
+ # Return the ID of the draft for this email.
+        return row[0]
 
 
 def fetch_pending_drafts():
-    with get_conn() as conn:
+    with get_conn(readonly=True) as conn:
         return conn.execute(
             """
             SELECT
@@ -79,6 +90,7 @@ def approve_draft(draft_id: int, reviewed_by: str):
             """,
             (reviewed_by, datetime.now(timezone.utc).isoformat(), draft_id),
         )
+    wakeup.signal(wakeup.SENDER)
 
 # Function to reject a pending email draft.
 def reject_draft(
@@ -135,27 +147,177 @@ def edit_and_approve_draft(
                 draft_id,
             ),
         )
+    wakeup.signal(wakeup.SENDER)
 
 
-# Function to fetch all approved email drafts.
-def fetch_approved_drafts():
+# Atomically claim up to `limit` drafts that are due to be sent, for `owner`.
+#
+# Outbox states: approved -> sending -> sent | retry_scheduled | dead.
+# A claimed draft is 'sending' under a lease; if the sender dies mid-send the
+# lease expires and another sender picks it up. Each draft gets its
+# Message-ID on the first claim and keeps it across retries, so a resend
+# after an unclear failure is recognisable as the same email.
+def claim_sendable_drafts(owner: str, limit: int, lease_seconds: int):
+    now = datetime.now(timezone.utc)
     with get_conn() as conn:
         return conn.execute(
             """
-            SELECT
+            UPDATE email_drafts
+            SET status = 'sending',
+                send_lease_owner = :owner,
+                send_lease_expires_at = :expires_at,
+                send_attempts = send_attempts + 1,
+                outgoing_message_id = COALESCE(
+                    outgoing_message_id,
+                    '<' || lower(hex(randomblob(16))) || '@aiguru360.in>'
+                )
+            WHERE id IN (
+                SELECT id
+                FROM email_drafts
+                WHERE status = 'approved'
+                   OR (status = 'retry_scheduled' AND next_attempt_at <= :now)
+                   OR (status = 'sending' AND send_lease_expires_at <= :now)
+                LIMIT :limit
+            )
+            RETURNING
                 id,
                 thread_id,
                 subject,
-                body
+                body,
+                message_id,
+                outgoing_message_id,
+                send_attempts
+            """,
+            {
+                "owner": owner,
+                "now": now.isoformat(),
+                "expires_at": (now + timedelta(seconds=lease_seconds)).isoformat(),
+                "limit": limit,
+            },
+        ).fetchall()
+
+
+# Extend the send leases of the drafts `owner` is sending right now. Only the
+# given ids: other drafts still leased to `owner` were left by a run that
+# died and must be allowed to expire.
+def renew_send_leases(owner: str, draft_ids, lease_seconds: int):
+    draft_ids = list(draft_ids)
+    if not draft_ids:
+        return
+    expires_at = datetime.now(timezone.utc) + timedelta(seconds=lease_seconds)
+    placeholders = ", ".join("?" * len(draft_ids))
+    with get_conn() as conn:
+        conn.execute(
+            f"""
+            UPDATE email_drafts
+            SET send_lease_expires_at = ?
+            WHERE send_lease_owner = ?
+              AND status = 'sending'
+              AND id IN ({placeholders})
+            """,
+            (expires_at.isoformat(), owner, *draft_ids),
+        )
+
+
+# Function to mark a claimed draft as sent, inside the caller's transaction.
+# Returns False if `owner` no longer holds the draft's lease (it expired and
+# another sender claimed it); the caller must not record the send then.
+def mark_draft_sent(conn, draft_id: int, owner: str) -> bool:
+    cursor = conn.execute(
+        """
+        UPDATE email_drafts
+        SET status = 'sent',
+            send_lease_owner = NULL,
+            send_lease_expires_at = NULL,
+            next_attempt_at = NULL,
+            last_error = NULL
+        WHERE id = ?
+          AND status = 'sending'
+          AND send_lease_owner = ?
+        """,
+        (draft_id, owner)
+    )
+    return cursor.rowcount == 1
+
+
+# Function to record a failed send: retry later with exponential backoff, or
+# give up ('dead') once the attempts are used up or the error is permanent.
+# Returns the new status, or None if `owner` no longer holds the lease.
+def record_send_failure(
+    draft_id: int,
+    owner: str,
+    attempts: int,
+    error: str,
+    *,
+    max_attempts: int,
+    base_delay: float,
+    max_delay: float,
+    permanent: bool = False,
+) -> str:
+    now = datetime.now(timezone.utc)
+    if permanent or attempts >= max_attempts:
+        status = "dead"
+        next_attempt_at = None
+    else:
+        status = "retry_scheduled"
+        delay = min(max_delay, base_delay * 2 ** (attempts - 1))
+        # Jitter so drafts that failed together don't retry together.
+        delay *= random.uniform(0.5, 1.0)
+        next_attempt_at = (now + timedelta(seconds=delay)).isoformat()
+
+    with get_conn() as conn:
+        cursor = conn.execute(
+            """
+            UPDATE email_drafts
+            SET status = ?,
+                next_attempt_at = ?,
+                last_error = ?,
+                send_lease_owner = NULL,
+                send_lease_expires_at = NULL
+            WHERE id = ?
+              AND status = 'sending'
+              AND send_lease_owner = ?
+            """,
+            (status, next_attempt_at, error[:1000], draft_id, owner),
+        )
+    return status if cursor.rowcount == 1 else None
+
+
+# Seconds until the next scheduled retry is due, or None if there is none.
+def seconds_until_next_retry():
+    with get_conn(readonly=True) as conn:
+        row = conn.execute(
+            """
+            SELECT MIN(next_attempt_at)
+            FROM email_drafts
+            WHERE status = 'retry_scheduled'
+            """
+        ).fetchone()
+    if row[0] is None:
+        return None
+    due = datetime.fromisoformat(row[0]) - datetime.now(timezone.utc)
+    return max(0.0, due.total_seconds())
+
+
+# Drafts still in the outbox, by status ('approved', 'sending', 'retry_scheduled').
+def count_outbox():
+    with get_conn(readonly=True) as conn:
+        rows = conn.execute(
+            """
+            SELECT status, COUNT(*)
             FROM email_drafts
-            WHERE status = 'approved'
+            WHERE status IN ('approved', 'sending', 'retry_scheduled')
+            GROUP BY status
             """
         ).fetchall()
+    return {status: count for status, count in rows}
 
 
 # db/drafts.py
 
 # Function to automatically approve a draft, typically based on confidence scores.
+# Runs inside the caller's transaction, so the caller wakes the sender
+# (wakeup.signal(wakeup.SENDER)) once it has committed.
 def auto_approve_draft(conn, draft_id: int):
     conn.execute(
         """
@@ -0,0 +1,180 @@
+from datetime import datetime, timedelta, timezone
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+# Atomically lease up to `limit` emails to `owner`.
+#
+# One email per thread is eligible, and only while no other email of that
+# thread holds a live lease, so every thread is worked on by a single
+# orchestrator at a time. With `coalesce` the newest unprocessed email of the
+# thread is claimed (mark_processed then retires the older ones as
+# superseded); otherwise the oldest, so the thread is worked through in order.
+# `settle_seconds` holds a thread back until its newest email is that old, so
+# a burst that is still arriving is handled in one go.
+#
+# Leases that were not renewed (for example because the replica crashed)
+# simply expire and the row becomes claimable again.
+def claim_emails(
+    conn,
+    owner: str,
+    limit: int,
+    lease_seconds: int,
+    coalesce: bool = True,
+    settle_seconds: float = 0,
+):
+    now = _now()
+    # Row values compare (received_at, id) lexicographically.
+    other_is_head = ">" if coalesce else "<"
+    rows = conn.execute(
+        f"""
+        UPDATE email_events
+        SET claimed_by = :owner,
+            lease_expires_at = :expires_at
+        WHERE id IN (
+            SELECT e.id
+            FROM email_events AS e
+            WHERE e.processed = 0
+              AND e.created_at <= :settled_before
+              AND NOT EXISTS (
+                  SELECT 1
+                  FROM email_events AS other
+                  WHERE other.thread_id = e.thread_id
+                    AND other.processed = 0
+                    AND (
+                        (other.received_at, other.id) {other_is_head} (e.received_at, e.id)
+                        OR other.lease_expires_at > :now
+                    )
+              )
+            ORDER BY e.received_at
+            LIMIT :limit
+        )
+        RETURNING *
+        """,
+        {
+            "owner": owner,
+            "now": now.isoformat(),
+            "expires_at": (now + timedelta(seconds=lease_seconds)).isoformat(),
+            "settled_before": (now - timedelta(seconds=settle_seconds)).isoformat(),
+            "limit": limit,
+        },
+    ).fetchall()
+    # RETURNING does not guarantee any order.
+    return sorted(rows, key=lambda row: (row["received_at"], row["id"]))
+
+
+# Seconds until the next email held back by `settle_seconds` becomes
+# claimable, or None if nothing is waiting to settle.
+def seconds_until_settled(conn, settle_seconds: float):
+    now = _now()
+    row = conn.execute(
+        """
+        SELECT MIN(created_at)
+        FROM email_events
+        WHERE processed = 0
+          AND created_at > ?
+        """,
+        ((now - timedelta(seconds=settle_seconds)).isoformat(),),
+    ).fetchone()
+    if row[0] is None:
+        return None
+    settles_at = datetime.fromisoformat(row[0]) + timedelta(seconds=settle_seconds)
+    return max(0.0, (settles_at - now).total_seconds())
+
+
+# Extend the leases of the emails `owner` is working on right now. Only the
+# given message_ids: anything else still claimed under `owner` was left by a
+# run that died and must be allowed to expire.
+def renew_leases(conn, owner: str, message_ids, lease_seconds: int):
+    message_ids = list(message_ids)
+    if not message_ids:
+        return
+    placeholders = ", ".join("?" * len(message_ids))
+    conn.execute(
+        f"""
+        UPDATE email_events
+        SET lease_expires_at = ?
+        WHERE claimed_by = ?
+          AND processed = 0
+          AND lease_expires_at IS NOT NULL
+          AND message_id IN ({placeholders})
+        """,
+        (
+            (_now() + timedelta(seconds=lease_seconds)).isoformat(),
+            owner,
+            *message_ids,
+        ),
+    )
+
+
+# Give a claimed email back after a failed run, to be retried once
+# `retry_in` seconds have passed. Until then the lease stays live (nobody
+# renews it, claimed_by is cleared), which keeps the email - and its thread -
+# from being claimed again. Counts the attempt in process_attempts.
+def release_claim(conn, message_id: str, owner: str, retry_in: float):
+    conn.execute(
+        """
+        UPDATE email_events
+        SET claimed_by = NULL,
+            lease_expires_at = ?,
+            process_attempts = process_attempts + 1
+        WHERE message_id = ?
+          AND claimed_by = ?
+          AND processed = 0
+        """,
+        ((_now() + timedelta(seconds=retry_in)).isoformat(), message_id, owner),
+    )
+
+
+# Emails still waiting for the orchestrator.
+def count_unprocessed(conn) -> int:
+    return conn.execute(
+        "SELECT COUNT(*) FROM email_events WHERE processed = 0"
+    ).fetchone()[0]
+
+
+# When the email was received, or None if it is unknown.
+def fetch_received_at(conn, message_id: str):
+    row = conn.execute(
+        "SELECT received_at FROM email_events WHERE message_id = ?",
+        (message_id,),
+    ).fetchone()
+    return row[0] if row else None
+
+
+# Function to mark an email as processed in the database.
+#
+# Older unprocessed emails of the same thread are covered by the run on this
+# one, so they are marked processed in the same statement and point at it
+# through superseded_by.
+#
+# Only while `owner` still holds the claim: a replica whose lease expired
+# must not retire emails another replica has claimed since. Returns whether
+# the email was marked.
+def mark_processed(conn, message_id, owner) -> bool:
+    cursor = conn.execute("""
+        UPDATE email_events
+        SET processed = 1,
+            processed_at = :now,
+            lease_expires_at = NULL,
+            superseded_by = CASE
+                WHEN message_id = :message_id THEN NULL
+                ELSE :message_id
+            END
+        WHERE processed = 0
+          AND thread_id = (
+              SELECT thread_id FROM email_events
+              WHERE message_id = :message_id
+                AND claimed_by = :owner
+          )
+          AND (received_at, id) <= (
+              SELECT received_at, id FROM email_events WHERE message_id = :message_id
+          )
+    """, {
+        "now": _now().isoformat(),
+        "message_id": message_id,
+        "owner": owner,
+    })
+    return cursor.rowcount > 0
@@ -0,0 +1,225 @@
+"""Check that every hot query is served by an index.
+
+Run against the live database (or any copy of it):
+
+    python -m db.query_plans
+
+The statements below mirror the ones issued by the services on every poll.
+Keep them in sync when a hot query changes. Besides rejecting full scans,
+each query must use the indexes listed for it in EXPECTED_INDEXES, so an
+index the planner passes over (and every write still maintains) shows up.
+"""
+import re
+import sys
+
+from db.db import get_conn, init_db
+
+
+HOT_QUERIES = {
+    "orchestrator.claim_emails": (
+        """
+        UPDATE email_events
+        SET claimed_by = :owner,
+            lease_expires_at = :expires_at
+        WHERE id IN (
+            SELECT e.id
+            FROM email_events AS e
+            WHERE e.processed = 0
+              AND e.created_at <= :settled_before
+              AND NOT EXISTS (
+                  SELECT 1
+                  FROM email_events AS other
+                  WHERE other.thread_id = e.thread_id
+                    AND other.processed = 0
+                    AND (
+                        (other.received_at, other.id) > (e.received_at, e.id)
+                        OR other.lease_expires_at > :now
+                    )
+              )
+            ORDER BY e.received_at
+            LIMIT :limit
+        )
+        RETURNING *
+        """,
+        {"owner": "", "expires_at": "", "now": "", "settled_before": "", "limit": 1},
+    ),
+    "orchestrator.mark_processed": (
+        """
+        UPDATE email_events
+        SET processed = 1,
+            processed_at = :now,
+            lease_expires_at = NULL,
+            superseded_by = CASE
+                WHEN message_id = :message_id THEN NULL
+                ELSE :message_id
+            END
+        WHERE processed = 0
+          AND thread_id = (
+              SELECT thread_id FROM email_events
+              WHERE message_id = :message_id
+                AND claimed_by = :owner
+          )
+          AND (received_at, id) <= (
+              SELECT received_at, id FROM email_events WHERE message_id = :message_id
+          )
+        """,
+        {"now": "", "message_id": "", "owner": ""},
+    ),
+    "orchestrator.fetch_thread": (
+        """
+        SELECT *
+        FROM email_events
+        WHERE thread_id = ?
+        ORDER BY received_at
+        """,
+        ("",),
+    ),
+    "worker.resolve_thread_id": (
+        "SELECT message_id, thread_id FROM email_events WHERE message_id IN (?, ?, ?)",
+        ("", "", ""),
+    ),
+    "sender.fetch_reply_contexts": (
+        """
+        SELECT
+            e.thread_id,
+            e.message_id,
+            e.references_ids,
+            e.from_email,
+            e.subject
+        FROM json_each(?) AS t
+        JOIN email_events AS e
+          ON e.id = (
+              SELECT latest.id
+              FROM email_events AS latest
+              WHERE latest.thread_id = t.value
+                AND latest.direction = 'incoming'
+              ORDER BY latest.received_at DESC
+              LIMIT 1
+          )
+        """,
+        ('["thread"]',),
+    ),
+    "decisions.fetch_thread_decision_counts": (
+        """
+        SELECT
+            COUNT(*),
+            COALESCE(SUM(action = 'auto_reply'), 0)
+        FROM email_decisions
+        WHERE thread_id = ?
+        """,
+        ("",),
+    ),
+    "drafts.fetch_pending_drafts": (
+        """
+        SELECT id, message_id, thread_id, subject, body, confidence,
+               agent_name, model, created_at
+        FROM email_drafts
+        WHERE status = 'pending'
+        ORDER BY created_at
+        """,
+        (),
+    ),
+    "sender.claim_sendable_drafts": (
+        """
+        UPDATE email_drafts
+        SET status = 'sending',
+            send_lease_owner = :owner,
+            send_lease_expires_at = :expires_at,
+            send_attempts = send_attempts + 1,
+            outgoing_message_id = COALESCE(
+                outgoing_message_id,
+                '<' || lower(hex(randomblob(16))) || '@aiguru360.in>'
+            )
+        WHERE id IN (
+            SELECT id
+            FROM email_drafts
+            WHERE status = 'approved'
+               OR (status = 'retry_scheduled' AND next_attempt_at <= :now)
+               OR (status = 'sending' AND send_lease_expires_at <= :now)
+            LIMIT :limit
+        )
+        RETURNING
+            id,
+            thread_id,
+            subject,
+            body,
+            message_id,
+            outgoing_message_id,
+            send_attempts
+        """,
+        {"owner": "", "expires_at": "", "now": "", "limit": 1},
+    ),
+}
+
+
+# Indexes each hot query has to use (sqlite_autoindex_email_events_1 is the
+# UNIQUE message_id constraint).
+EXPECTED_INDEXES = {
+    "orchestrator.claim_emails": ["idx_email_events_unprocessed", "idx_email_events_thread"],
+    "orchestrator.mark_processed": ["idx_email_events_unprocessed_thread", "sqlite_autoindex_email_events_1"],
+    "orchestrator.fetch_thread": ["idx_email_events_thread"],
+    "worker.resolve_thread_id": ["sqlite_autoindex_email_events_1"],
+    "sender.fetch_reply_contexts": ["idx_email_events_thread"],
+    "decisions.fetch_thread_decision_counts": ["idx_email_decisions_thread"],
+    "drafts.fetch_pending_drafts": ["idx_email_drafts_status"],
+    "sender.claim_sendable_drafts": ["idx_email_drafts_status"],
+}
+
+
+def plan_problems(plan: list[str], expected_indexes=()) -> list[str]:
+    # A "SCAN" step without an index is a full table scan, and a temp b-tree
+    # means rows are sorted after the fact instead of read in index order.
+    # Scanning a table-valued function (json_each over the query's own
+    # parameters) is expected.
+    problems = [
+        step
+        for step in plan
+        if (
+            step.startswith("SCAN")
+            and "USING" not in step
+            and "VIRTUAL TABLE" not in step
+        )
+        or "TEMP B-TREE" in step
+    ]
+    for index in expected_indexes:
+        if not any(re.search(rf"INDEX {index}\b", step) for step in plan):
+            problems.append(f"expected INDEX {index}, not used")
+    return problems
+
+
+def explain(conn, sql: str, params) -> list[str]:
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+
+def check_query_plans(conn) -> dict[str, list[str]]:
+    """Return the offending plan steps of every hot query that misses an index."""
+    failures = {}
+    for name, (sql, params) in HOT_QUERIES.items():
+        problems = plan_problems(explain(conn, sql, params), EXPECTED_INDEXES.get(name, ()))
+        if problems:
+            failures[name] = problems
+    return failures
+
+
+def main():
+    init_db()
+    with get_conn(readonly=True) as conn:
+        for name, (sql, params) in HOT_QUERIES.items():
+            plan = explain(conn, sql, params)
+            problems = plan_problems(plan, EXPECTED_INDEXES.get(name, ()))
+            status = "❌" if problems else "✅"
+            print(f"{status} {name}")
+            for step in plan:
+                print(f"     {step}")
+            for problem in problems:
+                if problem not in plan:
+                    print(f"     ❌ {problem}")
+        failures = check_query_plans(conn)
+
+    if failures:
+        print(f"{len(failures)} hot queries are not fully index-backed")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
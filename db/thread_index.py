@@ -0,0 +1,98 @@
+"""In-process message_id -> thread_id index for thread resolution.
+
+Replies carry their parent in In-Reply-To and the whole ancestry in
+References, which on long threads is 20+ ids. The index answers most of
+those lookups from memory; whatever it misses is fetched with a single
+`WHERE message_id IN (...)` query. It is warmed from the most recent
+email_events at startup and kept bounded with LRU eviction.
+"""
+import os
+import threading
+import uuid
+from collections import OrderedDict
+
+THREAD_INDEX_MAX_ENTRIES = int(os.environ.get("THREAD_INDEX_MAX_ENTRIES", "100000"))
+THREAD_INDEX_WARM_ROWS = int(os.environ.get("THREAD_INDEX_WARM_ROWS", "20000"))
+
+
+class ThreadIndex:
+    def __init__(self, max_entries: int = THREAD_INDEX_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "queries": 0, "evictions": 0}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def put(self, message_id: str, thread_id: str):
+        with self._lock:
+            self._entries[message_id] = thread_id
+            self._entries.move_to_end(message_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def warm(self, conn, limit: int = THREAD_INDEX_WARM_ROWS) -> int:
+        """Load the `limit` most recent emails, newest ending up most recently used."""
+        rows = conn.execute(
+            """
+            SELECT message_id, thread_id
+            FROM email_events
+            ORDER BY id DESC
+            LIMIT ?
+            """,
+            (min(limit, self.max_entries),),
+        ).fetchall()
+        for message_id, thread_id in reversed(rows):
+            self.put(message_id, thread_id)
+        return len(rows)
+
+    def lookup(self, conn, message_ids: list[str]) -> dict:
+        """Map each known id in `message_ids` to its thread_id."""
+        found = {}
+        missing = []
+        with self._lock:
+            for message_id in message_ids:
+                thread_id = self._entries.get(message_id)
+                if thread_id is None:
+                    missing.append(message_id)
+                else:
+                    self._entries.move_to_end(message_id)
+                    found[message_id] = thread_id
+            self._stats["hits"] += len(found)
+            self._stats["misses"] += len(missing)
+
+        if missing:
+            placeholders = ", ".join("?" * len(missing))
+            rows = conn.execute(
+                f"SELECT message_id, thread_id FROM email_events WHERE message_id IN ({placeholders})",
+                missing,
+            ).fetchall()
+            with self._lock:
+                self._stats["queries"] += 1
+            for message_id, thread_id in rows:
+                self.put(message_id, thread_id)
+                found[message_id] = thread_id
+        return found
+
+    def resolve(self, conn, in_reply_to: str | None, references: list[str]) -> str:
+        """Thread of the parent (In-Reply-To first, then References in order), or a new one."""
+        candidates = ([in_reply_to] if in_reply_to else []) + list(references)
+        # dict.fromkeys dedupes while keeping precedence order.
+        candidates = list(dict.fromkeys(candidates))
+        if candidates:
+            found = self.lookup(conn, candidates)
+            for message_id in candidates:
+                if message_id in found:
+                    return found[message_id]
+        return str(uuid.uuid4())
+
+    def stats(self) -> dict:
+        """Hit/miss counters since the process started."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,143 @@
+"""Single-pass scanner for raw email header blocks.
+
+Ingestion only needs a handful of headers out of blocks that routinely run
+to several kilobytes of ARC/DKIM signatures. `scan_headers` walks the block
+once, unfolds continuation lines, and only materializes the values of the
+headers asked for; everything else is skipped without being copied.
+
+HEADER_STORAGE controls what ends up in email_events.raw_headers:
+
+    full        the block as received (default)
+    minimal     only the headers the pipeline reads, re-serialized
+    compressed  the full block, zlib-compressed
+
+Anything reading raw_headers back goes through `decode_stored_headers`.
+"""
+import os
+import re
+import zlib
+
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+
+HEADER_STORAGE = os.environ.get("HEADER_STORAGE", "full")
+
+THREADING_HEADERS = frozenset({"in-reply-to", "references"})
+
+# Headers kept by HEADER_STORAGE=minimal, on top of whatever the fast-path
+# rules read.
+STORED_HEADERS = frozenset({
+    "message-id",
+    "in-reply-to",
+    "references",
+    "from",
+    "to",
+    "subject",
+    "date",
+})
+
+# Headers that may legitimately repeat and whose values are concatenated.
+_MULTI_VALUE = frozenset({"references"})
+
+_MESSAGE_ID = re.compile(r"<[^<>\s]+>")
+
+
+def _store(headers: dict, name: str, parts: list[str]):
+    value = " ".join(part for part in parts if part)
+    if name not in headers:
+        headers[name] = value
+    elif name in _MULTI_VALUE:
+        headers[name] = f"{headers[name]} {value}"
+
+
+def scan_headers(raw: str | None, wanted=None) -> dict[str, str]:
+    """Lowercased header name -> unfolded value, first occurrence wins.
+
+    Only names in `wanted` (lowercase) are collected; None collects all.
+    Scanning stops at the first blank line.
+    """
+    headers = {}
+    if not raw:
+        return headers
+
+    name = None
+    parts = None
+    pos = 0
+    end = len(raw)
+    while pos < end:
+        eol = raw.find("\n", pos)
+        if eol == -1:
+            eol = end
+
+        if raw[pos] in " \t":
+            # Continuation of the previous header.
+            if name is not None:
+                parts.append(raw[pos:eol].strip())
+        else:
+            if name is not None:
+                _store(headers, name, parts)
+                name = None
+            colon = raw.find(":", pos, eol)
+            if colon == -1:
+                if not raw[pos:eol].strip():
+                    break
+            else:
+                candidate = raw[pos:colon].strip().lower()
+                if wanted is None or candidate in wanted:
+                    name = candidate
+                    parts = [raw[colon + 1:eol].strip()]
+        pos = eol + 1
+
+    if name is not None:
+        _store(headers, name, parts)
+    return headers
+
+
+def message_ids(value: str | None) -> list[str]:
+    """All <...> message ids in a header value, in order."""
+    if not value:
+        return []
+    return _MESSAGE_ID.findall(value)
+
+
+def threading_headers(raw: str | None) -> tuple[str | None, list[str]]:
+    """(In-Reply-To, References) from a raw header block."""
+    headers = scan_headers(raw, THREADING_HEADERS)
+
+    in_reply_to = headers.get("in-reply-to")
+    ids = message_ids(in_reply_to)
+    if ids:
+        in_reply_to = ids[0]
+
+    references = message_ids(headers.get("references"))
+    if not references and headers.get("references"):
+        # No angle brackets at all; fall back to whitespace-separated ids.
+        references = headers["references"].split()
+    return in_reply_to or None, references
+
+
+def minimal_headers(raw: str | None, keep) -> str | None:
+    """Re-serialize only the headers in `keep`, one unfolded line each."""
+    headers = scan_headers(raw, keep)
+    if not headers:
+        return None
+    return "".join(f"{name}: {value}\n" for name, value in headers.items())
+
+
+def headers_for_storage(raw: str | None, keep=STORED_HEADERS):
+    """The value to store in email_events.raw_headers under HEADER_STORAGE."""
+    if not raw or HEADER_STORAGE == "full":
+        return raw
+    if HEADER_STORAGE == "minimal":
+        return minimal_headers(raw, keep)
+    if HEADER_STORAGE == "compressed":
+        return zlib.compress(raw.encode("utf-8"))
+    raise ValueError(f"Unknown HEADER_STORAGE: {HEADER_STORAGE}")
+
+
+def decode_stored_headers(value) -> str | None:
+    """Undo `headers_for_storage`; compressed blocks come back as bytes."""
+    if isinstance(value, bytes):
+        return zlib.decompress(value).decode("utf-8")
+    return value
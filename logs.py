@@ -0,0 +1,158 @@
+"""Shared logging setup for the worker, orchestrator and sender.
+
+Every service calls `setup_logging()` once at startup. Records are handed to
+a queue in the calling thread and written to stdout by a background
+listener, so neither the event loop nor the Pub/Sub callback threads ever
+block on I/O. Output is one JSON object per line (LOG_FORMAT=text for a
+human-readable console).
+
+`log_context(message_id=..., thread_id=...)` binds correlation ids for the
+current thread or asyncio task; they are attached to every record logged
+inside it. Records logged with `extra={"sample": True}` are high-volume and
+only every LOG_SAMPLE_EVERY-th one (per call site) is kept.
+
+Use %-style arguments (`log.debug("x=%s", x)`) so disabled levels skip the
+formatting entirely.
+"""
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json")
+LOG_SAMPLE_EVERY = int(os.environ.get("LOG_SAMPLE_EVERY", "10"))
+
+message_id_var = contextvars.ContextVar("message_id", default=None)
+thread_id_var = contextvars.ContextVar("thread_id", default=None)
+
+
+@contextmanager
+def log_context(*, message_id=None, thread_id=None):
+    """Attach message_id/thread_id to every record logged inside the block."""
+    tokens = []
+    if message_id is not None:
+        tokens.append((message_id_var, message_id_var.set(message_id)))
+    if thread_id is not None:
+        tokens.append((thread_id_var, thread_id_var.set(thread_id)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    """Copy the correlation ids of the calling context onto the record."""
+
+    def filter(self, record):
+        record.message_id = message_id_var.get()
+        record.thread_id = thread_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keep the first and then every `every`-th record of a sampled call site."""
+
+    def __init__(self, every: int):
+        super().__init__()
+        self.every = max(1, every)
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if not getattr(record, "sample", False) or self.every == 1:
+            return True
+        key = (record.pathname, record.lineno)
+        with self._lock:
+            count = self._counts.get(key, 0)
+            self._counts[key] = count + 1
+        if count % self.every:
+            return False
+        record.sampled = self.every
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for name in ("message_id", "thread_id", "sampled"):
+            value = getattr(record, name, None)
+            if value is not None:
+                entry[name] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record):
+        line = super().format(record)
+        ids = [
+            f"{name}={getattr(record, name)}"
+            for name in ("message_id", "thread_id")
+            if getattr(record, name, None)
+        ]
+        return f"{line} [{' '.join(ids)}]" if ids else line
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # Merge the arguments and render the traceback here, where the
+        # exception is still alive, but leave the final formatting (and the
+        # I/O) to the listener thread.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+_listener = None
+_setup_lock = threading.Lock()
+
+
+def setup_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT):
+    """Route the root logger through a non-blocking queue to stdout. Idempotent."""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            return
+
+        output = logging.StreamHandler(sys.stdout)
+        output.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+
+        log_queue = queue.SimpleQueue()
+        handler = _QueueHandler(log_queue)
+        handler.addFilter(SamplingFilter(LOG_SAMPLE_EVERY))
+        handler.addFilter(ContextFilter())
+
+        root = logging.getLogger()
+        root.handlers[:] = [handler]
+        root.setLevel(level)
+
+        _listener = logging.handlers.QueueListener(log_queue, output)
+        _listener.start()
+        atexit.register(_listener.stop)
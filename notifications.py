@@ -0,0 +1,262 @@
+"""Bounded, coalescing Pushover notifications.
+
+Every notification goes through one background thread and one pooled HTTP
+session instead of a thread and a TLS handshake per message:
+
+- `add(key, text)` buffers lines per email and `flush(key)` sends them as a
+  single message, so one email produces one notification.
+- The outgoing queue is bounded; when it is full, messages are dropped and
+  counted instead of piling up.
+- While the queue is backed up (DIGEST_THRESHOLD or more waiting), queued
+  messages are folded into one digest at most every DIGEST_INTERVAL seconds,
+  which keeps us under Pushover's rate limits during a backlog. A digest
+  holds whole messages, escalations first, up to Pushover's length limit;
+  the rest are counted as dropped and the digest says how many.
+
+PUSHOVER_URL can point at a local HTTP stand-in (see benchmarks/stubs.py).
+"""
+import logging
+import os
+import queue
+import threading
+import time
+
+import requests
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+load_dotenv(override=True)
+
+log = logging.getLogger("notifications")
+
+PUSHOVER_URL = os.environ.get("PUSHOVER_URL", "https://api.pushover.net/1/messages.json")
+NOTIFY_QUEUE_SIZE = int(os.environ.get("NOTIFY_QUEUE_SIZE", "200"))
+NOTIFY_DIGEST_THRESHOLD = int(os.environ.get("NOTIFY_DIGEST_THRESHOLD", "5"))
+NOTIFY_DIGEST_INTERVAL = float(os.environ.get("NOTIFY_DIGEST_INTERVAL", "30"))
+
+# Pushover rejects longer messages.
+MAX_MESSAGE_LENGTH = 1024
+
+# Messages containing this need a human; digests list them first.
+URGENT_MARKER = "Escalated!!"
+
+# Room kept at the end of a digest for the "… N more not shown" line.
+_DIGEST_TRAILER = 40
+
+
+def _truncate(text: str, limit: int = MAX_MESSAGE_LENGTH) -> str:
+    if len(text) <= limit:
+        return text
+    return text[: limit - 1] + "…"
+
+
+def _digest(batch: list[str]) -> tuple[str, int]:
+    """The digest message for `batch`, and how many messages it holds in full.
+
+    Escalations come first. Messages are only included whole; one that does
+    not fit is left out, except an escalation, which is cut short instead
+    while there is room for some of it.
+    """
+    batch = sorted(batch, key=lambda text: URGENT_MARKER not in text)
+    urgent = sum(URGENT_MARKER in text for text in batch)
+    header = f"📬 {len(batch)} notifications" + (f", {urgent} escalated" if urgent else "")
+
+    room = MAX_MESSAGE_LENGTH - len(header) - _DIGEST_TRAILER
+    shown = []
+    whole = 0
+    for text in batch:
+        if len(text) + 2 <= room:
+            shown.append(text)
+            whole += 1
+        elif URGENT_MARKER in text and room > 200:
+            shown.append(_truncate(text, room - 2))
+        else:
+            continue
+        room -= len(shown[-1]) + 2
+
+    digest = "\n\n".join([header, *shown])
+    if whole < len(batch):
+        digest += f"\n\n… {len(batch) - whole} more not shown in full"
+    return digest, whole
+
+
+class Notifier:
+    def __init__(
+        self,
+        url: str = PUSHOVER_URL,
+        token: str | None = None,
+        user: str | None = None,
+        queue_size: int = NOTIFY_QUEUE_SIZE,
+        digest_threshold: int = NOTIFY_DIGEST_THRESHOLD,
+        digest_interval: float = NOTIFY_DIGEST_INTERVAL,
+        timeout: float = 10,
+    ):
+        self.url = url
+        self.token = token
+        self.user = user
+        self.digest_threshold = digest_threshold
+        self.digest_interval = digest_interval
+        self.timeout = timeout
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._last_digest = 0.0
+        self._stats = {
+            "enqueued": 0,
+            "sent": 0,
+            "digests": 0,
+            "failed": 0,
+            "overflow": 0,
+            "dropped": 0,
+            "truncated": 0,
+        }
+
+        self.session = requests.Session()
+        # A single dispatcher thread only ever needs one connection.
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+
+    @classmethod
+    def from_env(cls) -> "Notifier":
+        return cls(
+            token=os.environ.get("PUSHOVER_TOKEN"),
+            user=os.environ.get("PUSHOVER_USER"),
+        )
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["queued"] = self._queue.qsize()
+        return stats
+
+    # -- producers -------------------------------------------------------
+
+    def add(self, key: str, text: str):
+        """Buffer a line for `key` (usually a message_id) until flush(key)."""
+        with self._lock:
+            self._pending.setdefault(key, []).append(text)
+
+    def flush(self, key: str):
+        """Send everything buffered for `key` as one notification."""
+        with self._lock:
+            lines = self._pending.pop(key, None)
+        if lines:
+            self.send("\n".join(lines))
+
+    def send(self, text: str):
+        """Queue a notification; drops it if the queue is full."""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(text)
+        except queue.Full:
+            self._count("overflow")
+            self._count("dropped")
+            return
+        self._count("enqueued")
+
+    # -- dispatcher ------------------------------------------------------
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="notifier", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            text = self._queue.get()
+            if self._queue.qsize() + 1 < self.digest_threshold:
+                self._post(text)
+                self._queue.task_done()
+                continue
+
+            # Backed up: wait out the digest interval, then send everything
+            # that is waiting as one message.
+            wait = self._last_digest + self.digest_interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            batch = [text]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._last_digest = time.monotonic()
+            digest, shown = _digest(batch)
+            self._count("dropped", len(batch) - shown)
+            if self._post(digest, messages=shown):
+                self._count("digests")
+            for _ in batch:
+                self._queue.task_done()
+
+    def _post(self, text: str, messages: int = 1) -> bool:
+        if len(text) > MAX_MESSAGE_LENGTH:
+            self._count("truncated")
+        try:
+            response = self.session.post(
+                self.url,
+                data={
+                    "token": self.token,
+                    "user": self.user,
+                    "message": _truncate(text),
+                },
+                timeout=self.timeout,
+            )
+            response.raise_for_status()
+        except Exception as e:
+            log.warning("Pushover notification failed: %s", e)
+            self._count("failed")
+            self._count("dropped", messages)
+            return False
+        self._count("sent", messages)
+        return True
+
+    def wait_idle(self, timeout: float = 10) -> bool:
+        """Wait until the queue is drained. Useful in benchmarks and shutdown."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self._queue.unfinished_tasks == 0:
+                return True
+            time.sleep(0.01)
+        return False
+
+
+_notifier = None
+_notifier_lock = threading.Lock()
+
+
+def get_notifier() -> Notifier:
+    """The process-wide notifier, configured from the environment."""
+    global _notifier
+    with _notifier_lock:
+        if _notifier is None:
+            _notifier = Notifier.from_env()
+        return _notifier
+
+
+def _notifier_events():
+    if _notifier is None:
+        return {}
+    stats = _notifier.stats()
+    stats.pop("queued")
+    return {(event,): count for event, count in stats.items()}
+
+
+NOTIFICATIONS = metrics.Counter(
+    "notifications_total", "Notifier events (enqueued, sent, digests, failed, overflow, dropped, truncated).", ["event"]
+)
+NOTIFICATIONS.set_function(_notifier_events)
+NOTIFICATIONS_QUEUED = metrics.Gauge("notifications_queued", "Notifications waiting to be sent.")
+NOTIFICATIONS_QUEUED.set_function(lambda: _notifier.stats()["queued"] if _notifier else 0)
@@ -1,17 +1,33 @@
 import time
-from datetime import datetime, timezone
 from db.db import get_conn, init_db
 from subagents.main_agent import run_main_agent
 from subagents.reply import run_reply_agent
+from subagents.combined import combined_agent, run_combined_agent
+from subagents import rules as fast_path
+from subagents import llm_client
 from subagents.schemas import AgentDecision
-from db.decisions import persist_decision
+from db.decisions import fetch_thread_decision_counts, persist_decision
 from db.drafts import persist_draft
 from db.drafts import auto_approve_draft
+from db.events import (
+    claim_emails,
+    count_unprocessed,
+    mark_processed,
+    release_claim,
+    renew_leases,
+    seconds_until_settled,
+)
 import asyncio
+import logging
+import random
 from dotenv import load_dotenv
-import requests
-import threading
+import socket
 import os
+import uuid
+import metrics
+import wakeup
+from notifications import get_notifier
+from logs import log_context, setup_logging
 
 
 
@@ -19,23 +35,106 @@ import os
 
 load_dotenv(override=True)
 
+log = logging.getLogger("orchestrator")
+
+# Notifications are buffered per email and sent once it is done.
+notifier = get_notifier()
+
 # Define confidence thresholds for auto-decision and auto-draft approval.
 AUTO_DECISION_THRESHOLD = 0.3
 AUTO_DRAFT_THRESHOLD = 0.2
 
-# Define the interval in seconds for polling for new emails.
+# Define the interval in seconds for polling for new emails. New emails
+# normally wake the orchestrator right away (see wakeup.py); polling is only
+# the fallback and backs off up to POLL_MAX_INTERVAL while idle.
 POLL_INTERVAL = 2
-
-
-# Function to fetch the next unprocessed email from the database.
-def fetch_next_unprocessed_email(conn):
-    return conn.execute("""
-        SELECT *
-        FROM email_events
-        WHERE processed = 0
-        ORDER BY received_at
-        LIMIT 1
-    """).fetchone()
+POLL_MAX_INTERVAL = 30
+
+# Number of emails processed concurrently. Emails of the same thread are
+# always processed one at a time, in the order they were received.
+ORCHESTRATOR_WORKERS = int(os.environ.get("ORCHESTRATOR_WORKERS", "4"))
+
+# Which agents make the decision and the draft:
+# - "two_call": MainEmailAgent decides, then ReplyAgent drafts (default)
+# - "combined": DecideAndDraftAgent does both in a single LLM call
+AGENT_MODE = os.environ.get("AGENT_MODE", "two_call")
+
+# Speculative drafting (two_call mode only): start the reply agent together with the main agent
+# and throw the draft away if the decision is not auto_reply. Limited to
+# threads with at least SPECULATION_MIN_HISTORY past decisions, of which at
+# least SPECULATION_MIN_AUTO_REPLY_RATE were auto-replies.
+SPECULATIVE_DRAFTING = os.environ.get("SPECULATIVE_DRAFTING", "0") == "1"
+SPECULATION_MIN_HISTORY = int(os.environ.get("SPECULATION_MIN_HISTORY", "2"))
+SPECULATION_MIN_AUTO_REPLY_RATE = float(
+    os.environ.get("SPECULATION_MIN_AUTO_REPLY_RATE", "0.6")
+)
+
+# Thread coalescing: when several emails of a thread are waiting, run the
+# agents once on the newest and mark the older ones processed as superseded.
+# COALESCE_DEBOUNCE_SECONDS waits until a thread's newest email is that old
+# before claiming it, so a burst that is still arriving is handled in one go.
+COALESCE_THREADS = os.environ.get("COALESCE_THREADS", "1") == "1"
+COALESCE_DEBOUNCE_SECONDS = float(os.environ.get("COALESCE_DEBOUNCE_SECONDS", "0"))
+
+# Identity used when claiming emails, unique per replica and per start: a
+# restarted container keeps its hostname and PID, and must not pass for the
+# run that died and left leases behind.
+ORCHESTRATOR_ID = os.environ.get(
+    "ORCHESTRATOR_ID", f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+)
+
+# How long a claimed email stays reserved for this replica. Leases are renewed
+# while the email is being worked on and expire if the replica dies.
+LEASE_SECONDS = int(os.environ.get("ORCHESTRATOR_LEASE_SECONDS", "60"))
+
+# An email whose processing fails is retried after
+# ORCHESTRATOR_RETRY_BASE_SECONDS * 2^(attempt-1), capped at
+# ORCHESTRATOR_RETRY_MAX_SECONDS, and escalated to a human once it has
+# failed ORCHESTRATOR_MAX_ATTEMPTS times.
+ORCHESTRATOR_MAX_ATTEMPTS = int(os.environ.get("ORCHESTRATOR_MAX_ATTEMPTS", "5"))
+ORCHESTRATOR_RETRY_BASE_SECONDS = float(os.environ.get("ORCHESTRATOR_RETRY_BASE_SECONDS", "30"))
+ORCHESTRATOR_RETRY_MAX_SECONDS = float(os.environ.get("ORCHESTRATOR_RETRY_MAX_SECONDS", "1800"))
+
+# Default port of this service's /metrics endpoint (METRICS_PORT overrides).
+METRICS_PORT = 9102
+
+EMAIL_BACKLOG = metrics.Gauge("email_backlog", "Emails not processed yet (processed = 0).")
+IN_FLIGHT = metrics.Gauge("orchestrator_in_flight", "Emails being processed by this replica.")
+PICKUP_SECONDS = metrics.Histogram("email_pickup_seconds", "Time from receipt to being claimed by a worker.")
+PROCESS_SECONDS = metrics.Histogram("email_process_seconds", "Time to process one claimed email.")
+DECISIONS = metrics.Counter("decisions_total", "Decisions, by action and what made them.", ["action", "source"])
+DRAFTS = metrics.Counter("drafts_total", "Generated drafts, by outcome (auto_approved, human_review).", ["outcome"])
+
+
+def _count_backlog():
+    with get_conn(readonly=True) as conn:
+        return count_unprocessed(conn)
+
+
+EMAIL_BACKLOG.set_function(_count_backlog)
+
+
+# Decide whether to run the reply agent alongside the main agent. Only threads
+# whose past decisions were mostly auto-replies qualify, which keeps the cost
+# of drafts that end up discarded bounded.
+def should_speculate(thread_id):
+    if not SPECULATIVE_DRAFTING:
+        return False
+    total, auto_replies = fetch_thread_decision_counts(thread_id)
+    if total < SPECULATION_MIN_HISTORY:
+        return False
+    return auto_replies / total >= SPECULATION_MIN_AUTO_REPLY_RATE
+
+
+def discard_draft(task):
+    """Cancel a speculative draft nobody will await.
+
+    The draft may have failed already (or fail while cancelling); retrieving
+    the exception keeps asyncio from logging "Task exception was never
+    retrieved" for it.
+    """
+    task.cancel()
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
 
 
 # Function to fetch all emails belonging to a specific thread.
@@ -48,181 +147,354 @@ def fetch_thread(conn, thread_id):
     """, (thread_id,)).fetchall()
 
 
-def push(text):
-    def send():
-        try:
-            requests.post(
-                "https://api.pushover.net/1/messages.json",
-                data={
-                    "token": os.environ.get("PUSHOVER_TOKEN"),
-                    "user": os.environ.get("PUSHOVER_USER"),
-                    "message": text,
-                },
-                timeout=10
-            )
-        except Exception as e:
-            print(f"Pushover notification failed: {e}")
-    threading.Thread(target=send).start()
-
-
-# Function to mark an email as processed in the database.
-def mark_processed(conn, message_id):
-    conn.execute("""
-        UPDATE email_events
-        SET processed = 1,
-            processed_at = ?
-        WHERE message_id = ?
-    """, (
-        datetime.now(timezone.utc).isoformat(),
-        message_id
-    ))
-
+# Database work of the async code below runs on worker threads via
+# asyncio.to_thread: a write transaction can wait up to busy_timeout for the
+# write lock, and on the event loop that would stall every worker and every
+# LLM call in flight.
+def load_thread(thread_id):
+    with get_conn(readonly=True) as conn:
+        return fetch_thread(conn, thread_id)
+
 
-async def main():
-    init_db()
-    print("🧠 Orchestrator started") # Log that the orchestrator has started.
+def mark_email_processed(message_id) -> bool:
+    with get_conn() as conn:
+        return mark_processed(conn, message_id, ORCHESTRATOR_ID)
+
+
+def approve_draft(draft_id):
+    with get_conn() as conn:
+        auto_approve_draft(conn, draft_id)
+
+
+def release_email(message_id, retry_in):
+    with get_conn() as conn:
+        release_claim(conn, message_id, ORCHESTRATOR_ID, retry_in)
+
+
+def renew_email_leases(message_ids):
+    with get_conn() as conn:
+        renew_leases(conn, ORCHESTRATOR_ID, message_ids, LEASE_SECONDS)
+
+
+def claim(limit):
+    with get_conn() as conn:
+        return claim_emails(
+            conn,
+            ORCHESTRATOR_ID,
+            limit,
+            LEASE_SECONDS,
+            coalesce=COALESCE_THREADS,
+            settle_seconds=COALESCE_DEBOUNCE_SECONDS,
+        )
+
+
+def settles_in():
+    with get_conn(readonly=True) as conn:
+        return seconds_until_settled(conn, COALESCE_DEBOUNCE_SECONDS)
+
+
+# Construct a list of messages in the thread, formatted for agent processing.
+# Bodies cleaned at ingest leave out the quoted history, which the earlier
+# messages of the thread already carry; older rows have none.
+def build_thread_messages(thread):
+    return [
+        {
+            "role": "user" if msg["direction"] == "incoming" else "assistant",
+            "from": msg["from_email"],
+            "body": msg["body_clean"] if msg["body_clean"] is not None else msg["body"],
+        }
+        for msg in thread
+    ]
+
+
+async def process_email(row):
+    message_id = row["message_id"]
+    thread_id = row["thread_id"]
+    direction = row["direction"]
+    from_email = row["from_email"]
+    subject = row["subject"]
+    body = row["body"]
+    received_at = row["received_at"]
+
+    waited = metrics.seconds_since(received_at)
+    if waited is not None:
+        PICKUP_SECONDS.observe(waited)
+
+    # Fetch all messages in the current email's thread.
+    thread = await asyncio.to_thread(load_thread, thread_id)
+    # Log thread and email details.
+    log.info("📩 New email (%d messages in thread): %s", len(thread), subject)
+
+    thread_messages = build_thread_messages(thread)
+
+    # Check if the email is an outgoing system email.
+    if direction == "outgoing":
+        # Create an 'ignore' decision for outgoing system emails.
+        decision = AgentDecision(
+            action="ignore",
+            intent=None,
+            confidence=1.0,
+            reason="Skipping processing of system-sent outgoing email."
+        )
+
+        notifier.add(message_id, f"Ignored outgoing system email: {subject} from {from_email}. Thread ID: {thread_id}. Message ID: {message_id}. Direction: {direction}. Received at: {received_at}. Body: {(body or '')[:100]}.")
+
+        await asyncio.to_thread(
+            persist_decision,
+            message_id=message_id,
+            thread_id=thread_id,
+            decision=decision
+        )
+
+        await asyncio.to_thread(mark_email_processed, message_id)
+        log.info("🛑 Ignored outgoing system email")
+        return
+
+    draft = None
+    draft_agent_name = "ReplyAgent"
+    draft_model = None
+    speculative_draft = None
+    decision_source = "main_agent"
+
+    # Bounces, auto-replies, list traffic and the like are decided by rules,
+    # without calling any model.
+    decision = fast_path.evaluate(row)
+    if decision is not None:
+        decision_source = "rule"
+        saved = fast_path.rule_stats()["llm_calls_saved"]
+        log.info("⚡ Fast-path rule matched, skipping LLM (%d calls saved so far): %s", saved, decision.reason)
+    elif AGENT_MODE == "combined":
+        # One call returns both the decision and, for auto_reply, the draft.
+        result = await run_combined_agent(thread_messages)
+        decision_source = "combined_agent"
+        decision = result.decision
+        if result.draft is not None:
+            draft = result.draft
+            draft_agent_name = "DecideAndDraftAgent"
+            draft_model = combined_agent.model
+    else:
+        # Optionally start drafting before the decision is known, so an
+        # auto-reply pays for one LLM round-trip instead of two.
+        if await asyncio.to_thread(should_speculate, thread_id):
+            log.info("🔮 Drafting speculatively")
+            speculative_draft = asyncio.create_task(run_reply_agent(thread_messages))
 
- # Main loop for the orchestrator to continuously process emails.
+        try:
+            decision = await run_main_agent(thread_messages)
+        except BaseException:
+            if speculative_draft:
+                discard_draft(speculative_draft)
+            raise
+
+    log.debug("Decision: %r", decision)
+
+    if speculative_draft and decision.action != "auto_reply":
+        # The draft is not needed; stop paying for it.
+        discard_draft(speculative_draft)
+        speculative_draft = None
+        log.info("🗑️ Discarded speculative draft")
+
+    # Hard validation (non-negotiable)
+    assert isinstance(decision, AgentDecision)
+
+    await asyncio.to_thread(
+        persist_decision,
+        message_id=message_id,
+        thread_id=thread_id,
+        decision=decision
+    )
+
+    DECISIONS.inc(action=decision.action, source=decision_source)
+
+    # Log the agent's decision.
+    log.info(
+        "🤖 Agent decision persisted: %s (intent=%s, confidence=%s): %s",
+        decision.action, decision.intent, decision.confidence, decision.reason,
+    )
+
+    # If the agent decides to auto-reply.
+    if decision.action == "auto_reply":
+        # Run the reply agent to generate a draft, unless we already have one
+        # or it is already running.
+        if draft is None and speculative_draft:
+            draft, draft_model = await speculative_draft
+        elif draft is None:
+            draft, draft_model = await run_reply_agent(thread_messages)
+        notifier.add(message_id, f"Draft generated for: {subject} from {from_email}. Thread ID: {thread_id}. Message ID: {message_id}.")
+        # Persist the generated draft.
+        draft_id = await asyncio.to_thread(
+            persist_draft,
+            message_id=message_id,
+            thread_id=thread_id,
+            subject=draft.subject,
+            body=draft.body,
+            confidence=draft.confidence,
+            agent_name=draft_agent_name,
+            model=draft_model,
+        )
+        # Check if both decision and draft confidence meet the auto-approval thresholds.
+        if (
+            decision.confidence is not None
+            and draft.confidence is not None
+            and decision.confidence >= AUTO_DECISION_THRESHOLD
+            and draft.confidence >= AUTO_DRAFT_THRESHOLD
+        ):
+            await asyncio.to_thread(approve_draft, draft_id)
+            wakeup.signal(wakeup.SENDER)
+            notifier.add(message_id, f"Auto-approved draft: {subject} from {from_email}. Thread ID: {thread_id}. Message ID: {message_id}.")
+            notifier.add(message_id, f"Draft body: {draft.body}")
+            DRAFTS.inc(outcome="auto_approved")
+            log.info("✅ Auto-approved draft %s", draft_id)
+        else:
+            notifier.add(message_id, f"Draft pending human review: {subject} from {from_email}. Draft ID: {draft_id}. Thread ID: {thread_id}. Message ID: {message_id}. Body: {draft.body}")
+            DRAFTS.inc(outcome="human_review")
+            log.info("🕒 Draft %s pending human review", draft_id)
+
+    elif decision.action == "escalate":
+        notifier.add(message_id, f"Escalated!! Human Intervention Required: message_id={message_id}, thread_id={thread_id}, decision={decision.model_dump_json()}")
+    elif decision.action == "ignore":
+        notifier.add(message_id, f"Ignored: {subject} from {from_email}. Thread ID: {thread_id}")
+
+    # Mark the current email as processed.
+    marked = await asyncio.to_thread(mark_email_processed, message_id)
+    if not marked:
+        log.warning("⚠️ Lost the claim before finishing; another replica owns this email now")
+        return
+    notifier.add(message_id, "✅ Marked processed")
+    log.info("✅ Marked processed")
+
+
+# Called when an email has failed too often: hand it to a human instead of
+# retrying it forever. Blocking; the worker runs it via asyncio.to_thread.
+def give_up(row, error):
+    message_id = row["message_id"]
+    attempts = row["process_attempts"] + 1
+    decision = AgentDecision(
+        action="escalate",
+        intent=None,
+        confidence=None,
+        reason=f"Processing failed {attempts} times; last error: {error}"[:1000],
+    )
+    persist_decision(message_id=message_id, thread_id=row["thread_id"], decision=decision)
+    mark_email_processed(message_id)
+    DECISIONS.inc(action="escalate", source="dead_letter")
+    notifier.add(message_id, f"💀 Escalated!! Processing failed {attempts} times: message_id={message_id}, thread_id={row['thread_id']}, error={error}")
+    log.error("💀 Giving up after %d attempts, escalated: %s", attempts, error)
+
+
+# Seconds to wait before retrying an email that has failed `attempts` times.
+def retry_delay(attempts):
+    delay = min(ORCHESTRATOR_RETRY_MAX_SECONDS, ORCHESTRATOR_RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+    # Jitter so emails that failed together don't retry together.
+    return delay * random.uniform(0.5, 1.0)
+
+
+async def worker(name, queue, in_flight, worker_free):
+    # Each worker drains the shared queue of emails claimed by this replica.
     while True:
- # Get a database connection for the current iteration.
-        with get_conn() as conn:
- # Fetch the next unprocessed email.
-            row = fetch_next_unprocessed_email(conn)
- # If no unprocessed email is found, wait and continue to the next iteration.
-            if not row:
-                await asyncio.sleep(POLL_INTERVAL)
-                continue
+        row = await queue.get()
+        with log_context(message_id=row["message_id"], thread_id=row["thread_id"]):
+            try:
+                with PROCESS_SECONDS.time():
+                    await process_email(row)
+            except Exception as e:
+                log.exception("❌ %s failed: %s", name, e)
+                attempts = row["process_attempts"] + 1
+                try:
+                    if attempts >= ORCHESTRATOR_MAX_ATTEMPTS:
+                        await asyncio.to_thread(give_up, row, e)
+                    else:
+                        # Hand the claim back, to be retried here or elsewhere
+                        # after a backoff rather than straight away.
+                        delay = retry_delay(attempts)
+                        notifier.add(row["message_id"], f"❌ Processing failed (attempt {attempts}), retrying in {delay:.0f}s: {e}")
+                        await asyncio.to_thread(release_email, row["message_id"], delay)
+                except Exception as release_error:
+                    # The lease still expires on its own.
+                    log.exception("❌ Could not release %s: %s", row["message_id"], release_error)
+            finally:
+                # Everything this email produced goes out as one notification.
+                notifier.flush(row["message_id"])
+                in_flight.discard(row["message_id"])
+                IN_FLIGHT.set(len(in_flight))
+                queue.task_done()
+                # A worker is free again and the thread's next email (if any) is
+                # now claimable, by this replica or another one. Our own
+                # dispatcher hears it through worker_free even without sockets.
+                worker_free.set()
+                wakeup.signal(wakeup.ORCHESTRATOR)
+
+
+async def heartbeat(in_flight):
+    # Keep the leases of the emails being worked on alive while slow LLM
+    # calls are still running.
+    while True:
+        await asyncio.sleep(LEASE_SECONDS / 3)
+        await asyncio.to_thread(renew_email_leases, list(in_flight))
 
-            (
-                _id,
-                message_id,
-                in_reply_to,
-                references,
-                thread_id,
-                direction,
-                from_email,
-                to_email,
-                subject,
-                body,
-                raw_headers,
-                received_at,
-                created_at,
-                processed,
-                processed_at,
-            ) = row
-
- # Fetch all messages in the current email's thread.
-            thread = fetch_thread(conn, thread_id)
- # Log thread and email details.
-            print("🧵 Thread:", thread_id)
-            print("📩 New email:", subject)
-            print("📚 Messages in thread:", len(thread))
-
-            # Build thread messages (simple for now)
-            # thread_messages = [row[9] for row in thread]  # body column
- # Construct a list of messages in the thread, formatted for agent processing.
-            thread_messages = [
-                {
-                    "role": "user" if row[5] == "incoming" else "assistant",
-                    "from": row[6],   # from_email
-                    "body": row[9],   # body
-                }
-                for row in thread
-            ]
-
-            # Check if the email is an outgoing system email.
-            if direction == "outgoing":
- # Create an 'ignore' decision for outgoing system emails.
-                decision = AgentDecision(
-                    action="ignore",
-                    intent=None,
-                    confidence=1.0,
-                    reason="Skipping processing of system-sent outgoing email."
-                )
-
-                push(f"Ignored outgoing system email: {subject} from {from_email}. Thread ID: {thread_id}. Message ID: {message_id}. Direction: {direction}. Received at: {received_at}. Body: {body[:100]}.")
-
-                persist_decision(
-                    message_id=message_id,
-                    thread_id=thread_id,
-                    decision=decision
-                )
-
-                mark_processed(conn, message_id)
-                print("🛑 Ignored outgoing system email\n")
-                continue
 
+async def dispatch(queue, in_flight):
+    # Only claim as many emails as there are idle workers, so the rest stay
+    # available to other orchestrator replicas.
+    free = ORCHESTRATOR_WORKERS - len(in_flight)
+    if free <= 0:
+        return 0
 
+    rows = await asyncio.to_thread(claim, free)
 
+    for row in rows:
+        in_flight.add(row["message_id"])
+        queue.put_nowait(row)
+    IN_FLIGHT.set(len(in_flight))
+    return len(rows)
 
-            decision = await run_main_agent(thread_messages)
-            
-            print(decision)
-
-            # Hard validation (non-negotiable)
-            assert isinstance(decision, AgentDecision)
-
-            persist_decision(
-                message_id=message_id,
-                thread_id=thread_id,
-                decision=decision
-            )
-
- # Log the agent's decision.
-            print("🤖 Agent decision persisted:")
-            print(decision.model_dump())
-
- # If the agent decides to auto-reply.
-            if decision.action == "auto_reply":
- # Run the reply agent to generate a draft.
-                draft = await run_reply_agent(thread_messages)
-                push(f"Draft generated for: {subject} from {from_email}. Thread ID: {thread_id}. Message ID: {message_id}.")
-                # persist_draft(
-                #     message_id=message_id,
-                #     thread_id=thread_id,
-                #     subject=draft.subject,
-                #     body=draft.body,
-                #     confidence=draft.confidence,
-                #     agent_name="ReplyAgent",
-                #     model="gpt-5-nano",
-                # )
- # Persist the generated draft.
-                draft_id = persist_draft(
-                                            message_id=message_id,
-                                            thread_id=thread_id,
-                                            subject=draft.subject,
-                                            body=draft.body,
-                                            confidence=draft.confidence,
-                                            agent_name="ReplyAgent",
-                                            model="gpt-5-nano",
-                                        )
- # Check if both decision and draft confidence meet the auto-approval thresholds.
-                if (
-                    decision.confidence is not None
-                    and draft.confidence is not None
-                    and decision.confidence >= AUTO_DECISION_THRESHOLD
-                    and draft.confidence >= AUTO_DRAFT_THRESHOLD
-                ):
-                    auto_approve_draft(conn, draft_id)
-                    push(f"Auto-approved draft: {subject} from {from_email}. Thread ID: {thread_id}. Message ID: {message_id}.")
-                    push(f"Draft body: {draft.body}")
-                    print(f"✅ Auto-approved draft {draft_id}") # Log auto-approval.
-                else:
-                    push(f"Draft pending human review: {subject} from {from_email}. Draft ID: {draft_id}. Thread ID: {thread_id}. Message ID: {message_id}. Body: {draft.body}")
-                    print(f"🕒 Draft {draft_id} pending human review") # Log pending review.
-
-                # print("📝 Draft reply persisted")
-            elif decision.action == "escalate":
-                push(f"Escalated!! Human Intervention Required: message_id={message_id}, thread_id={thread_id}, decision={decision.model_dump_json()}")
-                # Log escalation with details.
-            elif decision.action == "ignore":
-                push(f"Ignored: {subject} from {from_email}. Thread ID: {thread_id}")
-                # Log ignore with details.
-
- # Mark the current email as processed.
-            mark_processed(conn, message_id)
-            push("✅ Marked processed")
-            print("✅ Marked processed\n")
+
+async def main():
+    setup_logging()
+    metrics.start_http_server(METRICS_PORT)
+    init_db()
+    # Connect to the LLM API now, not while the first email waits.
+    await llm_client.warm()
+    log.info("🧠 Orchestrator %s started with %d workers", ORCHESTRATOR_ID, ORCHESTRATOR_WORKERS)
+
+    queue = asyncio.Queue()
+    in_flight = set()
+    worker_free = asyncio.Event()
+    listener = wakeup.Listener(wakeup.ORCHESTRATOR)
+    backoff = wakeup.Backoff(POLL_INTERVAL, POLL_MAX_INTERVAL)
+
+    tasks = [
+        asyncio.create_task(worker(f"worker-{i}", queue, in_flight, worker_free))
+        for i in range(ORCHESTRATOR_WORKERS)
+    ]
+    tasks.append(asyncio.create_task(heartbeat(in_flight)))
+
+    try:
+        # Main loop for the orchestrator to continuously dispatch emails.
+        while True:
+            worker_free.clear()
+            dispatched = await dispatch(queue, in_flight)
+            if dispatched:
+                backoff.reset()
+                continue
+            if len(in_flight) >= ORCHESTRATOR_WORKERS:
+                # Every worker is busy, so there was nothing to poll for; the
+                # backoff stays where it is.
+                await worker_free.wait()
+                continue
+            # Nothing new could be claimed: sleep until the worker inserts an
+            # email or a worker frees up, polling ever more slowly as a fallback.
+            timeout = backoff.next()
+            if COALESCE_DEBOUNCE_SECONDS:
+                # Don't oversleep a thread that is only waiting to settle.
+                settling = await asyncio.to_thread(settles_in)
+                if settling is not None:
+                    timeout = min(timeout, settling + 0.05)
+            if await listener.wait_async(timeout, worker_free):
+                backoff.reset()
+    finally:
+        for task in tasks:
+            task.cancel()
 
 # Entry point for the script.
 if __name__ == "__main__":
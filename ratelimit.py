@@ -0,0 +1,65 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """Thread-safe token bucket.
+
+    Allows `rate` operations per second on average with bursts of up to
+    `capacity`. `pause()` stops handing out tokens for a while, for when the
+    provider tells us to back off (HTTP 429 / Retry-After).
+    """
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated
+        self._updated = now
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+
+    def try_acquire(self, tokens: float = 1.0) -> float:
+        """Take `tokens` if available and return 0, else return the wait in seconds."""
+        with self._lock:
+            now = time.monotonic()
+            if now < self._paused_until:
+                return self._paused_until - now
+            self._refill(now)
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self.rate
+
+    def acquire(self, tokens: float = 1.0):
+        """Block until `tokens` are available."""
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    def adjust(self, tokens: float):
+        """Give back (positive) or charge (negative) `tokens` after the fact.
+
+        A charge may take the bucket below zero; later callers then wait for
+        it to refill.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now > self._updated:  # not while paused
+                self._refill(now)
+            self._tokens = min(self.capacity, self._tokens + tokens)
+
+    def pause(self, seconds: float):
+        """Hand out nothing for `seconds` and start again from an empty bucket."""
+        with self._lock:
+            until = time.monotonic() + seconds
+            if until > self._paused_until:
+                self._paused_until = until
+                self._tokens = 0.0
+                self._updated = until
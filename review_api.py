@@ -1,15 +1,42 @@
 from fastapi import FastAPI
+from fastapi.responses import Response
+import metrics
+from db.db import get_conn
 from db.drafts import (
+    count_outbox,
     fetch_pending_drafts,
     approve_draft,
     reject_draft,
     edit_and_approve_draft,
 )
+from db.events import count_unprocessed
 
 # Initialize FastAPI application with a title.
 app = FastAPI(title="Email Draft Review API")
 
 
+def _count_backlog():
+    with get_conn(readonly=True) as conn:
+        return count_unprocessed(conn)
+
+
+def _count_pending_review():
+    with get_conn(readonly=True) as conn:
+        return conn.execute(
+            "SELECT COUNT(*) FROM email_drafts WHERE status = 'pending'"
+        ).fetchone()[0]
+
+
+# Pipeline state that can be read from the database, for scraping the review
+# API alone; each service also serves its own metrics (see metrics.py).
+EMAIL_BACKLOG = metrics.Gauge("email_backlog", "Emails not processed yet (processed = 0).")
+EMAIL_BACKLOG.set_function(_count_backlog)
+OUTBOX = metrics.Gauge("outbox_drafts", "Drafts waiting in the outbox, by status.", ["status"])
+OUTBOX.set_function(lambda: {(status,): count for status, count in count_outbox().items()})
+PENDING_REVIEW = metrics.Gauge("drafts_pending_review", "Drafts waiting for a human decision.")
+PENDING_REVIEW.set_function(_count_pending_review)
+
+
 # Define a GET endpoint to list all pending email drafts.
 @app.get("/drafts/pending")
 def list_pending():
@@ -54,6 +81,11 @@ def edit(
     edit_and_approve_draft(draft_id, subject, body, reviewed_by)
     return {"status": "edited_and_approved"}
 
+# Define a GET endpoint exposing metrics in the Prometheus text format.
+@app.get("/metrics")
+def metrics_endpoint():
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 # Define a GET endpoint for health checking the API.
 @app.get("/")
 def health():
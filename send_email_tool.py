@@ -1,5 +1,5 @@
 import os
-import sendgrid
+import threading
 from sendgrid.helpers.mail import (
     Mail,
     Email,
@@ -8,9 +8,73 @@ from sendgrid.helpers.mail import (
     Header
 )
 from dotenv import load_dotenv
+import requests
+from requests.adapters import HTTPAdapter
 import uuid
 
+from ratelimit import TokenBucket
+
 load_dotenv(override=True)
+
+# Base URL of the SendGrid API; point it at a local mock for benchmarks.
+SENDGRID_API_HOST = os.environ.get("SENDGRID_API_HOST", "https://api.sendgrid.com")
+
+# How many sends may be in flight at once. Also sizes the connection pool.
+SENDER_CONCURRENCY = int(os.environ.get("SENDER_CONCURRENCY", "8"))
+
+# Provider quota: sustained sends per second and the allowed burst.
+SENDGRID_RATE_PER_SECOND = float(os.environ.get("SENDGRID_RATE_PER_SECOND", "50"))
+SENDGRID_BURST = float(os.environ.get("SENDGRID_BURST", str(SENDGRID_RATE_PER_SECOND)))
+
+# How often a send is retried in place after a 429 before giving up.
+SENDGRID_MAX_RETRIES = int(os.environ.get("SENDGRID_MAX_RETRIES", "3"))
+
+rate_limiter = TokenBucket(SENDGRID_RATE_PER_SECOND, SENDGRID_BURST)
+
+
+class SendError(Exception):
+    def __init__(self, status: int, body: str):
+        super().__init__(f"SendGrid returned {status}: {body[:200]}")
+        self.status = status
+
+    @property
+    def permanent(self) -> bool:
+        # Client errors won't succeed on retry, except timeouts and throttling.
+        return 400 <= self.status < 500 and self.status not in (408, 429)
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    # One keep-alive session per process. The SendGrid SDK client goes
+    # through urllib and opens a new TLS connection for every request.
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            session.headers.update({
+                "Authorization": f"Bearer {os.environ.get('SENDGRID_API_KEY')}",
+                "Content-Type": "application/json",
+            })
+            adapter = HTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=SENDER_CONCURRENCY,
+            )
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def _retry_after(response) -> float:
+    try:
+        return max(1.0, float(response.headers.get("Retry-After", "")))
+    except ValueError:
+        return 1.0
+
+
 # Function to send an email
 
 def generate_message_id(domain: str = "aiguru360.in") -> str:
@@ -22,12 +86,9 @@ def send_email(
     subject: str,
     body: str,
     in_reply_to: str | None,
-    references: list[str] | None
+    references: list[str] | None,
+    message_id: str | None = None,
 ):
-    sg = sendgrid.SendGridAPIClient(
-        api_key=os.environ.get("SENDGRID_API_KEY")
-    )
-
     mail = Mail(
         from_email=Email("support@aiguru360.in"),
         to_emails=To(to_email),
@@ -36,7 +97,8 @@ def send_email(
     )
 
     # ---- Threading headers ----
-    message_id = generate_message_id()
+    # Callers that may retry pass a stable Message-ID.
+    message_id = message_id or generate_message_id()
     mail.add_header(Header("Message-ID", message_id))
 
     if in_reply_to:
@@ -45,10 +107,21 @@ def send_email(
     if references:
         mail.add_header(Header("References", " ".join(references)))
 
-
-    response = sg.client.mail.send.post(
-        request_body=mail.get()
-    )
+    session = get_session()
+    for attempt in range(SENDGRID_MAX_RETRIES + 1):
+        rate_limiter.acquire()
+        response = session.post(
+            f"{SENDGRID_API_HOST}/v3/mail/send",
+            json=mail.get(),
+            timeout=30,
+        )
+        if response.status_code == 429 and attempt < SENDGRID_MAX_RETRIES:
+            # Over quota: stop every sender thread for the advertised time.
+            rate_limiter.pause(_retry_after(response))
+            continue
+        if response.status_code >= 300:
+            raise SendError(response.status_code, response.text)
+        break
 
     return {
         "status": "success",
@@ -1,183 +1,278 @@
 import time
-from db.drafts import fetch_approved_drafts
-from db.db_outgoing import persist_outgoing_email
-from send_email_tool import send_email
+from db.drafts import (
+    claim_sendable_drafts,
+    count_outbox,
+    mark_draft_sent,
+    record_send_failure,
+    renew_send_leases,
+    seconds_until_next_retry,
+)
+from db.events import fetch_received_at
+from db.db_outgoing import fetch_reply_contexts, persist_outgoing_email
+from send_email_tool import SENDER_CONCURRENCY, SendError, send_email
 from db.db import get_conn
 from datetime import datetime, timezone
 import json
+import logging
+import os
+import socket
+import threading
+import uuid
+import metrics
+import wakeup
+from logs import log_context, setup_logging
+from concurrent.futures import ThreadPoolExecutor
 
+log = logging.getLogger("sender")
 
-# Interval in seconds to poll for approved drafts.
+# Interval in seconds to poll for approved drafts. Approvals normally wake
+# the sender right away (see wakeup.py); polling is only the fallback and
+# backs off up to POLL_MAX_INTERVAL while idle.
 POLL_INTERVAL = 5
+POLL_MAX_INTERVAL = 60
 
-def get_last_message_ids(thread_id: str):
- # Connect to the database.
-    with get_conn() as conn:
-        row = conn.execute(
-            """
-            SELECT message_id, references_ids
-            FROM email_events
-            WHERE thread_id = ?
-              AND direction = 'incoming'
-            ORDER BY received_at DESC
-            LIMIT 1
-            """,
-            (thread_id,),
-        ).fetchone()
+# Identity used when claiming drafts, unique per sender replica and per
+# start: a restarted container keeps its hostname and PID, and must not pass
+# for the run that died and left leases behind.
+SENDER_ID = os.environ.get(
+    "SENDER_ID", f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+)
 
- # If no row is found, return None for message_id and an empty list for references.
-    if not row:
-        return None, []
+# Drafts claimed per poll, and how long a claimed draft is reserved for us.
+# The lease is renewed every SEND_LEASE_SECONDS / 3 while we are sending, so
+# a slow send (timeouts, Retry-After pauses) doesn't let another replica
+# claim the draft and send it a second time.
+SENDER_BATCH_SIZE = int(os.environ.get("SENDER_BATCH_SIZE", str(SENDER_CONCURRENCY * 4)))
+SEND_LEASE_SECONDS = int(os.environ.get("SEND_LEASE_SECONDS", "120"))
 
- # Extract message_id and references_ids, then parse references_ids from JSON.
-    message_id, refs = row
-    return message_id, json.loads(refs or "[]")
- 
+# Failed sends are retried with exponential backoff (base * 2^(attempt-1),
+# capped at max) and marked 'dead' after SEND_MAX_ATTEMPTS.
+SEND_MAX_ATTEMPTS = int(os.environ.get("SEND_MAX_ATTEMPTS", "6"))
+SEND_RETRY_BASE_SECONDS = float(os.environ.get("SEND_RETRY_BASE_SECONDS", "30"))
+SEND_RETRY_MAX_SECONDS = float(os.environ.get("SEND_RETRY_MAX_SECONDS", "3600"))
 
-def get_reply_to_email(thread_id: str) -> str:
-    with get_conn() as conn:
-        row = conn.execute(
-            """
-            SELECT from_email
-            FROM email_events
-            WHERE thread_id = ?
-              AND direction = 'incoming'
-            ORDER BY received_at DESC
-            LIMIT 1
-            """,
-            (thread_id,),
-        ).fetchone()
+# Once SendGrid has accepted an email it is never sent again; if recording
+# the send fails (say the database is locked), only the recording is retried,
+# every RECORD_RETRY_INTERVAL seconds at first, backing off to
+# RECORD_RETRY_MAX_INTERVAL. The draft's lease is renewed meanwhile.
+RECORD_RETRY_INTERVAL = 1
+RECORD_RETRY_MAX_INTERVAL = 30
+
+# Default port of this service's /metrics endpoint (METRICS_PORT overrides).
+METRICS_PORT = 9103
+
+OUTBOX = metrics.Gauge("outbox_drafts", "Drafts waiting in the outbox, by status.", ["status"])
+OUTBOX.set_function(lambda: {(status,): count for status, count in count_outbox().items()})
+SENDS = metrics.Counter("sends_total", "Send attempts, by result (sent, retry, dead, lease_lost).", ["result"])
+SEND_SECONDS = metrics.Histogram("send_seconds", "SendGrid API call latency, including rate-limit waits.")
+END_TO_END_SECONDS = metrics.Histogram(
+    "email_end_to_end_seconds", "Time from receiving an email to sending its reply."
+)
+
+
+class LeaseLost(Exception):
+    """Our send lease expired and another sender owns the draft now."""
+
+
+# Ids of the drafts this process has claimed and not finished yet; only
+# their leases are renewed.
+_in_flight = set()
+_in_flight_lock = threading.Lock()
+
+
+def send_draft(draft, context) -> bool:
+    try:
+        with log_context(thread_id=draft["thread_id"]):
+            return _send_draft(draft, context)
+    finally:
+        with _in_flight_lock:
+            _in_flight.discard(draft["id"])
 
- # Raise an error if no incoming sender is found for the thread.
-    if not row or not row[0]:
-        raise RuntimeError(f"No incoming sender found for thread {thread_id}")
 
-    return row[0]
+def _send_draft(draft, context) -> bool:
+    draft_id = draft["id"]
+    thread_id = draft["thread_id"]
+    subject = draft["subject"]
+    body = draft["body"]
+    try:
+        # Determine the recipient email for the reply.
+        if context is None or not context.to_email:
+            raise RuntimeError(f"No incoming sender found for thread {thread_id}")
+        to_email = context.to_email
 
-def get_reply_subject(thread_id: str) -> str:
+ # Send the email using the send_email tool.
+        with SEND_SECONDS.time():
+            result = send_email(
+                to_email=to_email,
+                subject=subject or context.subject,
+                body=body,
+                in_reply_to=context.in_reply_to,
+                references=context.references,
+                message_id=draft["outgoing_message_id"],
+            )
+        log.info("📨 Replying to %s", to_email)
+
+ # Handle exceptions during email sending.
+    except Exception as e:
+        status = record_send_failure(
+            draft_id,
+            SENDER_ID,
+            draft["send_attempts"],
+            str(e),
+            max_attempts=SEND_MAX_ATTEMPTS,
+            base_delay=SEND_RETRY_BASE_SECONDS,
+            max_delay=SEND_RETRY_MAX_SECONDS,
+            permanent=isinstance(e, SendError) and e.permanent,
+        )
+        if status is None:
+            SENDS.inc(result="lease_lost")
+            log.warning("⚠️ Failed to send draft %s, but another sender owns it now: %s", draft_id, e)
+            return False
+        SENDS.inc(result="dead" if status == "dead" else "retry")
+        if status == "dead":
+            log.error("💀 Giving up on draft %s after %d attempts: %s", draft_id, draft["send_attempts"], e)
+        else:
+            log.warning("❌ Failed to send draft %s (attempt %d), retry scheduled: %s", draft_id, draft["send_attempts"], e)
+        return False
+
+    # The email is out: from here on the draft must not go back to
+    # retry_scheduled, or the customer would get it twice.
+    delay = RECORD_RETRY_INTERVAL
+    while True:
+        try:
+            received_at = _record_sent(draft, context, to_email, result)
+            break
+        except LeaseLost as e:
+            SENDS.inc(result="lease_lost")
+            log.error("⚠️ %s after sending; leaving the draft to its new owner", e)
+            return False
+        except Exception as e:
+            log.error("⚠️ Sent draft %s but could not record it, retrying in %ds: %s", draft_id, delay, e)
+            time.sleep(delay)
+            delay = min(delay * 2, RECORD_RETRY_MAX_INTERVAL)
+
+    SENDS.inc(result="sent")
+    end_to_end = metrics.seconds_since(received_at)
+    if end_to_end is not None:
+        END_TO_END_SECONDS.observe(end_to_end)
+    log.info("✅ Sent draft %s", draft_id)
+    return True
+
+
+# Record a send in one transaction: the draft becomes 'sent', the
+# outgoing_emails row is written and the reply joins the thread as an
+# outgoing email event. Returns when the original email was received.
+def _record_sent(draft, context, to_email, result):
+    draft_id = draft["id"]
+    thread_id = draft["thread_id"]
+    subject = draft["subject"]
+    body = draft["body"]
     with get_conn() as conn:
-        row = conn.execute(
+        if not mark_draft_sent(conn, draft_id, SENDER_ID):
+            # Rolls the transaction back: no outgoing rows for a draft
+            # whose state belongs to another sender now.
+            raise LeaseLost(f"Lost the send lease on draft {draft_id}")
+        persist_outgoing_email(
+            draft_id=draft_id,
+            thread_id=thread_id,
+            to_email=to_email,
+            subject=subject,
+            body=body,
+            provider="sendgrid",
+            provider_message_id=result.get("provider_message_id"),
+            status="sent",
+            conn=conn,
+        )
+ # Insert the outgoing email as a new event in the email_events table.
+        conn.execute(
             """
-            SELECT subject
-            FROM email_events
-            WHERE thread_id = ?
-              AND direction = 'incoming'
-            ORDER BY received_at DESC
-            LIMIT 1
+            INSERT INTO email_events (
+                message_id,
+                in_reply_to,
+                references_ids,
+                thread_id,
+                direction,
+                from_email,
+                to_email,
+                subject,
+                body,
+                raw_headers,
+                received_at,
+                created_at,
+                processed
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1)
             """,
-            (thread_id,),
-        ).fetchone()
+            (
+                result["provider_message_id"],
+                context.in_reply_to,
+                json.dumps(context.references),
+                thread_id,
+                "outgoing",
+                "support@aiguru360.in",
+                to_email,
+                subject,
+                body,
+                None,
+                datetime.now(timezone.utc).isoformat(),
+                datetime.now(timezone.utc).isoformat(),
+            ),
+        )
+        return fetch_received_at(conn, draft["message_id"])
 
-    if not row or not row[0]:
-        return "Re: Your message"
 
- # Prepend "Re:" if the subject doesn't already start with it.
-    subj = row[0]
-    return subj if subj.lower().startswith("re:") else f"Re: {subj}"
+def renew_leases_forever():
+    # Keep the leases of the drafts we hold alive while slow sends are still
+    # running.
+    while True:
+        time.sleep(SEND_LEASE_SECONDS / 3)
+        with _in_flight_lock:
+            draft_ids = list(_in_flight)
+        try:
+            renew_send_leases(SENDER_ID, draft_ids, SEND_LEASE_SECONDS)
+        except Exception as e:
+            log.warning("⚠️ Failed to renew send leases: %s", e)
 
 
 def sender_loop():
-    print("📤 Sender loop started")
+    setup_logging()
+    metrics.start_http_server(METRICS_PORT)
+    log.info("📤 Sender loop started with %d concurrent sends", SENDER_CONCURRENCY)
+    listener = wakeup.Listener(wakeup.SENDER)
+    backoff = wakeup.Backoff(POLL_INTERVAL, POLL_MAX_INTERVAL)
+    # Sends are I/O bound; a small thread pool overlaps the HTTP round-trips
+    # while the shared rate limiter in send_email_tool keeps us within quota.
+    executor = ThreadPoolExecutor(
+        max_workers=SENDER_CONCURRENCY, thread_name_prefix="sender"
+    )
+    threading.Thread(target=renew_leases_forever, name="send-lease", daemon=True).start()
  # Loop indefinitely to continuously check for approved drafts.
     while True:
- # Fetch all approved drafts from the database.
-        drafts = fetch_approved_drafts()
- # Iterate through each approved draft.
-        for draft_id, thread_id, subject, body in drafts:
-            try:
- # Determine the recipient email for the reply.
-                to_email = get_reply_to_email(thread_id)
- # Get the last message ID and existing references for the thread to maintain conversation context.
-                last_msg_id, existing_refs = get_last_message_ids(thread_id)
- # Build the 'References' header for the outgoing email.
-                references = []
-                if existing_refs:
-                    references.extend(existing_refs)
-                if last_msg_id:
-                    references.append(last_msg_id)
- # Send the email using the send_email tool.
-                result = send_email(
-                    to_email=to_email,  # later derive dynamically
-                    subject=subject or get_reply_subject(thread_id),
-                    body=body,
-                    in_reply_to=last_msg_id,
-                    references=references,
-                )
- # Persist the record of the outgoing email in the database.
-                persist_outgoing_email(
-                    draft_id=draft_id,
-                    thread_id=thread_id,
-                    to_email=to_email,
-                    subject=subject,
-                    body=body,
-                    provider="sendgrid",
-                    provider_message_id=result.get("provider_message_id"),
-                    status="sent",
-                )
-                print(f"📨 Replying to {to_email} for thread {thread_id}")
- # Update the status of the draft to 'sent' and record the outgoing email as an event.
-                print(f"✅ Sent draft {draft_id}")
-                with get_conn() as conn:
-                    conn.execute(
-                        """
-                        UPDATE email_drafts
-                        SET status = 'sent'
-                        WHERE id = ?
-                        AND status = 'approved'
-                        """,
-                        (draft_id,)
-                    )
- # Insert the outgoing email as a new event in the email_events table.
-                    conn.execute(
-                        """
-                        INSERT INTO email_events (
-                            message_id,
-                            in_reply_to,
-                            references_ids,
-                            thread_id,
-                            direction,
-                            from_email,
-                            to_email,
-                            subject,
-                            body,
-                            raw_headers,
-                            received_at,
-                            created_at,
-                            processed
-                        )
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1)
-                        """,
-                        (
-                            result["provider_message_id"],
-                            last_msg_id,
-                            json.dumps(references),
-                            thread_id,
-                            "outgoing",
-                            "support@aiguru360.in",
-                            to_email,
-                            subject,
-                            body,
-                            None,
-                            datetime.now(timezone.utc).isoformat(),
-                            datetime.now(timezone.utc).isoformat(),
-                        ),
-                    )
-
- # Handle exceptions during email sending or persistence.
-
-            except Exception as e:
-                persist_outgoing_email(
-                    draft_id=draft_id,
-                    thread_id=thread_id,
-                    to_email="mohit@aiguru360.in",
-                    subject=subject,
-                    body=body,
-                    provider="sendgrid",
-                    provider_message_id=None,
-                    status="failed",
-                )
-                print(f"❌ Failed to send draft {draft_id}: {e}")
- # Wait for the specified poll interval before checking for new drafts again.
-        time.sleep(POLL_INTERVAL)
+ # Claim the drafts that are due to be sent.
+        drafts = claim_sendable_drafts(SENDER_ID, SENDER_BATCH_SIZE, SEND_LEASE_SECONDS)
+        with _in_flight_lock:
+            _in_flight.update(draft["id"] for draft in drafts)
+        # Reply headers for every thread in this batch, in one query.
+        contexts = fetch_reply_contexts(draft["thread_id"] for draft in drafts)
+        list(executor.map(
+            lambda draft: send_draft(draft, contexts.get(draft["thread_id"])),
+            drafts,
+        ))
+        # Drafts may have been approved while we were sending; look again
+        # straight away instead of sleeping. Failed drafts are scheduled in
+        # the future, so they are not picked up again right away.
+        if drafts:
+            backoff.reset()
+            continue
+        # Otherwise wait for an approval, polling ever more slowly as a
+        # fallback, but wake up in time for the next scheduled retry.
+        timeout = backoff.next()
+        retry_in = seconds_until_next_retry()
+        if retry_in is not None:
+            timeout = min(timeout, retry_in + 0.05)
+        if listener.wait(timeout):
+            backoff.reset()
+
+
 if __name__ == "__main__":
-    sender_loop()
\ No newline at end of file
+    sender_loop()
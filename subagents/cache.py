@@ -0,0 +1,180 @@
+"""Persistent, content-addressed cache of agent outputs.
+
+Entries are keyed on a hash of everything that determines an agent's answer
+(agent name, model, instructions, output type and the serialized input), so
+a re-run after a crash or an identical template email is served without an
+LLM call. Entries expire after LLM_CACHE_TTL_SECONDS and the table is kept
+to LLM_CACHE_MAX_ENTRIES by evicting the least recently used rows.
+
+Lookups only read. Hits are remembered in memory and written back
+(last_used_at, hits) in batches, by a background thread every
+LLM_CACHE_TOUCH_INTERVAL_SECONDS and by the next put(), so serving a hit
+never waits for the SQLite write lock on the orchestrator's event loop.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import metrics
+from db.db import get_conn
+
+LLM_CACHE_ENABLED = os.environ.get("LLM_CACHE_ENABLED", "1") == "1"
+LLM_CACHE_TTL_SECONDS = int(os.environ.get("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", "10000"))
+LLM_CACHE_TOUCH_INTERVAL_SECONDS = float(os.environ.get("LLM_CACHE_TOUCH_INTERVAL_SECONDS", "30"))
+
+log = logging.getLogger("cache")
+
+# key -> [last_used_at, hits] not yet written back.
+_touches = {}
+_touches_lock = threading.Lock()
+_flusher = None
+
+_stats = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(name: str, amount: int = 1):
+    with _stats_lock:
+        _stats[name] += amount
+
+
+def cache_stats() -> dict:
+    """Hit/miss counters since the process started."""
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+    return stats
+
+
+LLM_CACHE_EVENTS = metrics.Counter(
+    "llm_cache_events_total", "LLM cache lookups and maintenance (hits, misses, expired, evictions).", ["event"]
+)
+LLM_CACHE_EVENTS.set_function(lambda: {(event,): count for event, count in _stats.items()})
+
+
+def cache_key(agent, output_type, content: str) -> str:
+    material = json.dumps(
+        [agent.name, str(agent.model), agent.instructions, output_type.__name__, content],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def get(key: str, output_type):
+    """Return the cached output for `key`, or None on a miss."""
+    if not LLM_CACHE_ENABLED:
+        return None
+
+    now = datetime.now(timezone.utc)
+    with get_conn(readonly=True) as conn:
+        row = conn.execute(
+            "SELECT output, created_at FROM llm_cache WHERE key = ?",
+            (key,),
+        ).fetchone()
+    if row is None:
+        _count("misses")
+        return None
+
+    if datetime.fromisoformat(row["created_at"]) + timedelta(seconds=LLM_CACHE_TTL_SECONDS) < now:
+        # Left for LRU eviction, or overwritten when this key is stored again.
+        _count("expired")
+        _count("misses")
+        return None
+
+    _touch(key, now.isoformat())
+    _count("hits")
+    return output_type.model_validate_json(row["output"])
+
+
+def _touch(key: str, used_at: str):
+    global _flusher
+    with _touches_lock:
+        touch = _touches.setdefault(key, [used_at, 0])
+        touch[0] = used_at
+        touch[1] += 1
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_forever, name="llm-cache-touch", daemon=True)
+            _flusher.start()
+
+
+def _flush_touches(conn):
+    """Write the pending hits back, inside the caller's transaction."""
+    with _touches_lock:
+        touches = list(_touches.items())
+        _touches.clear()
+    try:
+        conn.executemany(
+            """
+            UPDATE llm_cache
+            SET last_used_at = MAX(last_used_at, ?),
+                hits = hits + ?
+            WHERE key = ?
+            """,
+            [(used_at, hits, key) for key, (used_at, hits) in touches],
+        )
+    except BaseException:
+        # Put them back for the next flush.
+        with _touches_lock:
+            for key, (used_at, hits) in touches:
+                touch = _touches.setdefault(key, [used_at, 0])
+                touch[0] = max(touch[0], used_at)
+                touch[1] += hits
+        raise
+
+
+def _flush_forever():
+    while True:
+        time.sleep(LLM_CACHE_TOUCH_INTERVAL_SECONDS)
+        if not _touches:
+            continue
+        try:
+            with get_conn() as conn:
+                _flush_touches(conn)
+        except sqlite3.Error as e:
+            # Best effort: only the LRU order and hit counts are behind.
+            log.warning("⚠️ Could not record cache hits: %s", e)
+
+
+def put(key: str, agent_name: str, output):
+    if not LLM_CACHE_ENABLED:
+        return
+
+    now = datetime.now(timezone.utc)
+    with get_conn() as conn:
+        # Pending hits first, so eviction sees the current LRU order.
+        _flush_touches(conn)
+        conn.execute(
+            """
+            INSERT OR REPLACE INTO llm_cache (
+                key,
+                agent_name,
+                output,
+                created_at,
+                last_used_at,
+                hits
+            ) VALUES (?, ?, ?, ?, ?, 0)
+            """,
+            (key, agent_name, output.model_dump_json(), now.isoformat(), now.isoformat()),
+        )
+        # Keep only the most recently used entries.
+        evicted = conn.execute(
+            """
+            DELETE FROM llm_cache
+            WHERE key IN (
+                SELECT key
+                FROM llm_cache
+                ORDER BY last_used_at DESC
+                LIMIT -1 OFFSET ?
+            )
+            """,
+            (LLM_CACHE_MAX_ENTRIES,),
+        ).rowcount
+    if evicted:
+        _count("evictions", evicted)
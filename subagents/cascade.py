@@ -0,0 +1,87 @@
+"""Run an agent on a cheap model first and a stronger one only when needed.
+
+    decide = Cascade(main_agent, AgentDecision, MAIN_AGENT_MODELS)
+    decision, model = await decide.run(content)
+
+Each tier is the agent with another model. An answer whose confidence is
+below CASCADE_MIN_CONFIDENCE (or missing) is re-run on the next tier; the
+last tier's answer is always taken. With a single model (the default) this
+is a plain agent call.
+
+Per tier, by agent and model: latency (cascade_tier_seconds), calls by
+result (cascade_tier_calls_total{result="accepted|escalated"}, so the
+escalation rate is escalated / all) and cost in USD (llm_cost_usd_total,
+from MODEL_PRICES).
+"""
+import json
+import logging
+import os
+import time
+
+from dotenv import load_dotenv
+
+import metrics
+from subagents.runner import run_agent_with_usage
+
+load_dotenv(override=True)
+
+log = logging.getLogger("cascade")
+
+
+def _models(name: str, default: str) -> list[str]:
+    return [m.strip() for m in os.environ.get(name, default).split(",") if m.strip()]
+
+
+# Cheapest first, e.g. "gpt-5-nano,gpt-5-mini".
+MAIN_AGENT_MODELS = _models("MAIN_AGENT_MODELS", "gpt-5-nano")
+REPLY_AGENT_MODELS = _models("REPLY_AGENT_MODELS", "gpt-5-nano")
+CASCADE_MIN_CONFIDENCE = float(os.environ.get("CASCADE_MIN_CONFIDENCE", "0.7"))
+
+# USD per million input / output tokens. Override or extend with
+# MODEL_PRICES='{"my-model": [0.1, 0.4]}'.
+MODEL_PRICES = {
+    "gpt-5-nano": (0.05, 0.40),
+    "gpt-5-mini": (0.25, 2.00),
+    "gpt-5": (1.25, 10.00),
+    **{model: tuple(price) for model, price in json.loads(os.environ.get("MODEL_PRICES", "{}")).items()},
+}
+
+TIER_SECONDS = metrics.Histogram("cascade_tier_seconds", "Latency of one cascade tier.", ["agent", "model"])
+TIER_CALLS = metrics.Counter(
+    "cascade_tier_calls_total",
+    "Cascade tier answers, accepted or escalated to the next tier.",
+    ["agent", "model", "result"],
+)
+COST = metrics.Counter("llm_cost_usd_total", "Estimated LLM spend in USD.", ["agent", "model"])
+
+
+def cost_usd(model: str, usage) -> float:
+    price = MODEL_PRICES.get(model)
+    if usage is None or price is None:
+        return 0.0
+    return (usage.input_tokens * price[0] + usage.output_tokens * price[1]) / 1_000_000
+
+
+class Cascade:
+    def __init__(self, agent, output_type, models: list[str], min_confidence: float = CASCADE_MIN_CONFIDENCE):
+        self.name = agent.name
+        self.output_type = output_type
+        self.min_confidence = min_confidence
+        # Same name and instructions, so metrics and the stubs see one agent.
+        self.tiers = [(model, agent.clone(model=model)) for model in models]
+
+    async def run(self, content: str):
+        """The first confident answer and the model that gave it."""
+        for i, (model, agent) in enumerate(self.tiers):
+            start = time.perf_counter()
+            output, usage = await run_agent_with_usage(agent, content, self.output_type)
+            TIER_SECONDS.observe(time.perf_counter() - start, agent=self.name, model=model)
+            COST.inc(cost_usd(model, usage), agent=self.name, model=model)
+
+            confidence = output.confidence
+            if i == len(self.tiers) - 1 or (confidence is not None and confidence >= self.min_confidence):
+                TIER_CALLS.inc(agent=self.name, model=model, result="accepted")
+                return output, model
+            TIER_CALLS.inc(agent=self.name, model=model, result="escalated")
+            log.info("⬆️ %s on %s not confident (%s), retrying on %s",
+                     self.name, model, confidence, self.tiers[i + 1][0])
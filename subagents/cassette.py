@@ -0,0 +1,147 @@
+"""Record and replay agent calls.
+
+With CASSETTE_MODE=record every Runner.run call is appended to
+CASSETTE_PATH (JSON lines): the agent, its input, the final output, how long
+the call took and the tokens it used. With CASSETTE_MODE=replay the recorded
+outputs are served instead of calling the model, after sleeping for the
+recorded latency times CASSETTE_LATENCY_SCALE (0 answers immediately), so
+the orchestrator can be load-tested offline at production-like timing and
+two versions of the pipeline can be compared on the same workload.
+
+Calls are matched on agent name, model, instructions, output type and input.
+Identical inputs recorded several times are replayed in recording order. An
+input that was never recorded raises CassetteMiss, or goes to the real model
+with CASSETTE_ON_MISS=live.
+
+Turn the LLM cache off (LLM_CACHE_ENABLED=0) while recording or replaying;
+cache hits never reach the runner.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from datetime import datetime, timezone
+from pathlib import Path
+from types import SimpleNamespace
+
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+
+CASSETTE_MODE = os.environ.get("CASSETTE_MODE", "off")
+CASSETTE_PATH = Path(os.environ.get("CASSETTE_PATH", Path(__file__).parent.parent / "cassettes" / "agents.jsonl"))
+CASSETTE_LATENCY_SCALE = float(os.environ.get("CASSETTE_LATENCY_SCALE", "1.0"))
+CASSETTE_ON_MISS = os.environ.get("CASSETTE_ON_MISS", "error")
+
+
+class CassetteMiss(LookupError):
+    pass
+
+
+def call_key(agent, input: str) -> str:
+    output_type = getattr(agent.output_type, "__name__", str(agent.output_type))
+    material = json.dumps(
+        [agent.name, str(agent.model), agent.instructions, output_type, input],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class ReplayedResult:
+    """Stands in for agents.RunResult with a recorded output."""
+
+    def __init__(self, entry: dict):
+        self.entry = entry
+        self.context_wrapper = SimpleNamespace(
+            usage=SimpleNamespace(
+                input_tokens=entry["input_tokens"],
+                output_tokens=entry["output_tokens"],
+            )
+        )
+
+    def final_output_as(self, cls):
+        return cls.model_validate_json(self.entry["output"])
+
+
+class CassetteRunner:
+    def __init__(self, inner, mode: str, path: Path, latency_scale: float = 1.0, on_miss: str = "error"):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown CASSETTE_MODE: {mode}")
+        self.inner = inner
+        self.mode = mode
+        self.path = Path(path)
+        self.latency_scale = latency_scale
+        self.on_miss = on_miss
+        self._lock = threading.Lock()
+        self._entries = defaultdict(deque)
+        self.stats = {"recorded": 0, "replayed": 0, "misses": 0}
+        if mode == "replay":
+            self._load()
+
+    def _load(self):
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._entries[entry["key"]].append(entry)
+
+    def _next(self, key: str) -> dict | None:
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                return None
+            # Cycle, so a workload can be replayed more often than recorded.
+            entry = entries.popleft()
+            entries.append(entry)
+            return entry
+
+    def _append(self, entry: dict):
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+            self.stats["recorded"] += 1
+
+    async def run(self, agent, input: str, **kwargs):
+        key = call_key(agent, input)
+        if self.mode == "replay":
+            entry = self._next(key)
+            if entry is not None:
+                if self.latency_scale:
+                    await asyncio.sleep(entry["latency"] * self.latency_scale)
+                with self._lock:
+                    self.stats["replayed"] += 1
+                return ReplayedResult(entry)
+            with self._lock:
+                self.stats["misses"] += 1
+            if self.on_miss != "live":
+                raise CassetteMiss(f"No recording of {agent.name} for this input ({key[:12]})")
+            return await self.inner.run(agent, input=input, **kwargs)
+
+        start = time.perf_counter()
+        result = await self.inner.run(agent, input=input, **kwargs)
+        latency = time.perf_counter() - start
+        usage = result.context_wrapper.usage
+        self._append({
+            "key": key,
+            "agent": agent.name,
+            "model": str(agent.model),
+            "input": input,
+            "output": result.final_output_as(agent.output_type).model_dump_json(),
+            "latency": latency,
+            "input_tokens": usage.input_tokens,
+            "output_tokens": usage.output_tokens,
+            "recorded_at": datetime.now(timezone.utc).isoformat(),
+        })
+        return result
+
+
+def wrap(runner):
+    """`runner`, behind a cassette if CASSETTE_MODE asks for one."""
+    if CASSETTE_MODE == "off":
+        return runner
+    return CassetteRunner(runner, CASSETTE_MODE, CASSETTE_PATH, CASSETTE_LATENCY_SCALE, CASSETTE_ON_MISS)
@@ -1,6 +1,8 @@
 from subagents.schemas import ClassificationResult
+from subagents.runner import run_agent
 from agents import Agent, Runner
 import asyncio
+import json
 from dotenv import load_dotenv
 
 load_dotenv(override=True)
@@ -17,8 +19,8 @@ classifier_agent = Agent(
 
 
 async def classify(thread_messages: list[str]) -> ClassificationResult:
-    result = await Runner.run(
+    return await run_agent(
         classifier_agent,
-        input={"thread_messages": thread_messages}
+        json.dumps({"thread_messages": thread_messages}, ensure_ascii=False),
+        ClassificationResult
     )
-    return result.final_output_as(ClassificationResult)
@@ -0,0 +1,189 @@
+"""One limiter for every LLM call in the process.
+
+Each call first waits for a free concurrency slot and for room in the
+request (LLM_RPM) and token (LLM_TPM) budgets; its token cost is estimated
+from the size of the input before the call and corrected with the real
+usage afterwards. The concurrency limit adapts (AIMD): it grows by one
+after a full window of fast, successful calls and halves on a 429 or when
+calls get slower than LLM_LATENCY_TARGET_SECONDS. A 429 also pauses the
+request budget for the Retry-After the API asked for.
+
+Budgets are per process; with several orchestrator replicas, divide the
+account quotas between them.
+"""
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+
+from dotenv import load_dotenv
+from openai import RateLimitError
+
+import metrics
+from ratelimit import TokenBucket
+
+load_dotenv(override=True)
+
+# Account quotas, per minute. 0 disables the budget.
+LLM_RPM = int(os.environ.get("LLM_RPM", "500"))
+LLM_TPM = int(os.environ.get("LLM_TPM", "200000"))
+
+LLM_MIN_CONCURRENCY = int(os.environ.get("LLM_MIN_CONCURRENCY", "1"))
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "32"))
+LLM_INITIAL_CONCURRENCY = int(os.environ.get("LLM_INITIAL_CONCURRENCY", "8"))
+LLM_LATENCY_TARGET_SECONDS = float(os.environ.get("LLM_LATENCY_TARGET_SECONDS", "30"))
+
+# Output tokens assumed per call until the real usage is known.
+LLM_OUTPUT_TOKENS_ESTIMATE = int(os.environ.get("LLM_OUTPUT_TOKENS_ESTIMATE", "500"))
+# Backoff after a 429 that did not say how long to wait.
+LLM_RATE_LIMIT_PAUSE_SECONDS = float(os.environ.get("LLM_RATE_LIMIT_PAUSE_SECONDS", "5"))
+
+QUEUE_WAIT = metrics.Histogram("llm_queue_wait_seconds", "Time LLM calls waited for the limiter.")
+CONCURRENCY_LIMIT = metrics.Gauge("llm_concurrency_limit", "Current adaptive limit on concurrent LLM calls.")
+IN_FLIGHT = metrics.Gauge("llm_in_flight", "LLM calls in flight.")
+RATE_LIMITED = metrics.Counter("llm_rate_limited_total", "LLM calls rejected with HTTP 429.")
+
+
+def estimate_tokens(content: str) -> int:
+    # ~4 characters per token for English text, plus the expected answer.
+    return len(content) // 4 + LLM_OUTPUT_TOKENS_ESTIMATE
+
+
+def _retry_after(error) -> float | None:
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+class Call:
+    """Handed to the caller for the duration of one limited call."""
+
+    def __init__(self, estimate: int):
+        self.estimate = estimate
+        self.tokens = None
+
+    def used(self, tokens: int):
+        self.tokens = tokens
+
+
+class Limiter:
+    def __init__(
+        self,
+        rpm: int,
+        tpm: int,
+        min_concurrency: int,
+        max_concurrency: int,
+        initial_concurrency: int,
+        latency_target: float,
+    ):
+        self.requests = TokenBucket(rpm / 60, rpm) if rpm else None
+        self.tokens = TokenBucket(tpm / 60, tpm) if tpm else None
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.limit = float(max(min_concurrency, min(initial_concurrency, max_concurrency)))
+        self.latency_target = latency_target
+        self.in_flight = 0
+        self._decreased_at = 0.0
+        self._changed = None
+        CONCURRENCY_LIMIT.set(int(self.limit))
+
+    def _condition(self) -> asyncio.Condition:
+        # Created on first use, inside the running event loop.
+        if self._changed is None:
+            self._changed = asyncio.Condition()
+        return self._changed
+
+    def _try_budgets(self, tokens: int) -> float:
+        """Take a request and `tokens` from the budgets, or return the wait."""
+        if self.tokens is not None:
+            wait = self.tokens.try_acquire(min(tokens, self.tokens.capacity))
+            if wait:
+                return wait
+        if self.requests is not None:
+            wait = self.requests.try_acquire()
+            if wait:
+                if self.tokens is not None:
+                    self.tokens.adjust(min(tokens, self.tokens.capacity))
+                return wait
+        return 0.0
+
+    async def acquire(self, tokens: int):
+        start = time.perf_counter()
+        changed = self._condition()
+        async with changed:
+            while True:
+                timeout = None
+                if self.in_flight < int(self.limit):
+                    timeout = self._try_budgets(tokens)
+                    if not timeout:
+                        break
+                # Woken early when a call finishes or the limit changes.
+                try:
+                    await asyncio.wait_for(changed.wait(), timeout)
+                except TimeoutError:
+                    pass
+            self.in_flight += 1
+            IN_FLIGHT.set(self.in_flight)
+        QUEUE_WAIT.observe(time.perf_counter() - start)
+
+    def _increase(self):
+        # Additive: +1 per `limit` successful calls.
+        self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+
+    def _decrease(self):
+        # Multiplicative, at most once per latency target, so the calls that
+        # were already in flight when things went wrong don't halve it again.
+        now = time.monotonic()
+        if now - self._decreased_at < self.latency_target:
+            return
+        self._decreased_at = now
+        self.limit = max(self.min_concurrency, self.limit / 2)
+
+    async def release(self, call: Call, latency: float, error: BaseException | None):
+        if self.tokens is not None and call.tokens is not None:
+            self.tokens.adjust(call.estimate - call.tokens)
+        if isinstance(error, RateLimitError):
+            RATE_LIMITED.inc()
+            if self.requests is not None:
+                self.requests.pause(_retry_after(error) or LLM_RATE_LIMIT_PAUSE_SECONDS)
+            self._decrease()
+        elif error is None:
+            if latency > self.latency_target:
+                self._decrease()
+            else:
+                self._increase()
+        CONCURRENCY_LIMIT.set(int(self.limit))
+
+        changed = self._condition()
+        async with changed:
+            self.in_flight -= 1
+            IN_FLIGHT.set(self.in_flight)
+            changed.notify_all()
+
+    @asynccontextmanager
+    async def limit_call(self, content: str):
+        """Wait for room for a call on `content`; report its usage with `call.used()`."""
+        call = Call(estimate_tokens(content))
+        await self.acquire(call.estimate)
+        start = time.perf_counter()
+        error = None
+        try:
+            yield call
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            await asyncio.shield(self.release(call, time.perf_counter() - start, error))
+
+
+limiter = Limiter(
+    LLM_RPM,
+    LLM_TPM,
+    LLM_MIN_CONCURRENCY,
+    LLM_MAX_CONCURRENCY,
+    LLM_INITIAL_CONCURRENCY,
+    LLM_LATENCY_TARGET_SECONDS,
+)
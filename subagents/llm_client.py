@@ -0,0 +1,65 @@
+"""The process-wide OpenAI client every agent runs on.
+
+One AsyncOpenAI client over one httpx connection pool, installed as the
+agents SDK default, so all agents share warm keep-alive connections instead
+of whatever the SDK would set up on its own. `warm()` opens the connections
+(DNS, TCP, TLS) before the first email needs them.
+"""
+import asyncio
+import logging
+import os
+
+import httpx
+from agents import set_default_openai_client
+from dotenv import load_dotenv
+from openai import AsyncOpenAI
+
+load_dotenv(override=True)
+
+log = logging.getLogger("llm_client")
+
+LLM_MAX_CONNECTIONS = int(os.environ.get("LLM_MAX_CONNECTIONS", "64"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get("LLM_MAX_KEEPALIVE_CONNECTIONS", "32"))
+LLM_KEEPALIVE_EXPIRY_SECONDS = float(os.environ.get("LLM_KEEPALIVE_EXPIRY_SECONDS", "120"))
+LLM_CONNECT_TIMEOUT_SECONDS = float(os.environ.get("LLM_CONNECT_TIMEOUT_SECONDS", "5"))
+LLM_TIMEOUT_SECONDS = float(os.environ.get("LLM_TIMEOUT_SECONDS", "120"))
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "2"))
+# Connections opened by warm(); enough for the first wave of workers.
+LLM_WARM_CONNECTIONS = int(os.environ.get("LLM_WARM_CONNECTIONS", "4"))
+
+
+def build_client() -> AsyncOpenAI:
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=LLM_KEEPALIVE_EXPIRY_SECONDS,
+        ),
+        timeout=httpx.Timeout(LLM_TIMEOUT_SECONDS, connect=LLM_CONNECT_TIMEOUT_SECONDS),
+    )
+    # API key and base URL come from OPENAI_API_KEY / OPENAI_BASE_URL.
+    return AsyncOpenAI(http_client=http_client, max_retries=LLM_MAX_RETRIES)
+
+
+# Without a key there is nothing to configure (benchmarks that stub the
+# runner); the SDK then fails on the first real call as it always did.
+client = build_client() if os.environ.get("OPENAI_API_KEY") else None
+if client is not None:
+    set_default_openai_client(client)
+
+
+async def warm():
+    """Open LLM_WARM_CONNECTIONS pooled connections to the API."""
+    if client is None or not LLM_WARM_CONNECTIONS:
+        return
+    # Listing models costs no tokens; concurrent requests each get their
+    # own connection, which then stays in the pool.
+    results = await asyncio.gather(
+        *(client.models.list() for _ in range(LLM_WARM_CONNECTIONS)),
+        return_exceptions=True,
+    )
+    failures = [r for r in results if isinstance(r, Exception)]
+    if failures:
+        log.warning("⚠️ LLM client warm-up failed: %s", failures[0])
+    else:
+        log.info("🔥 LLM client warm (%d connections to %s)", LLM_WARM_CONNECTIONS, client.base_url)
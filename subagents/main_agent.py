@@ -1,6 +1,7 @@
 from subagents.schemas import AgentDecision
 from subagents.classifier import classify
 from subagents.reply import DraftReply
+from subagents.cascade import MAIN_AGENT_MODELS, Cascade
 from agents import Agent, Runner
 import asyncio
 from dotenv import load_dotenv
@@ -44,13 +45,17 @@ model = "gpt-5-nano",
 output_type=AgentDecision
 )
 
+# Cheap model first; a stronger one only for decisions it isn't sure of.
+main_cascade = Cascade(main_agent, AgentDecision, MAIN_AGENT_MODELS)
+
 async def run_main_agent(thread_messages: list[str]) -> AgentDecision:
     payload = {
         "thread_messages": thread_messages
     }
 
     content = json.dumps(payload, ensure_ascii=False)
-    result = await Runner.run(main_agent, input=content)
+    decision, _model = await main_cascade.run(content)
+    return decision
     # classification = classify(thread_messages)
 
     # if classification.intent == "spam":
@@ -79,4 +84,3 @@ async def run_main_agent(thread_messages: list[str]) -> AgentDecision:
     #     reason="High confidence support request",
     #     reply_sent=False  # IMPORTANT: no side effects yet
     # )
-    return result.final_output_as(AgentDecision)
@@ -3,6 +3,7 @@ from agents import Agent, Runner
 import asyncio
 from dotenv import load_dotenv
 from subagents.schemas import DraftReply
+from subagents.cascade import REPLY_AGENT_MODELS, Cascade
 import json
 
 load_dotenv(override=True)
@@ -35,16 +36,15 @@ Return STRICT JSON matching this schema:
     output_type=DraftReply
 )
 
+# Cheap model first; a stronger one only for drafts it isn't sure of.
+reply_cascade = Cascade(reply_agent, DraftReply, REPLY_AGENT_MODELS)
 
-async def run_reply_agent(thread_messages: list[str]) -> DraftReply:
-    payload = {"thread_messages": thread_messages}
 
-    result = await Runner.run(
-        reply_agent,
-        input=json.dumps(payload, ensure_ascii=False)
-    )
+# Returns the draft and the model that wrote it.
+async def run_reply_agent(thread_messages: list[str]) -> tuple[DraftReply, str]:
+    payload = {"thread_messages": thread_messages}
 
-    draft = result.final_output
+    draft, model = await reply_cascade.run(json.dumps(payload, ensure_ascii=False))
     assert isinstance(draft, DraftReply)
 
-    return draft
\ No newline at end of file
+    return draft, model
\ No newline at end of file
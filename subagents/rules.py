@@ -0,0 +1,198 @@
+"""Zero-LLM fast path ahead of the main agent.
+
+Bounces, auto-replies, out-of-office notices, mailing-list traffic and
+no-reply senders are recognised reliably from their headers, sender and
+subject. A matching rule produces the AgentDecision directly, so these
+emails never reach the model.
+
+Rules are evaluated in order and the first match wins. Every condition of a
+rule must match; patterns are case-insensitive regular expressions searched
+in the value. Set FAST_PATH_RULES_FILE to a JSON list of rules shaped like
+DEFAULT_RULES to replace the defaults, or FAST_PATH_RULES_ENABLED=0 to turn
+the stage off.
+"""
+import json
+import os
+import re
+import threading
+from dataclasses import dataclass, field
+from email.utils import parseaddr
+
+import metrics
+from header_scan import decode_stored_headers, scan_headers
+from subagents.schemas import AgentDecision
+
+FAST_PATH_RULES_ENABLED = os.environ.get("FAST_PATH_RULES_ENABLED", "1") == "1"
+FAST_PATH_RULES_FILE = os.environ.get("FAST_PATH_RULES_FILE")
+
+DEFAULT_RULES = [
+    {
+        # Delivery failures of our own replies need a human to follow up.
+        "name": "bounce",
+        "action": "escalate",
+        "intent": "bounce",
+        "reason": "Delivery failure notice; an earlier reply may not have reached the customer.",
+        "from": r"^(mailer-daemon|postmaster)@",
+    },
+    {
+        "name": "null_return_path",
+        "action": "ignore",
+        "intent": "automated",
+        "reason": "Empty Return-Path (<>); automated notification.",
+        "headers": {"Return-Path": r"^\s*<>\s*$"},
+    },
+    {
+        # RFC 3834: anything other than "no" marks an automatic message.
+        "name": "auto_submitted",
+        "action": "ignore",
+        "intent": "auto_reply",
+        "reason": "Auto-Submitted header marks this as an automatic message.",
+        "headers": {"Auto-Submitted": r"^(?!\s*no\s*$)."},
+    },
+    {
+        "name": "autoreply_header",
+        "action": "ignore",
+        "intent": "auto_reply",
+        "reason": "X-Autoreply header marks this as an automatic reply.",
+        "headers": {"X-Autoreply": r"."},
+    },
+    {
+        "name": "bulk_precedence",
+        "action": "ignore",
+        "intent": "bulk",
+        "reason": "Precedence header marks this as bulk, list or auto-reply mail.",
+        "headers": {"Precedence": r"^\s*(bulk|junk|list|auto_reply)\s*$"},
+    },
+    {
+        "name": "mailing_list",
+        "action": "ignore",
+        "intent": "mailing_list",
+        "reason": "List-Id header marks this as mailing-list traffic.",
+        "headers": {"List-Id": r"."},
+    },
+    {
+        "name": "no_reply_sender",
+        "action": "ignore",
+        "intent": "automated",
+        "reason": "Sent from a no-reply address.",
+        "from": r"^(no-?reply|do-?not-?reply)([+.-][^@]*)?@",
+    },
+    {
+        "name": "out_of_office_subject",
+        "action": "ignore",
+        "intent": "auto_reply",
+        "reason": "Subject marks this as an out-of-office or automatic reply.",
+        "subject": r"^\s*(out of office|automatic reply|auto(matic)?[ -]?reply|auto:)",
+    },
+]
+
+
+@dataclass
+class Rule:
+    name: str
+    action: str
+    reason: str
+    intent: str | None = None
+    headers: dict[str, re.Pattern] = field(default_factory=dict)
+    sender: re.Pattern | None = None
+    subject: re.Pattern | None = None
+
+    @classmethod
+    def compile(cls, spec: dict) -> "Rule":
+        def pattern(value):
+            return re.compile(value, re.IGNORECASE) if value is not None else None
+
+        rule = cls(
+            name=spec["name"],
+            action=spec["action"],
+            reason=spec["reason"],
+            intent=spec.get("intent"),
+            headers={
+                name.lower(): pattern(value)
+                for name, value in spec.get("headers", {}).items()
+            },
+            sender=pattern(spec.get("from")),
+            subject=pattern(spec.get("subject")),
+        )
+        if rule.action not in ("ignore", "escalate"):
+            raise ValueError(f"Rule {rule.name}: action must be ignore or escalate")
+        if not (rule.headers or rule.sender or rule.subject):
+            raise ValueError(f"Rule {rule.name}: needs at least one condition")
+        return rule
+
+    def matches(self, headers: dict[str, str], sender: str, subject: str) -> bool:
+        for name, pattern in self.headers.items():
+            value = headers.get(name)
+            if value is None or not pattern.search(value):
+                return False
+        if self.sender and not self.sender.search(sender):
+            return False
+        if self.subject and not self.subject.search(subject):
+            return False
+        return True
+
+
+def load_rules() -> list[Rule]:
+    specs = DEFAULT_RULES
+    if FAST_PATH_RULES_FILE:
+        with open(FAST_PATH_RULES_FILE) as f:
+            specs = json.load(f)
+    return [Rule.compile(spec) for spec in specs]
+
+
+RULES = load_rules()
+
+_stats = {"evaluated": 0, "llm_calls_saved": 0}
+_matches = {}
+_stats_lock = threading.Lock()
+
+
+def rule_stats() -> dict:
+    """How many emails were evaluated, how many LLM calls the rules saved,
+    and the match count of every rule."""
+    with _stats_lock:
+        return {**_stats, "matches": dict(_matches)}
+
+
+FAST_PATH_EVALUATED = metrics.Counter("fast_path_evaluated_total", "Emails checked against the fast-path rules.")
+FAST_PATH_EVALUATED.set_function(lambda: _stats["evaluated"])
+FAST_PATH_MATCHES = metrics.Counter("fast_path_matches_total", "Emails decided by a fast-path rule, by rule.", ["rule"])
+FAST_PATH_MATCHES.set_function(lambda: {(name,): count for name, count in dict(_matches).items()})
+
+
+def header_names() -> frozenset[str]:
+    """Lowercased names of every header some rule looks at."""
+    return frozenset(name for rule in RULES for name in rule.headers)
+
+
+_RULE_HEADERS = header_names()
+
+
+def _headers_of(raw_headers) -> dict[str, str]:
+    return scan_headers(decode_stored_headers(raw_headers), _RULE_HEADERS)
+
+
+def evaluate(row) -> AgentDecision | None:
+    """Return a rule-based decision for an email row, or None to use the LLM."""
+    if not FAST_PATH_RULES_ENABLED or not RULES:
+        return None
+
+    headers = _headers_of(row["raw_headers"])
+    sender = parseaddr(row["from_email"] or "")[1]
+    subject = row["subject"] or ""
+
+    with _stats_lock:
+        _stats["evaluated"] += 1
+
+    for rule in RULES:
+        if rule.matches(headers, sender, subject):
+            with _stats_lock:
+                _stats["llm_calls_saved"] += 1
+                _matches[rule.name] = _matches.get(rule.name, 0) + 1
+            return AgentDecision(
+                action=rule.action,
+                intent=rule.intent,
+                confidence=1.0,
+                reason=f"Rule {rule.name}: {rule.reason}",
+            )
+    return None
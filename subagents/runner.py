@@ -0,0 +1,60 @@
+import time
+
+from agents import Runner
+
+import metrics
+from subagents import cache, cassette
+# Installs the shared OpenAI client as the SDK default for every agent.
+from subagents import llm_client  # noqa: F401
+from subagents.limiter import limiter
+
+# What actually runs the agents: the SDK runner, behind a record/replay
+# cassette when CASSETTE_MODE is set. The pipeline benchmark swaps in a
+# stand-in with set_runner(); anything with an async run(agent, input=...)
+# works.
+_runner = cassette.wrap(Runner)
+
+
+def set_runner(runner):
+    global _runner
+    _runner = runner
+
+
+AGENT_CALLS = metrics.Counter(
+    "agent_calls_total", "Agent calls, by agent and whether the LLM cache answered.", ["agent", "source"]
+)
+AGENT_SECONDS = metrics.Histogram("agent_run_seconds", "Latency of agent runs that reached the LLM.", ["agent"])
+AGENT_TOKENS = metrics.Histogram(
+    "agent_tokens", "Tokens per agent run, by direction.", ["agent", "kind"], buckets=metrics.TOKEN_BUCKETS
+)
+
+
+# Single entry point for every agent call. Serves repeated inputs from the
+# LLM cache and stores fresh results in it; calls that reach the LLM go
+# through the process-wide limiter (subagents/limiter.py).
+async def run_agent(agent, content: str, output_type):
+    output, _ = await run_agent_with_usage(agent, content, output_type)
+    return output
+
+
+# run_agent, also returning the token usage (None when the cache answered).
+async def run_agent_with_usage(agent, content: str, output_type):
+    key = cache.cache_key(agent, output_type, content)
+    cached = cache.get(key, output_type)
+    if cached is not None:
+        AGENT_CALLS.inc(agent=agent.name, source="cache")
+        return cached, None
+
+    async with limiter.limit_call(content) as call:
+        start = time.perf_counter()
+        result = await _runner.run(agent, input=content)
+        AGENT_SECONDS.observe(time.perf_counter() - start, agent=agent.name)
+        usage = result.context_wrapper.usage
+        call.used(usage.input_tokens + usage.output_tokens)
+    AGENT_CALLS.inc(agent=agent.name, source="llm")
+    AGENT_TOKENS.observe(usage.input_tokens, agent=agent.name, kind="input")
+    AGENT_TOKENS.observe(usage.output_tokens, agent=agent.name, kind="output")
+
+    output = result.final_output_as(output_type)
+    cache.put(key, agent.name, output)
+    return output, usage
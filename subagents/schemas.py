@@ -18,3 +18,8 @@ class DraftReply(BaseModel):
     subject: Optional[str]   # allow None → reuse original subject
     body: str                # plain text only for now
     confidence: float        # how confident the agent is in this draft
+
+
+class DecisionWithDraft(BaseModel):
+    decision: AgentDecision
+    draft: Optional[DraftReply] = Field(description="The reply draft. Only set when decision.action is auto_reply, otherwise null.")
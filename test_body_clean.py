@@ -0,0 +1,51 @@
+"""Regression cases for body_clean: what must go, and what must survive.
+
+    python -m unittest test_body_clean
+"""
+import unittest
+
+from body_clean import clean_body
+
+
+class CleanBodyTest(unittest.TestCase):
+    def test_strips_reply_header_and_quotes(self):
+        self.assertEqual(
+            clean_body("Thanks!\n\nOn Tue, 24 Feb 2026, <a@b.c> wrote:\n> Hi ..."),
+            "Thanks!",
+        )
+
+    def test_strips_wrapped_reply_header(self):
+        self.assertEqual(
+            clean_body("Thanks!\n\nOn Tue, 24 Feb 2026 at 10:00, John Smith <\njohn@x.com> wrote:\n> Hi"),
+            "Thanks!",
+        )
+
+    def test_keeps_sentence_starting_with_on_above_reply_header(self):
+        self.assertEqual(
+            clean_body(
+                "Hi,\nOn Monday I ordered a blue jacket.\nIt still has not arrived.\n"
+                "On Tue, 24 Feb 2026, Support <s@x.com> wrote:\n> Thanks"
+            ),
+            "Hi,\nOn Monday I ordered a blue jacket.\nIt still has not arrived.",
+        )
+
+    def test_strips_sign_off_with_signature(self):
+        self.assertEqual(
+            clean_body(
+                "Where is my order?\n\nBest regards,\nJane Doe\nHead of Ops, Acme Inc.\n"
+                "+1 (555) 123-4567\njane.doe@acme.com\nwww.acme.com"
+            ),
+            "Where is my order?",
+        )
+
+    def test_keeps_text_after_bare_thanks(self):
+        body = "Hi,\nThanks for the reply.\nThanks\nBut order 8812 never arrived, please refund it"
+        self.assertEqual(clean_body(body), body)
+
+    def test_keeps_text_after_bare_best(self):
+        body = "Hello team,\nBest\noffer you quoted was 40 EUR for the annual plan, can you confirm?"
+        self.assertEqual(clean_body(body), body)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,160 @@
+"""Host-local wakeups between the ingestion worker, orchestrator and sender.
+
+Every listening process binds a Unix datagram socket in
+`<db dir>/wakeup/<channel>/`. `signal(channel)` sends one byte to every socket
+in that directory, so all replicas of a service wake up at once. Sockets live
+next to the database because that directory is the volume all containers
+share.
+
+Wakeups are best effort: a lost datagram only means the receiver finds the
+work on its next fallback poll.
+"""
+import asyncio
+import atexit
+import logging
+import os
+import select
+import socket
+
+from db.db import DB_PATH
+
+log = logging.getLogger("wakeup")
+
+WAKEUP_DIR = DB_PATH.parent / "wakeup"
+
+ORCHESTRATOR = "orchestrator"
+SENDER = "sender"
+
+_HAS_UNIX_SOCKETS = hasattr(socket, "AF_UNIX")
+
+
+def signal(channel: str):
+    """Wake every process listening on `channel`."""
+    if not _HAS_UNIX_SOCKETS:
+        return
+    try:
+        targets = list((WAKEUP_DIR / channel).glob("*.sock"))
+    except OSError:
+        return
+    if not targets:
+        return
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+        sock.setblocking(False)
+        for path in targets:
+            try:
+                sock.sendto(b"\x01", str(path))
+            except BlockingIOError:
+                # The receiver already has unread wakeups queued.
+                pass
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Left behind by a process that died without cleaning up.
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+            except OSError:
+                pass
+
+
+class Listener:
+    """Receives wakeups for one channel; falls back to plain sleeping."""
+
+    def __init__(self, channel: str):
+        self.sock = None
+        self.path = None
+        if not _HAS_UNIX_SOCKETS:
+            return
+
+        directory = WAKEUP_DIR / channel
+        try:
+            directory.mkdir(parents=True, exist_ok=True)
+            self.path = directory / f"{socket.gethostname()}-{os.getpid()}.sock"
+            if self.path.exists():
+                self.path.unlink()
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            sock.bind(str(self.path))
+            sock.setblocking(False)
+        except OSError as e:
+            log.warning("⚠️ Wakeups disabled for %s, polling only: %s", channel, e)
+            self.path = None
+            return
+
+        self.sock = sock
+        atexit.register(self.close)
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+        if self.path is not None:
+            try:
+                self.path.unlink()
+            except OSError:
+                pass
+            self.path = None
+
+    def drain(self) -> int:
+        """Consume queued wakeups and return how many there were."""
+        count = 0
+        while self.sock is not None:
+            try:
+                self.sock.recv(64)
+            except (BlockingIOError, InterruptedError):
+                break
+            count += 1
+        return count
+
+    def wait(self, timeout: float) -> bool:
+        """Block until woken or `timeout` seconds pass. True if woken."""
+        if self.sock is None:
+            select.select([], [], [], timeout)
+            return False
+        if self.drain():
+            return True
+        select.select([self.sock], [], [], timeout)
+        return self.drain() > 0
+
+    async def wait_async(self, timeout: float, event: asyncio.Event | None = None) -> bool:
+        """Event-loop friendly version of `wait`.
+
+        Also wakes up when `event` is set, which other tasks of this process
+        can do without the socket (and when there is none).
+        """
+        if self.drain() or (event is not None and event.is_set()):
+            return True
+
+        loop = asyncio.get_running_loop()
+        ready = loop.create_future()
+        waiters = [ready]
+        fd = None
+        if self.sock is not None:
+            fd = self.sock.fileno()
+            loop.add_reader(fd, lambda: ready.done() or ready.set_result(None))
+        if event is not None:
+            waiters.append(asyncio.ensure_future(event.wait()))
+        try:
+            await asyncio.wait(waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            if fd is not None:
+                loop.remove_reader(fd)
+            for waiter in waiters:
+                waiter.cancel()
+        return self.drain() > 0 or (event is not None and event.is_set())
+
+
+class Backoff:
+    """Fallback poll interval that doubles while idle and resets on work."""
+
+    def __init__(self, minimum: float, maximum: float):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.current = minimum
+
+    def reset(self):
+        self.current = self.minimum
+
+    def next(self) -> float:
+        delay = self.current
+        self.current = min(self.current * 2, self.maximum)
+        return delay
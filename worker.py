@@ -1,195 +1,298 @@
-import re
-import uuid
+import os
+import queue
+import threading
 import json
+import logging
 import time
+from dataclasses import dataclass
 from google.cloud import pubsub_v1
 from db.db import init_db, get_conn
+from db.thread_index import ThreadIndex
 from sqlite3 import IntegrityError
 from datetime import datetime, timezone
-from email.parser import Parser
-from email.header import decode_header
+import metrics
+import wakeup
+from header_scan import STORED_HEADERS, headers_for_storage, threading_headers
+from body_clean import clean_body
+from subagents import rules
+from logs import log_context, setup_logging
+from dotenv import load_dotenv
 
+load_dotenv(override=True)
+
+log = logging.getLogger("worker")
 
 # Google Cloud Project ID and Pub/Sub subscription ID.
 PROJECT_ID = "ai-agents-483504"
 SUBSCRIPTION_ID = "email-ingestion-worker"
 
-# Initialize a Pub/Sub subscriber client.
-subscriber = pubsub_v1.SubscriberClient()
-# Construct the full subscription path.
-subscription_path = subscriber.subscription_path(
-    PROJECT_ID, SUBSCRIPTION_ID
+# Ingestion batching: emails are committed in batches of up to
+# INGEST_BATCH_SIZE, or whatever arrived within INGEST_BATCH_MAX_WAIT_MS.
+INGEST_BATCH_SIZE = int(os.environ.get("INGEST_BATCH_SIZE", "50"))
+INGEST_BATCH_MAX_WAIT_MS = float(os.environ.get("INGEST_BATCH_MAX_WAIT_MS", "50"))
+
+# Pub/Sub flow control: how many messages (and bytes) may be leased to us
+# but not yet acked. Should comfortably exceed INGEST_BATCH_SIZE.
+PUBSUB_MAX_MESSAGES = int(os.environ.get("PUBSUB_MAX_MESSAGES", "500"))
+PUBSUB_MAX_BYTES = int(os.environ.get("PUBSUB_MAX_BYTES", str(100 * 1024 * 1024)))
+
+# Store the body without quoted history and signature (body_clean.py) next to
+# the original; the orchestrator sends the cleaned one to the model.
+CLEAN_BODIES = os.environ.get("CLEAN_BODIES", "1") == "1"
+
+# Default port of this service's /metrics endpoint (METRICS_PORT overrides).
+METRICS_PORT = 9101
+
+# message_id -> thread_id, warmed at startup and updated after each commit.
+thread_index = ThreadIndex()
+
+# Headers kept when HEADER_STORAGE=minimal: what we and the fast path read.
+KEEP_HEADERS = STORED_HEADERS | rules.header_names()
+
+INGESTED = metrics.Counter(
+    "ingest_messages_total", "Pub/Sub messages handled, by result (stored, duplicate, failed).", ["result"]
+)
+INGEST_BATCH_SECONDS = metrics.Histogram("ingest_batch_seconds", "Time to store and commit one ingestion batch.")
+INGEST_BATCH_EMAILS = metrics.Histogram(
+    "ingest_batch_emails", "Emails per ingestion batch.", buckets=(1, 2, 5, 10, 25, 50, 100, 250)
+)
+THREAD_INDEX_LOOKUPS = metrics.Counter(
+    "thread_index_lookups_total", "Message-id lookups for thread resolution, by result.", ["result"]
 )
 
-def parse_headers(raw_headers):
-    parser = Parser()
-    msg = parser.parsestr(raw_headers)
-
-    print("HEADERS FOUND:")
-    for key in msg.keys():
-        print(f" - {key}")
-
-    print("References value:", msg.get("References"))
-    print("In-Reply-To value:", msg.get("In-Reply-To"))
-
-    in_reply_to = msg.get("In-Reply-To")
-    references = []
-    for header_value in msg.get_all("References", []):
-        # Split on whitespace
-        parts = header_value.strip().split()
-        references.extend(parts)
-    return in_reply_to, references
-
-def extract_in_reply_to(headers: str | None):
- # If no headers are provided, return None.
-    if not headers:
-        print("⚠️ No headers provided, skipping")
-        return None
- # Use regex to find the 'In-Reply-To' header and extract its value.
-    match = re.search(
-        r"In-Reply-To:\s*(<[^>]+>)",
-        headers,
-        re.IGNORECASE
-    )
-    return match.group(1) if match else None
-
-
-def extract_references(headers: str | None):
- # If no headers are provided, return an empty list.
-    if not headers:
-        print("⚠️ No headers provided, skipping")
-        return []
- # Use regex to find the 'References' header.
-    match = re.search(
-        r"References:\s*(.+)", # In Email Header Structure: Email headers are typically structured as one field per line.
-                               # This regex is designed to grab everything on the "References" line but ignore subsequent headers (like "Subject:" or "Date:")
-                               # that start on the next line.
-        headers,
-        re.IGNORECASE
-    )
-    if not match:
-        print("⚠️ No references provided, skipping")
-        return []
-    # split on whitespace, keep <...>
- # Extract all message IDs enclosed in angle brackets from the references string.
-    references = re.findall(r"<[^>]+>", match.group(1))
-    print("References found:", references)
-    return references
+
+def _thread_index_lookups():
+    stats = thread_index.stats()
+    return {("hit",): stats["hits"], ("miss",): stats["misses"]}
 
 
+THREAD_INDEX_LOOKUPS.set_function(_thread_index_lookups)
+
 def resolve_thread_id(conn, in_reply_to, references):
-    # 1️⃣ In-Reply-To (strongest signal)
- # If an 'In-Reply-To' header exists, try to find a matching thread_id in the database.
-    if in_reply_to:
-        row = conn.execute(
-            "SELECT thread_id FROM email_events WHERE message_id = ?",
-            (in_reply_to,)
-        ).fetchone()
-        if row:
-            return row[0] # Return the found thread_id.
-
-    # 2️⃣ References (fallback)
- # If 'In-Reply-To' didn't yield a thread, check 'References' IDs.
-    for ref in references:
-        row = conn.execute(
-            "SELECT thread_id FROM email_events WHERE message_id = ?",
-            (ref,)
-        ).fetchone()
-        if row:
-            return row[0]
-
-    # 3️⃣ New conversation
-    return str(uuid.uuid4())
+    # In-Reply-To is the strongest signal, then References in order; ids the
+    # index doesn't know are looked up in a single query. No match means a
+    # new conversation.
+    return thread_index.resolve(conn, in_reply_to, references)
+
+
+@dataclass
+class IngestItem:
+    message: pubsub_v1.subscriber.message.Message
+    message_id: str
+    in_reply_to: str | None
+    references: list[str]
+    raw_headers: str | bytes | None
+    body_clean: str | None
+    payload: dict
+
+
+class BatchWriter:
+    """Single writer thread that stores parsed emails in batches.
+
+    Pub/Sub callbacks only parse and enqueue. The writer commits up to
+    INGEST_BATCH_SIZE emails per transaction, or whatever arrived within
+    INGEST_BATCH_MAX_WAIT_MS of the first one, and acks the messages only once
+    their batch has committed. A duplicate message_id only skips its own row.
+    """
+
+    def __init__(self, batch_size: int, max_wait_ms: float):
+        self.batch_size = batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self.run, name="ingest-writer", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def submit(self, item: IngestItem):
+        self.queue.put(item)
+
+    def run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self.flush(batch)
+
+    def flush(self, batch: list[IngestItem]):
+        stored = []
+        duplicates = []
+        start = time.perf_counter()
+        try:
+            with get_conn() as conn:
+                for item in batch:
+                    # A savepoint per row, so a duplicate only undoes itself.
+                    conn.execute("SAVEPOINT ingest_row")
+                    try:
+                        thread_id = insert_email(conn, item)
+                    except IntegrityError:
+                        conn.execute("ROLLBACK TO ingest_row")
+                        duplicates.append(item)
+                    else:
+                        stored.append((item, thread_id))
+                    conn.execute("RELEASE ingest_row")
+        except Exception as e:
+            # Nothing was committed; let Pub/Sub redeliver the whole batch.
+            log.exception("❌ Error storing batch of %d: %s", len(batch), e)
+            INGESTED.inc(len(batch), result="failed")
+            for item in batch:
+                item.message.nack()
+            return
+
+        INGEST_BATCH_SECONDS.observe(time.perf_counter() - start)
+        INGEST_BATCH_EMAILS.observe(len(batch))
+        INGESTED.inc(len(stored), result="stored")
+        INGESTED.inc(len(duplicates), result="duplicate")
+
+        for item, thread_id in stored:
+            thread_index.put(item.message_id, thread_id)
+        log.info(
+            "💾 Committed batch: %d stored, %d duplicate(s), thread index hit rate %.0f%%",
+            len(stored), len(duplicates), thread_index.stats()["hit_rate"] * 100,
+            extra={"sample": True},
+        )
+
+        # Wake the orchestrator now that the emails are committed.
+        if stored:
+            wakeup.signal(wakeup.ORCHESTRATOR)
+
+        for item, thread_id in stored:
+            payload = item.payload
+ # Log the stored email details and acknowledge the message.
+            with log_context(message_id=item.message_id, thread_id=thread_id):
+                log.info(
+                    "📩 Stored email from %s to %s received at %s: %s",
+                    payload.get("from"), payload.get("to"),
+                    payload.get("received_at"), payload.get("subject"),
+                )
+            item.message.ack()
+
+        for item in duplicates:
+ # Duplicate message_id (already stored): acknowledge so it is not redelivered.
+            with log_context(message_id=item.message_id):
+                log.warning("⚠️ Duplicate email ignored", extra={"sample": True})
+            item.message.ack()
+
+
+def insert_email(conn, item: IngestItem) -> str:
+    payload = item.payload
+    thread_id = resolve_thread_id(conn, item.in_reply_to, item.references)
+
+    conn.execute("""
+        INSERT INTO email_events (
+            message_id,
+            in_reply_to,
+            references_ids,
+            thread_id,
+            direction,
+            from_email,
+            to_email,
+            subject,
+            body,
+            body_clean,
+            raw_headers,
+            received_at,
+            created_at
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, (
+        item.message_id,
+        item.in_reply_to,
+        json.dumps(item.references),
+        thread_id,
+        "incoming",
+        payload.get("from"),
+        payload.get("to"),
+        payload.get("subject"),
+        payload.get("text"),
+        item.body_clean,
+        item.raw_headers,
+        payload.get("received_at"),
+        datetime.now(timezone.utc).isoformat()
+    ))
+    return thread_id
+
+
+writer = BatchWriter(INGEST_BATCH_SIZE, INGEST_BATCH_MAX_WAIT_MS)
+
+INGEST_QUEUE = metrics.Gauge("ingest_queue_depth", "Parsed emails waiting for the batch writer.")
+INGEST_QUEUE.set_function(writer.queue.qsize)
 
 
 def callback(message: pubsub_v1.subscriber.message.Message):
+    message_id = None
     try:
         payload = json.loads(message.data.decode("utf-8"))
         message_id = payload.get("message_id")
         raw_headers = payload.get("raw_headers")
 
-        in_reply_to, references = parse_headers(raw_headers)
-        if not in_reply_to:
-            print("⚠️ No In-Reply-To found, fallback to extract_in_reply_to")
-            in_reply_to = extract_in_reply_to(raw_headers)
-        if not references:
-            print("⚠️ No References found, fallback to extract_references")
-            references = extract_references(raw_headers)
-
         if not message_id:
-            print("⚠️ Missing message_id, skipping")
+            log.warning("⚠️ Missing message_id, skipping")
             message.ack()
             return
-            
-
-        # in_reply_to = extract_in_reply_to(raw_headers)
-        # references = extract_references(raw_headers)
-
-        with get_conn() as conn:
-            thread_id = resolve_thread_id(conn, in_reply_to, references)
-
-            conn.execute("""
-                INSERT INTO email_events (
-                    message_id,
-                    in_reply_to,
-                    references_ids,
-                    thread_id,
-                    direction,
-                    from_email,
-                    to_email,
-                    subject,
-                    body,
-                    raw_headers,
-                    received_at,
-                    created_at
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                message_id,
-                in_reply_to,
-                json.dumps(references),
-                thread_id,
-                "incoming",
-                payload.get("from"),
-                payload.get("to"),
-                payload.get("subject"),
-                payload.get("text"),
-                raw_headers,
-                payload.get("received_at"),
-                datetime.now(timezone.utc).isoformat()
-            ))
 
- # Log the stored email details and acknowledge the message.
-        print("📩 Stored email:")
-        print("  Message-ID:", message_id)
-        print("  Thread-ID :", thread_id)
-        print("  From      :", payload.get("from"))
-        print("  To        :", payload.get("to"))
-        print("  Received at:", payload.get("received_at"))
-        print("  Subject   :", payload.get("subject"))
-        message.ack()
-
-    except IntegrityError:
- # If an IntegrityError occurs (e.g., duplicate message_id), ignore it and acknowledge the message.
-        print("⚠️ Duplicate email ignored:", message_id)
-        message.ack()
+        in_reply_to, references = threading_headers(raw_headers)
+
+        # Stored and acked by the batch writer.
+        writer.submit(IngestItem(
+            message=message,
+            message_id=message_id,
+            in_reply_to=in_reply_to,
+            references=references,
+            raw_headers=headers_for_storage(raw_headers, KEEP_HEADERS),
+            body_clean=clean_body(payload.get("text")) if CLEAN_BODIES else None,
+            payload=payload,
+        ))
 
     except Exception as e:
  # For any other exception, log the error but do NOT acknowledge the message, allowing it to be redelivered.
-        print("❌ Error:", e)
+        with log_context(message_id=message_id):
+            log.exception("❌ Error: %s", e)
         # do NOT ack
 
 
-def main():
+# Prepare everything `callback` needs. Split from main() so the pipeline
+# benchmark can feed callback() from a fake publisher.
+def start():
  # Initialize the database (create tables if they don't exist).
     init_db()
-    print("🗄️ SQLite initialized")
+    log.info("🗄️ SQLite initialized")
+
+    with get_conn(readonly=True) as conn:
+        warmed = thread_index.warm(conn)
+    log.info("🧵 Thread index warmed with %d message ids", warmed)
+
+    writer.start()
+
+
+def main():
+    setup_logging()
+    metrics.start_http_server(METRICS_PORT)
+    start()
+
+ # Initialize a Pub/Sub subscriber client and construct the full subscription path.
+    subscriber = pubsub_v1.SubscriberClient()
+    subscription_path = subscriber.subscription_path(
+        PROJECT_ID, SUBSCRIPTION_ID
+    )
 
  # Subscribe to the Pub/Sub topic and register the callback function.
     streaming_pull_future = subscriber.subscribe(
-        subscription_path, callback=callback
+        subscription_path,
+        callback=callback,
+        flow_control=pubsub_v1.types.FlowControl(
+            max_messages=PUBSUB_MAX_MESSAGES,
+            max_bytes=PUBSUB_MAX_BYTES,
+        ),
     )
 
-    print("🚀 Ingestion worker started. Waiting for messages...")
+    log.info("🚀 Ingestion worker started. Waiting for messages...")
 
  # Keep the main thread alive to listen for messages.
     try: